@@ -0,0 +1,416 @@
+"""
+DeepInsight 服务 API：以 HTTP 接口提供 取数 → 贡献度 → 新闻 → 研判 → 成本记录 全流程
+基于 Starlette 的异步服务，支持批量接口、基于分析缓存的 ETag 条件请求与并发上限
+
+用法：
+    python api_server.py --port 8000
+    uvicorn api_server:app --host 0.0.0.0 --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, List, Any, AsyncIterator, Union
+import logging
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from config import API_CONFIG, SERIES_CONFIG
+from database import (
+    init_database, get_favorites, get_today_cost, get_cost_history, get_cost_breakdown,
+    get_pool_stats, get_write_behind_stats, flush_writes
+)
+from batch_analyzer import AsyncAnalysisEngine
+from cache_manager import analysis_cache
+from deepseek_analyzer import close_clients, close_async_clients
+from quote_poller import get_poller, stop_pollers
+from nav_series import nav_series
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceBusy(Exception):
+    """等待研判名额超时"""
+
+
+def analysis_etag(analysis: Dict) -> str:
+    """
+    研判结果的 ETag：由基金代码与生成时间决定
+
+    缓存命中返回的是同一份分析（生成时间不变），ETag 随之不变；
+    重新分析后生成时间变化，ETag 随之变化。
+    """
+    raw = f"{analysis.get('fund_code', '')}:{analysis.get('analysis_time', '')}"
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否匹配（弱比较，支持多个值与 *）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+def _flag(request: Request, name: str, default: bool = False) -> bool:
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def _time_param(value: Optional[str]) -> Optional[Union[str, float]]:
+    """查询参数中的时间：Unix 时间戳或 ISO 字符串（ISO 格式在使用时校验）"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _error(status_code: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+
+async def _read_fund_codes(request: Request) -> Dict[str, Any]:
+    """
+    解析批量请求体 {"fund_codes": [...], ...}
+
+    Raises:
+        ValueError: 请求体不合法
+    """
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise ValueError("请求体不是合法的 JSON")
+    if not isinstance(body, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    codes = body.get("fund_codes")
+    if not isinstance(codes, list) or not codes or not all(isinstance(c, str) and c for c in codes):
+        raise ValueError("fund_codes 必须是非空的基金代码列表")
+    body["fund_codes"] = list(dict.fromkeys(codes))
+    return body
+
+
+@asynccontextmanager
+async def analysis_slot(request: Request) -> AsyncIterator[None]:
+    """占用一个研判名额，等待超过 queue_timeout 时抛出 ServiceBusy"""
+    state = request.app.state
+    try:
+        await asyncio.wait_for(state.slots.acquire(), API_CONFIG["queue_timeout"])
+    except asyncio.TimeoutError:
+        raise ServiceBusy()
+    state.in_flight += 1
+    try:
+        yield
+    finally:
+        state.in_flight -= 1
+        state.slots.release()
+
+
+async def service_busy(request: Request, exc: Exception) -> JSONResponse:
+    return _error(503, "服务繁忙，请稍后重试", {"Retry-After": str(max(1, math.ceil(API_CONFIG["queue_timeout"])))})
+
+
+# ==================== 接口 ====================
+
+async def health(request: Request) -> JSONResponse:
+    state = request.app.state
+    return JSONResponse({
+        "status": "ok",
+        "in_flight": state.in_flight,
+        "max_concurrent_requests": API_CONFIG["max_concurrent_requests"],
+        "pool": get_pool_stats(),
+        "write_behind": get_write_behind_stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "quotes": state.poller.stats(),
+    })
+
+
+async def favorites(request: Request) -> JSONResponse:
+    return JSONResponse(await asyncio.to_thread(get_favorites))
+
+
+async def fund_realtime(request: Request) -> JSONResponse:
+    code = request.path_params["code"]
+    provider = request.app.state.engine.provider
+    data = await asyncio.to_thread(provider.get_fund_realtime, code, _flag(request, "use_mock"))
+    if not data:
+        return _error(404, f"无法获取基金数据: {code}")
+    return JSONResponse(data)
+
+
+async def funds_realtime_batch(request: Request) -> JSONResponse:
+    """POST {"fund_codes": [...], "use_mock": false} -> {基金代码: 实时数据或 null}"""
+    try:
+        body = await _read_fund_codes(request)
+    except ValueError as e:
+        return _error(400, str(e))
+    if len(body["fund_codes"]) > API_CONFIG["max_batch_size"]:
+        return _error(413, f"单次最多 {API_CONFIG['max_batch_size']} 只基金")
+    provider = request.app.state.engine.provider
+    results = await asyncio.to_thread(
+        provider.get_funds_realtime, body["fund_codes"], bool(body.get("use_mock", False))
+    )
+    return JSONResponse(results)
+
+
+async def fund_holdings(request: Request) -> JSONResponse:
+    """重仓股及其对当日涨跌的贡献度"""
+    code = request.path_params["code"]
+    use_mock = _flag(request, "use_mock")
+    provider = request.app.state.engine.provider
+    fund_data = await asyncio.to_thread(provider.get_fund_realtime, code, use_mock)
+    if not fund_data:
+        return _error(404, f"无法获取基金数据: {code}")
+    holdings = await asyncio.to_thread(provider.get_fund_holdings, code, use_mock)
+    return JSONResponse({
+        "fund_code": code,
+        "daily_change_pct": fund_data.get("daily_change_pct", 0),
+        "holdings": provider.calculate_holding_contribution(fund_data, holdings),
+    })
+
+
+async def fund_analysis(request: Request) -> Response:
+    """
+    单只基金研判（缓存优先），返回 ETag
+
+    查询参数：
+        name: 基金名称（缺省使用行情数据中的名称）
+        use_cache / use_mock: 同 DeepSeekAnalyzer
+        cached_only: 只读取最近一次缓存的研判，不取数、不分析（无缓存时 404）
+
+    请求头 If-None-Match 与当前研判的 ETag 一致时返回 304。
+    """
+    code = request.path_params["code"]
+    if _flag(request, "cached_only"):
+        analysis = await asyncio.to_thread(analysis_cache.get, code, "movement_analysis")
+        if analysis is None:
+            return _error(404, f"暂无缓存研判: {code}")
+    else:
+        name = request.query_params.get("name")
+        async with analysis_slot(request):
+            results = request.app.state.engine.analyze_many(
+                [code],
+                {code: name} if name else None,
+                use_cache=_flag(request, "use_cache", default=True),
+                use_mock=_flag(request, "use_mock")
+            )
+            result = await results.__anext__()
+            await results.aclose()
+        if result["error"]:
+            return _error(502, result["error"])
+        analysis = result["analysis"]
+
+    etag = analysis_etag(analysis)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(analysis, headers=headers)
+
+
+async def analysis_batch(request: Request) -> Response:
+    """
+    批量研判
+
+    POST {"fund_codes": [...], "fund_names": {...}, "use_cache": true, "use_mock": false, "stream": false}
+
+    每条结果为 {"fund_code", "analysis", "error", "elapsed_ms", "etag"}，etag 可用于
+    之后对单只基金的条件请求。stream 为 true 时按完成顺序逐行输出 NDJSON。
+    整个批次占用一个研判名额，批次内并发由 batch_concurrency 限制。
+    """
+    try:
+        body = await _read_fund_codes(request)
+    except ValueError as e:
+        return _error(400, str(e))
+    if len(body["fund_codes"]) > API_CONFIG["max_batch_size"]:
+        return _error(413, f"单次最多 {API_CONFIG['max_batch_size']} 只基金")
+
+    engine: AsyncAnalysisEngine = request.app.state.engine
+    fund_names = body.get("fund_names") if isinstance(body.get("fund_names"), dict) else None
+
+    async def results() -> AsyncIterator[Dict]:
+        async with analysis_slot(request):
+            batch = engine.analyze_many(
+                body["fund_codes"],
+                fund_names,
+                use_cache=bool(body.get("use_cache", True)),
+                use_mock=bool(body.get("use_mock", False))
+            )
+            try:
+                async for result in batch:
+                    result["etag"] = analysis_etag(result["analysis"]) if result["analysis"] else None
+                    yield result
+            finally:
+                await batch.aclose()
+
+    if not body.get("stream"):
+        return JSONResponse([result async for result in results()])
+
+    async def ndjson() -> AsyncIterator[bytes]:
+        # 名额在开始输出后才占用，排队超时只能以一行错误告知
+        try:
+            async for result in results():
+                yield (json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8")
+        except ServiceBusy:
+            yield (json.dumps({"error": "服务繁忙，请稍后重试"}, ensure_ascii=False) + "\n").encode("utf-8")
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+async def fund_series(request: Request) -> JSONResponse:
+    """
+    日内 K 线（本地净值时间序列，不请求上游）
+
+    查询参数：
+        minutes: K 线周期（分钟），默认 SERIES_CONFIG["default_bar_minutes"]
+        start / end: ISO 时间或 Unix 时间戳，默认今日
+    """
+    code = request.path_params["code"]
+    params = request.query_params
+    try:
+        minutes = int(params.get("minutes", SERIES_CONFIG["default_bar_minutes"]))
+        start, end = _time_param(params.get("start")), _time_param(params.get("end"))
+        if minutes <= 0:
+            raise ValueError("minutes 必须为正整数")
+        bars = await asyncio.to_thread(nav_series.ohlc, code, minutes, start, end)
+        volatility = await asyncio.to_thread(nav_series.volatility, code, minutes, start, end)
+    except ValueError as e:
+        return _error(400, f"参数不合法: {e}")
+    return JSONResponse({"fund_code": code, "minutes": minutes, "bars": bars, "volatility": volatility})
+
+
+async def fund_daily(request: Request) -> JSONResponse:
+    """日线（已压缩的日线与日内点位即时聚合合并），查询参数 days 默认 30"""
+    code = request.path_params["code"]
+    try:
+        days = int(request.query_params.get("days", 30))
+    except ValueError:
+        return _error(400, "days 必须是整数")
+    return JSONResponse({"fund_code": code, "bars": await asyncio.to_thread(nav_series.daily, code, days)})
+
+
+async def quotes_stream(request: Request) -> Response:
+    """
+    行情推送（Server-Sent Events）
+
+    GET /quotes/stream?fund_codes=005827,513100&use_mock=false
+    首个事件为当前全部行情，之后只推送有变化的基金；无变化时定期发送注释行保活。
+    同一数据源的连接共享后台轮询器的同一次轮询结果。
+    """
+    codes = [code for code in request.query_params.get("fund_codes", "").split(",") if code]
+    if not codes:
+        return _error(400, "fund_codes 不能为空")
+    if len(codes) > API_CONFIG["max_batch_size"]:
+        return _error(413, f"单次最多 {API_CONFIG['max_batch_size']} 只基金")
+
+    poller = get_poller(use_mock=_flag(request, "use_mock"))
+    poller.start()
+    # 轮询线程发布更新时通过事件循环唤醒本连接，等待期间不占用线程池线程
+    loop = asyncio.get_running_loop()
+    updated = asyncio.Event()
+
+    def wake() -> None:
+        try:
+            loop.call_soon_threadsafe(updated.set)
+        except RuntimeError:
+            # 事件循环已关闭（服务退出中）
+            pass
+
+    subscription = poller.hub.subscribe(codes, on_update=wake)
+
+    def event(quotes: Dict[str, Dict]) -> bytes:
+        return f"data: {json.dumps(quotes, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            initial = await asyncio.to_thread(poller.ensure, codes)
+            # 取数时发布的变化已包含在首个事件中
+            initial.update(subscription.drain())
+            yield event(initial)
+            while not subscription.closed:
+                try:
+                    await asyncio.wait_for(updated.wait(), poller.interval)
+                except asyncio.TimeoutError:
+                    pass
+                # 先清除再取走：清除之后到达的更新会再次置位，不会丢失
+                updated.clear()
+                changes = subscription.drain()
+                yield event(changes) if changes else b": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def costs(request: Request) -> JSONResponse:
+    try:
+        days = int(request.query_params.get("days", 7))
+    except ValueError:
+        return _error(400, "days 必须是整数")
+    tokens, cost = await asyncio.to_thread(get_today_cost)
+    return JSONResponse({
+        "today": {"tokens": tokens, "cost": cost},
+        "history": await asyncio.to_thread(get_cost_history, days),
+        "breakdown": await asyncio.to_thread(get_cost_breakdown, days),
+    })
+
+
+# ==================== 应用 ====================
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    await asyncio.to_thread(init_database)
+    app.state.engine = AsyncAnalysisEngine(max_concurrency=API_CONFIG["batch_concurrency"])
+    app.state.slots = asyncio.Semaphore(API_CONFIG["max_concurrent_requests"])
+    app.state.in_flight = 0
+    app.state.poller = get_poller()
+    app.state.poller.start()
+    try:
+        yield
+    finally:
+        stop_pollers()
+        await close_async_clients()
+        await asyncio.to_thread(flush_writes)
+        close_clients()
+
+
+def create_app() -> Starlette:
+    routes: List[Route] = [
+        Route("/health", health),
+        Route("/favorites", favorites),
+        Route("/funds/realtime", funds_realtime_batch, methods=["POST"]),
+        Route("/funds/{code}", fund_realtime),
+        Route("/funds/{code}/holdings", fund_holdings),
+        Route("/funds/{code}/analysis", fund_analysis),
+        Route("/funds/{code}/series", fund_series),
+        Route("/funds/{code}/daily", fund_daily),
+        Route("/analysis/batch", analysis_batch, methods=["POST"]),
+        Route("/quotes/stream", quotes_stream),
+        Route("/costs", costs),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan, exception_handlers={ServiceBusy: service_busy})
+
+
+# 供 uvicorn api_server:app 使用
+app = create_app()
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="DeepInsight 服务 API")
+    parser.add_argument("--host", default=API_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=API_CONFIG["port"])
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,24 @@ Streamlit 前端应用
 """
 import streamlit as st
 import pandas as pd
-import json
-from datetime import datetime, timedelta
-import os
-import sys
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
 
 # 导入本地模块
+from config import UI_CACHE_CONFIG, QUOTE_CONFIG, SERIES_CONFIG
 from database import (
-    init_database, add_favorite, remove_favorite, get_favorites,
-    get_today_cost, get_cost_history
+    init_database, get_pool, add_favorite, remove_favorite, get_favorites,
+    get_today_cost, get_cost_history, get_cache_telemetry, flush_writes
 )
 from data_provider import FundDataProvider
 from deepseek_analyzer import DeepSeekAnalyzer
+from batch_analyzer import AsyncAnalysisEngine
+from prewarm import get_scheduler
+from quote_poller import get_poller
+from nav_series import nav_series
+from cache_manager import CacheManager
+from prompt_compiler import PromptBudgetExceeded
 
 # ==================== 页面配置 ====================
 st.set_page_config(
@@ -84,14 +90,63 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ==================== 初始化 ====================
-init_database()
+# ==================== 缓存层 ====================
+# 资源（数据库、数据源、分析器）每个进程只创建一次；页面数据按 TTL 缓存，
+# 点击任意控件触发的重跑不再重新取数
+
+@st.cache_resource
+def init_storage() -> None:
+    """建表/迁移并预建连接池（每个进程只执行一次）"""
+    init_database()
+    get_pool()
+
+
+@st.cache_resource
+def get_provider() -> FundDataProvider:
+    return FundDataProvider()
+
+
+@st.cache_resource
+def get_analyzer(api_key: str = "") -> DeepSeekAnalyzer:
+    """按 API Key 共享分析器（空字符串表示使用环境变量中的 Key）"""
+    return DeepSeekAnalyzer(api_key or None)
+
+
+@st.cache_resource
+def get_engine(api_key: str = "") -> AsyncAnalysisEngine:
+    """按 API Key 共享批量研判引擎（异步客户端与事件循环跨点击复用）"""
+    return AsyncAnalysisEngine(api_key=api_key or None)
+
+
+@st.cache_data(ttl=UI_CACHE_CONFIG["favorites_ttl"], show_spinner=False)
+def load_favorites() -> List[Dict]:
+    return get_favorites()
+
+
+@st.cache_data(ttl=UI_CACHE_CONFIG["holdings_ttl"], show_spinner=False)
+def load_holdings(fund_code: str, use_mock: bool) -> List[Dict]:
+    return get_provider().get_fund_holdings(fund_code, use_mock=use_mock)
 
-if "analyzer" not in st.session_state:
-    st.session_state.analyzer = DeepSeekAnalyzer()
 
-if "provider" not in st.session_state:
-    st.session_state.provider = FundDataProvider()
+@st.cache_data(ttl=UI_CACHE_CONFIG["news_ttl"], show_spinner=False)
+def load_news(keywords: str, hours: int = 12) -> List[Dict]:
+    return get_provider().get_industry_news(keywords=keywords, hours=hours)
+
+
+def invalidate_favorites() -> None:
+    """收藏增删后失效收藏列表缓存（行情订阅随收藏列表重建）"""
+    load_favorites.clear()
+
+
+def invalidate_market_data() -> None:
+    """手动刷新：清除持仓与新闻缓存（行情由轮询器立即重新获取）"""
+    load_holdings.clear()
+    load_news.clear()
+
+
+# ==================== 初始化 ====================
+init_storage()
+provider = get_provider()
 
 if "use_mock_data" not in st.session_state:
     st.session_state.use_mock_data = True
@@ -108,8 +163,9 @@ with st.sidebar:
         help="从 https://platform.deepseek.com 获取"
     )
     
+    # 相同 API Key 共用一个分析器（底层客户端与连接池由进程级注册表复用）
+    analyzer = get_analyzer(api_key)
     if api_key:
-        st.session_state.analyzer = DeepSeekAnalyzer(api_key)
         st.success("✅ API Key 已配置")
     
     # 数据源选择
@@ -119,6 +175,35 @@ with st.sidebar:
         value=True,
         help="勾选时使用模拟数据，取消时尝试调用 AkShare"
     )
+    refresh_quotes = st.button(
+        "🔄 刷新行情",
+        help=f"行情每 {QUOTE_CONFIG['poll_interval']:.0f} 秒自动推送更新，点击立即重新获取"
+    )
+    if refresh_quotes:
+        invalidate_market_data()
+    
+    # 后台预热：缓存过期前自动刷新收藏基金的研判
+    # 调度器按 (API Key, 数据源) 共享，会话只登记/注销自己，不会停掉其他会话的预热
+    session_id = st.session_state.setdefault("prewarm_owner", uuid.uuid4().hex)
+    scheduler = get_scheduler(
+        analyzer.api_key,
+        use_mock=st.session_state.use_mock_data
+    )
+    enabled = scheduler.enabled_by(session_id)
+    previous = st.session_state.get("prewarm_scheduler")
+    if previous is not None and previous is not scheduler:
+        # 切换数据源或 API Key 时把本会话的登记迁到新的调度器
+        enabled = enabled or previous.enabled_by(session_id)
+        previous.stop(session_id)
+    st.session_state.prewarm_scheduler = scheduler
+    if st.checkbox("后台预热研判", value=enabled, help="在缓存过期前自动刷新收藏基金的研判，高波动基金优先"):
+        scheduler.start(session_id)
+        prewarm_stats = scheduler.stats()
+        st.caption(
+            f"今日预热 Token: {prewarm_stats['tokens_spent_today']:,} / {prewarm_stats['daily_token_budget']:,}"
+        )
+    else:
+        scheduler.stop(session_id)
     
     st.markdown("---")
     st.markdown("### 📈 快速操作")
@@ -134,6 +219,7 @@ with st.sidebar:
         if st.button("添加收藏", key="add_fav"):
             if fund_code and fund_name:
                 if add_favorite(fund_code, fund_name):
+                    invalidate_favorites()
                     st.success(f"✅ 已添加 {fund_name}")
                     st.rerun()
                 else:
@@ -157,64 +243,118 @@ st.markdown("*由 DeepSeek-R1 驱动的专业基金研究仪表盘*")
 st.markdown("---")
 
 # 获取收藏基金
-favorites = get_favorites()
+favorites = load_favorites()
 
 if not favorites:
     # 初始化默认收藏
     add_favorite("005827", "易方达蓝筹精选")
     add_favorite("513100", "纳指 ETF")
+    invalidate_favorites()
     st.rerun()
 
 # ==================== 实时看板 ====================
 st.markdown("### 📊 实时看板")
 
-# 创建列布局
-cols = st.columns(len(favorites))
+# 订阅收藏基金行情：后台轮询器批量获取、比对快照后只推送有变化的基金，
+# 同一数据源的所有会话共享同一次轮询结果
+poller = get_poller(use_mock=st.session_state.use_mock_data)
+poller.start()
+fund_codes = [fav["code"] for fav in favorites]
+subscription = st.session_state.get("quote_subscription")
+if (
+    subscription is None
+    or subscription.closed
+    or subscription.fund_codes != frozenset(fund_codes)
+    or st.session_state.get("quote_use_mock") != st.session_state.use_mock_data
+):
+    if subscription is not None:
+        subscription.close()
+    subscription = poller.hub.subscribe(fund_codes)
+    st.session_state.quote_subscription = subscription
+    st.session_state.quote_use_mock = st.session_state.use_mock_data
+    st.session_state.quotes = poller.ensure(fund_codes)
+elif refresh_quotes:
+    poller.run_once(fund_codes)
+st.session_state.quotes.update(subscription.drain())
+fund_data_cache = st.session_state.quotes
 
-fund_data_cache = {}
 
-for idx, (col, fav) in enumerate(zip(cols, favorites)):
-    with col:
-        fund_code = fav["code"]
-        fund_name = fav["name"]
+@st.fragment(run_every=QUOTE_CONFIG["poll_interval"])
+def render_quote_cards(favorites: List[Dict]) -> None:
+    """行情卡片：按轮询周期局部刷新，只合并推送来的变化，不触发整页重跑"""
+    quotes = st.session_state.quotes
+    quotes.update(st.session_state.quote_subscription.drain())
+    
+    # 创建列布局
+    cols = st.columns(len(favorites))
+    
+    for col, fav in zip(cols, favorites):
+        with col:
+            render_quote_card(fav["code"], fav["name"], quotes.get(fav["code"]))
+
+
+def render_quote_card(fund_code: str, fund_name: str, fund_data: Optional[Dict]) -> None:
+    """单只基金的行情卡片与删除按钮"""
+    if not fund_data:
+        st.warning(f"⚠️ {fund_name}（{fund_code}）数据获取失败或超时")
+    
+    if fund_data:
+        # 确定颜色
+        change_pct = fund_data.get("daily_change_pct", 0)
+        if change_pct > 0:
+            color_class = "positive"
+            arrow = "📈"
+        elif change_pct < 0:
+            color_class = "negative"
+            arrow = "📉"
+        else:
+            color_class = "neutral"
+            arrow = "➡️"
         
-        # 获取基金数据
-        fund_data = st.session_state.provider.get_fund_realtime(
-            fund_code,
-            use_mock=st.session_state.use_mock_data
-        )
+        # 显示卡片
+        st.markdown(f"""
+        <div class="metric-card">
+            <h4>{fund_name}</h4>
+            <p style="font-size: 12px; color: #888;">{fund_code}</p>
+            <p style="font-size: 24px; font-weight: bold;">¥{fund_data.get('current_value', 0):.4f}</p>
+            <p class="{color_class}" style="font-size: 18px; font-weight: bold;">
+                {arrow} {change_pct:+.2f}%
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
         
-        if fund_data:
-            fund_data_cache[fund_code] = fund_data
-            
-            # 确定颜色
-            change_pct = fund_data.get("daily_change_pct", 0)
-            if change_pct > 0:
-                color_class = "positive"
-                arrow = "📈"
-            elif change_pct < 0:
-                color_class = "negative"
-                arrow = "📉"
-            else:
-                color_class = "neutral"
-                arrow = "➡️"
-            
-            # 显示卡片
-            st.markdown(f"""
-            <div class="metric-card">
-                <h4>{fund_name}</h4>
-                <p style="font-size: 12px; color: #888;">{fund_code}</p>
-                <p style="font-size: 24px; font-weight: bold;">¥{fund_data.get('current_value', 0):.4f}</p>
-                <p class="{color_class}" style="font-size: 18px; font-weight: bold;">
-                    {arrow} {change_pct:+.2f}%
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # 删除按钮
-            if st.button("🗑️ 删除", key=f"del_{fund_code}"):
-                remove_favorite(fund_code)
-                st.rerun()
+        # 删除按钮
+        if st.button("🗑️ 删除", key=f"del_{fund_code}"):
+            remove_favorite(fund_code)
+            invalidate_favorites()
+            st.rerun()
+
+
+render_quote_cards(favorites)
+
+# 批量研判：并发分析所有收藏基金，结果按完成顺序显示
+if st.button("⚡ 批量研判全部收藏", key="batch_analyze"):
+    engine = get_engine(analyzer.api_key or "")
+    fund_names = {fav["code"]: fav["name"] for fav in favorites}
+    progress = st.progress(0.0, text="🔄 正在并发研判...")
+    batch_rows = []
+    batch_table = st.empty()
+    
+    for done, result in enumerate(engine.iter_batch(
+        list(fund_names),
+        fund_names=fund_names,
+        use_mock=st.session_state.use_mock_data
+    ), start=1):
+        analysis = result["analysis"] or {}
+        batch_rows.append({
+            "基金": fund_names.get(result["fund_code"], result["fund_code"]),
+            "涨跌幅": analysis.get("daily_change_pct"),
+            "结论": result["error"] or analyzer.get_analysis_summary(analysis),
+            "Token": analysis.get("tokens_used", 0),
+            "耗时(s)": round(result["elapsed_ms"] / 1000, 1),
+        })
+        progress.progress(done / len(fund_names), text=f"已完成 {done}/{len(fund_names)}")
+        batch_table.dataframe(pd.DataFrame(batch_rows), use_container_width=True, hide_index=True)
 
 st.markdown("---")
 
@@ -239,21 +379,32 @@ if selected_fund and selected_fund in fund_data_cache:
         change = fund_data.get("daily_change_pct", 0)
         st.metric("日涨跌幅", f"{change:+.2f}%", delta=f"{change:+.2f}%")
     with col3:
-        st.metric("更新时间", datetime.now().strftime("%H:%M:%S"))
+        updated_at = fund_data.get("timestamp")
+        st.metric("更新时间", datetime.fromisoformat(updated_at).strftime("%H:%M:%S") if updated_at else "-")
+    
+    # 日内走势：读取本地净值时间序列（由行情推送记录），无需重新获取历史
+    st.markdown("#### 📈 日内走势")
+    bars = nav_series.ohlc(selected_fund)
+    if bars:
+        df_bars = pd.DataFrame(bars)
+        df_bars["time"] = pd.to_datetime(df_bars["time"])
+        st.line_chart(df_bars.set_index("time")["close"], height=220)
+        volatility = nav_series.volatility(selected_fund)
+        if volatility is not None:
+            st.caption(f"{SERIES_CONFIG['default_bar_minutes']} 分钟波动率 {volatility:.3f}%")
+    else:
+        st.caption("暂无日内数据（行情推送开始后自动记录）")
     
     st.markdown("---")
     
     # 持仓贡献分析
     st.markdown("#### 📍 重仓股贡献度")
     
-    holdings = st.session_state.provider.get_fund_holdings(
-        selected_fund,
-        use_mock=st.session_state.use_mock_data
-    )
+    holdings = load_holdings(selected_fund, st.session_state.use_mock_data)
     
     if holdings:
         # 计算贡献度
-        contributions = st.session_state.provider.calculate_holding_contribution(
+        contributions = provider.calculate_holding_contribution(
             fund_data, holdings
         )
         
@@ -267,56 +418,76 @@ if selected_fund and selected_fund in fund_data_cache:
     
     st.markdown("---")
     
+    # 相关新闻：研判与新闻列表共用一次获取结果
+    news = load_news(fund_name, hours=12)
+    
     # 深度分析触发
     st.markdown("#### 🤖 DeepSeek-R1 深度研判")
     
     if st.button("🚀 更新研判", key=f"analyze_{selected_fund}"):
         with st.spinner("🔄 正在调用 DeepSeek-R1 进行深度分析..."):
-            # 获取新闻
-            news = st.session_state.provider.get_industry_news(
-                keywords=fund_name,
-                hours=12
-            )
+            # 流式输出占位区
+            with st.expander("💭 思考过程（CoT）", expanded=True):
+                thinking_placeholder = st.empty()
+            result_placeholder = st.empty()
             
-            # 执行分析
-            analysis = st.session_state.analyzer.analyze_fund_movement(
-                fund_code=selected_fund,
-                fund_name=fund_name,
-                daily_change_pct=fund_data.get("daily_change_pct", 0),
-                holdings_contribution=contributions if holdings else [],
-                news_items=news,
-                use_cache=True,
-                use_mock=st.session_state.use_mock_data
-            )
+            # 执行分析（流式渲染思考过程与分析结果）
+            thinking_text = ""
+            result_text = ""
+            analysis = {}
+            try:
+                for event, payload in analyzer.stream_fund_movement(
+                    fund_code=selected_fund,
+                    fund_name=fund_name,
+                    daily_change_pct=fund_data.get("daily_change_pct", 0),
+                    holdings_contribution=contributions if holdings else [],
+                    news_items=news,
+                    use_cache=True,
+                    use_mock=st.session_state.use_mock_data
+                ):
+                    if event == "reasoning":
+                        thinking_text += payload
+                        thinking_placeholder.markdown(thinking_text)
+                    elif event == "content":
+                        result_text += payload
+                        result_placeholder.markdown("#### 📋 分析结果\n\n" + result_text)
+                    elif event == "done":
+                        analysis = payload or {}
+            except PromptBudgetExceeded as e:
+                st.error(f"❌ Prompt 超出 Token 预算，未调用 DeepSeek：{e}")
             
             # 显示思考过程
             if analysis.get("thinking_process"):
-                with st.expander("💭 思考过程（CoT）", expanded=False):
-                    st.markdown(analysis["thinking_process"])
+                thinking_placeholder.markdown(analysis["thinking_process"])
             
             # 显示分析结果
             if analysis.get("analysis_result"):
-                st.markdown("#### 📋 分析结果")
-                st.markdown(analysis["analysis_result"])
+                result_placeholder.markdown("#### 📋 分析结果\n\n" + analysis["analysis_result"])
             elif analysis.get("assessment"):
-                st.markdown("#### 📋 分析结果")
-                st.markdown(analysis["assessment"])
+                result_placeholder.markdown("#### 📋 分析结果\n\n" + analysis["assessment"])
             
             # 显示成本信息
             if analysis.get("tokens_used", 0) > 0:
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("Token 消耗", f"{analysis['tokens_used']}")
+                    st.metric(
+                        "Token 消耗", f"{analysis['tokens_used']}",
+                        help=f"输入中命中上下文缓存 {analysis.get('cached_tokens', 0)} Token"
+                    )
                 with col2:
                     st.metric("估算费用", f"¥{analysis.get('estimated_cost', 0):.4f}")
                 with col3:
                     st.metric("数据来源", "DeepSeek-R1" if not analysis.get("is_mock") else "模拟")
-    
+                
+                if analysis.get("ttft_ms") is not None:
+                    st.caption(
+                        f"⏱️ 首 Token {analysis['ttft_ms'] / 1000:.1f}s · "
+                        f"总耗时 {analysis.get('latency_ms', 0) / 1000:.1f}s"
+                    )
     st.markdown("---")
     
     # 相关新闻
     st.markdown("#### 📰 相关新闻")
-    news = st.session_state.provider.get_industry_news(fund_name, hours=12)
     
     for news_item in news:
         with st.expander(f"📌 {news_item['title']}"):
@@ -329,7 +500,8 @@ st.markdown("---")
 # ==================== 成本统计看板 ====================
 st.markdown("### 💰 成本统计看板")
 
-# 获取今日成本
+# 获取今日成本（先等待后台写入落盘，保证包含本次分析）
+flush_writes()
 today_tokens, today_cost = get_today_cost()
 
 col1, col2, col3 = st.columns(3)
@@ -393,6 +565,28 @@ if history:
         )
         st.markdown("**费用趋势（RMB）**")
 
+# 缓存效率（实测命中率与节省）
+st.markdown("#### 🗄️ 7 日缓存效率")
+
+savings = CacheManager.measure_token_savings(days=7)
+if savings["lookups"]:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("缓存命中率", f"{savings['cache_hit_rate']:.1%}",
+                help=f"命中 {savings['hits']} / 未命中 {savings['misses']} / 跳过 {savings['bypasses']}（另有预热刷新 {savings['prewarms']} 次，不计入命中率）")
+    col2.metric("节省 Token", f"{savings['saved_tokens']:,}")
+    col3.metric("节省费用", f"¥{savings['saved_cost']:.4f}")
+    col4.metric("节省等待", f"{savings['saved_latency_ms'] / 1000:.1f} 秒")
+    
+    telemetry = get_cache_telemetry(days=7, group_by="fund")
+    if telemetry:
+        df_telemetry = pd.DataFrame(telemetry)[
+            ["fund_code", "analysis_type", "hits", "misses", "bypasses", "hit_rate", "tokens_avoided", "cost_avoided"]
+        ]
+        df_telemetry.columns = ["基金代码", "分析类型", "命中", "未命中", "跳过", "命中率", "节省 Token", "节省费用"]
+        st.dataframe(df_telemetry, use_container_width=True, hide_index=True)
+else:
+    st.info("暂无缓存查找记录")
+
 st.markdown("---")
 
 # ==================== 页脚 ====================
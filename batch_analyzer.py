@@ -0,0 +1,310 @@
+"""
+批量研判引擎：基于 AsyncOpenAI 并发分析多只基金
+支持并发上限、请求数/Token 数限流、指数退避重试
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, List, Iterable, Iterator, AsyncIterator, Deque, Tuple, TYPE_CHECKING
+import logging
+
+from database import get_favorites
+from data_provider import FundDataProvider
+from deepseek_analyzer import DeepSeekAnalyzer, get_async_client
+from prompt_compiler import PromptBudgetExceeded
+from cache_manager import CacheManager, single_flight
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+def retryable_errors() -> Tuple[type, ...]:
+    """可重试的 API 异常（延迟导入 openai，导入本模块时不加载 SDK）"""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    进程级后台事件循环（守护线程）
+    
+    同步调用方（Streamlit）的批量研判都提交到这里执行，AsyncOpenAI 客户端及其
+    连接池在多次点击之间复用，不必每次新建事件循环。
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="batch-analyzer-loop", daemon=True).start()
+        return _loop
+
+
+class RateLimiter:
+    """滑动窗口限流器：同时限制每分钟请求数与 Token 数"""
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._events: Deque[List] = deque()     # [时间戳, token 数]
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._events and now - self._events[0][0] >= self.WINDOW_SECONDS:
+            self._events.popleft()
+
+    async def acquire(self, tokens: int) -> List:
+        """等待配额，返回本次占用记录（可用 settle 修正实际 Token 数）"""
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                used_tokens = sum(event[1] for event in self._events)
+                if (len(self._events) < self.requests_per_minute
+                        and used_tokens + tokens <= self.tokens_per_minute):
+                    event = [now, tokens]
+                    self._events.append(event)
+                    return event
+                # 等到最早的一条记录滑出窗口
+                wait = self.WINDOW_SECONDS - (now - self._events[0][0])
+                await asyncio.sleep(max(wait, 0.01))
+
+    def settle(self, event: List, actual_tokens: int) -> None:
+        """用实际消耗修正预估 Token 数"""
+        event[1] = actual_tokens
+
+
+class AsyncAnalysisEngine:
+    """异步批量分析引擎"""
+
+    # 默认并发与限流配置
+    MAX_CONCURRENCY = 5
+    REQUESTS_PER_MINUTE = 60
+    TOKENS_PER_MINUTE = 300_000
+    MAX_RETRIES = 3
+    BACKOFF_BASE_SECONDS = 1.0
+    EXPECTED_OUTPUT_TOKENS = 3000       # 预估输出 Token，用于限流预占
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        requests_per_minute: int = REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = TOKENS_PER_MINUTE,
+        max_retries: int = MAX_RETRIES
+    ):
+        self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
+        self.analyzer = DeepSeekAnalyzer(self.api_key)
+        self.provider = FundDataProvider()
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+
+    @property
+    def client(self) -> Optional["AsyncOpenAI"]:
+        """当前事件循环共享的 AsyncOpenAI 客户端（未配置 API Key 时为 None）"""
+        return get_async_client(self.api_key) if self.api_key else None
+
+    async def analyze_many(
+        self,
+        fund_codes: Iterable[str],
+        fund_names: Optional[Dict[str, str]] = None,
+        use_cache: bool = True,
+        use_mock: bool = False
+    ) -> AsyncIterator[Dict]:
+        """
+        并发分析多只基金，按完成顺序产出结果
+
+        Args:
+            fund_codes: 基金代码列表
+            fund_names: 基金代码到名称的映射（缺省时使用行情数据中的名称）
+            use_cache: 是否使用缓存
+            use_mock: 是否使用模拟数据
+
+        Yields:
+            {"fund_code", "analysis", "error", "elapsed_ms"}
+        """
+        fund_names = fund_names or {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+
+        async def run(code: str) -> Dict:
+            start = time.perf_counter()
+            async with semaphore:
+                try:
+                    analysis = await self._analyze_one(
+                        code, fund_names.get(code), limiter, use_cache, use_mock
+                    )
+                    error = None
+                except Exception as e:
+                    logger.error(f"批量研判 {code} 失败: {e}")
+                    analysis, error = None, str(e)
+            return {
+                "fund_code": code,
+                "analysis": analysis,
+                "error": error,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+            }
+
+        tasks = [asyncio.create_task(run(code)) for code in dict.fromkeys(fund_codes)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def analyze_favorites(self, use_cache: bool = True, use_mock: bool = False) -> AsyncIterator[Dict]:
+        """并发分析所有收藏基金"""
+        favorites = await asyncio.to_thread(get_favorites)
+        names = {fav["code"]: fav["name"] for fav in favorites}
+        async for result in self.analyze_many(list(names), names, use_cache, use_mock):
+            yield result
+
+    def iter_batch(
+        self,
+        fund_codes: Iterable[str],
+        fund_names: Optional[Dict[str, str]] = None,
+        use_cache: bool = True,
+        use_mock: bool = False
+    ) -> Iterator[Dict]:
+        """同步迭代接口（供 Streamlit 等同步调用方逐个渲染结果，在后台事件循环中执行）"""
+        loop = background_loop()
+        agen = self.analyze_many(fund_codes, fund_names, use_cache, use_mock)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    break
+        finally:
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+    async def _analyze_one(
+        self,
+        fund_code: str,
+        fund_name: Optional[str],
+        limiter: RateLimiter,
+        use_cache: bool,
+        use_mock: bool
+    ) -> Dict:
+        """单只基金：获取数据 → 计算贡献度 → 获取新闻 → 分析"""
+        fund_data = await asyncio.to_thread(
+            self.provider.get_fund_realtime, fund_code, use_mock
+        )
+        if not fund_data:
+            raise ValueError(f"无法获取基金数据: {fund_code}")
+        fund_name = fund_name or fund_data.get("name", fund_code)
+        daily_change_pct = fund_data.get("daily_change_pct", 0)
+
+        holdings = await asyncio.to_thread(self.provider.get_fund_holdings, fund_code, use_mock)
+        contributions = self.provider.calculate_holding_contribution(fund_data, holdings)
+        news = await asyncio.to_thread(self.provider.get_industry_news, fund_name, 12)
+
+        input_hash, result = await asyncio.to_thread(
+            self.analyzer.prepare,
+            fund_code, fund_name, daily_change_pct, contributions, news, use_cache, use_mock
+        )
+        if result is not None:
+            return result
+
+        # 与同步分析共用在途请求合并，避免重复的付费调用
+        key = self.analyzer.flight_key(fund_code, input_hash)
+        is_leader, result = await asyncio.to_thread(
+            single_flight.acquire, key, self.analyzer.flight_lookup(fund_code, input_hash)
+        )
+        if not is_leader:
+            return result
+
+        analysis = None
+        try:
+            analysis = await self._remote_analysis(
+                fund_code, fund_name, daily_change_pct, contributions, news, input_hash, limiter
+            )
+        finally:
+            await asyncio.to_thread(single_flight.release, key, analysis)
+        return analysis
+
+    async def _remote_analysis(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        contributions: List[Dict],
+        news: List[Dict],
+        input_hash: str,
+        limiter: RateLimiter
+    ) -> Dict:
+        """调用 DeepSeek-R1，失败时降级到本地分析（Prompt 超出预算时抛出，由 run() 记为该基金的错误）"""
+        try:
+            compiled = self.analyzer.build_prompt(
+                fund_code, fund_name, daily_change_pct, contributions, news
+            )
+            response, latency_ms = await self._create_with_retry(
+                compiled["messages"], compiled["prompt_tokens"], limiter
+            )
+        except PromptBudgetExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"DeepSeek API 调用失败: {e}")
+            # 降级到本地分析
+            return await asyncio.to_thread(
+                self.analyzer.local_analysis,
+                fund_code, fund_name, daily_change_pct, contributions, news, input_hash
+            )
+
+        message = response.choices[0].message
+        return await asyncio.to_thread(
+            self.analyzer.finalize_analysis,
+            fund_code, fund_name, daily_change_pct,
+            getattr(message, "reasoning_content", None) or "",
+            message.content or "",
+            response.usage.prompt_tokens, response.usage.completion_tokens,
+            input_hash, latency_ms,
+            input_snapshot=CacheManager.input_snapshot(daily_change_pct, contributions, news),
+            prompt_tokens_estimated=compiled["prompt_tokens"],
+            cached_tokens=self.analyzer.cached_prompt_tokens(response.usage)
+        )
+
+    async def _create_with_retry(
+        self,
+        messages: List[Dict],
+        prompt_tokens: int,
+        limiter: RateLimiter
+    ) -> Tuple[object, float]:
+        """限流 + 指数退避重试调用 DeepSeek（按编译期 Token 数预占限流配额）"""
+        estimated_tokens = prompt_tokens + self.EXPECTED_OUTPUT_TOKENS
+
+        for attempt in range(self.max_retries + 1):
+            event = await limiter.acquire(estimated_tokens)
+            start = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(
+                    model="deepseek-reasoner",
+                    max_tokens=8000,
+                    messages=messages
+                )
+            except retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.BACKOFF_BASE_SECONDS * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"DeepSeek 调用失败（第 {attempt + 1} 次），{delay:.1f}s 后重试: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            limiter.settle(event, response.usage.total_tokens)
+            return response, (time.perf_counter() - start) * 1000
+
+        raise RuntimeError("重试次数耗尽")
@@ -0,0 +1,286 @@
+"""
+研判性能压测：在本地 DeepSeek 模拟服务上测量单次、缓存、并发、流式与批量分析
+输出各场景的 p50/p95/p99 延迟、吞吐量、缓存命中率与上游调用次数
+
+用法：
+    python benchmarks/bench_analyzer.py                       # 启动内置模拟服务
+    python benchmarks/bench_analyzer.py --ttft 1.0 --requests 50 --concurrency 16
+    python benchmarks/bench_analyzer.py --base-url http://127.0.0.1:8765 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, List, Callable, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_deepseek import FakeDeepSeekServer, DEFAULT_CONFIG
+
+WORKLOADS = ("single", "cached", "concurrent", "stream", "batch")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """线性插值百分位"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(name: str, latencies_ms: List[float], wall_seconds: float, extra: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "workload": name,
+        "requests": len(latencies_ms),
+        "p50_ms": round(percentile(latencies_ms, 50), 1),
+        "p95_ms": round(percentile(latencies_ms, 95), 1),
+        "p99_ms": round(percentile(latencies_ms, 99), 1),
+        "throughput_rps": round(len(latencies_ms) / wall_seconds, 2) if wall_seconds else 0.0,
+        **extra,
+    }
+
+
+class SyntheticFunds:
+    """合成基金输入：每只基金的涨跌幅与持仓不同，输入指纹互不相同"""
+
+    def __init__(self, count: int, seed: int = 7):
+        rng = random.Random(seed)
+        self.funds: Dict[str, Dict] = {}
+        for i in range(count):
+            code = f"9{i:05d}"
+            change = round(rng.choice([-1, 1]) * rng.uniform(1.6, 4.5), 2)
+            holdings = [
+                {
+                    "stock": f"股票{i}-{j}",
+                    "code": f"{600000 + i * 10 + j}",
+                    "weight": round(rng.uniform(2, 9), 1),
+                    "change": round(rng.uniform(-6, 6), 2),
+                }
+                for j in range(5)
+            ]
+            for h in holdings:
+                h["contribution"] = round(h["weight"] * h["change"] / 100, 4)
+            news = [
+                {
+                    "source": "合成",
+                    "title": f"股票{i}-{j} 相关行业动态 {j}",
+                    "summary": f"股票{i}-{j} 所在行业出现新的政策与资金面变化。",
+                    "time": "09:30",
+                }
+                for j in range(3)
+            ]
+            self.funds[code] = {
+                "code": code,
+                "name": f"合成基金{i}",
+                "daily_change_pct": change,
+                "holdings": holdings,
+                "news": news,
+            }
+
+    @property
+    def codes(self) -> List[str]:
+        return list(self.funds)
+
+    # 以下方法与 FundDataProvider 接口一致，供批量引擎使用
+    def get_fund_realtime(self, fund_code: str, use_mock: bool = False) -> Optional[Dict]:
+        fund = self.funds.get(fund_code)
+        if fund is None:
+            return None
+        return {"code": fund_code, "name": fund["name"], "daily_change_pct": fund["daily_change_pct"]}
+
+    def get_fund_holdings(self, fund_code: str, use_mock: bool = False) -> List[Dict]:
+        return self.funds[fund_code]["holdings"]
+
+    def calculate_holding_contribution(self, fund_data: Dict, holdings: List[Dict]) -> List[Dict]:
+        return holdings
+
+    def get_industry_news(self, keywords: str, hours: int = 12) -> List[Dict]:
+        for fund in self.funds.values():
+            if fund["name"] == keywords:
+                return fund["news"]
+        return []
+
+
+def run_bench(args: argparse.Namespace, base_url: str, server: Optional[FakeDeepSeekServer]) -> List[Dict]:
+    # 模块级配置在导入时读取，必须先设置环境变量再导入项目模块
+    os.environ["DEEPSEEK_BASE_URL"] = base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "sk-bench")
+
+    import database
+    from cache_manager import analysis_cache, single_flight
+    from deepseek_analyzer import DeepSeekAnalyzer
+
+    # 使用临时数据库，避免污染正式数据
+    tmpdir = tempfile.mkdtemp(prefix="deepinsight-bench-")
+    database.close_pool()
+    database.DB_PATH = Path(tmpdir) / "bench.db"
+    database.init_database()
+
+    analyzer = DeepSeekAnalyzer(os.environ["DEEPSEEK_API_KEY"])
+    results = []
+
+    def measure(name: str, funds: SyntheticFunds, calls: List[str], call: Callable[[Dict], Any], concurrency: int = 1) -> None:
+        server_before = server.stats() if server else {}
+        cache_before = analysis_cache.stats()
+        flight_before = single_flight.stats()
+        latencies: List[float] = []
+        extra_metrics: Dict[str, List[float]] = {}
+
+        def timed(code: str) -> None:
+            start = time.perf_counter()
+            metrics = call(funds.funds[code]) or {}
+            latencies.append((time.perf_counter() - start) * 1000)
+            for key, value in metrics.items():
+                extra_metrics.setdefault(key, []).append(value)
+
+        wall_start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(timed, calls))
+        else:
+            for code in calls:
+                timed(code)
+        wall = time.perf_counter() - wall_start
+
+        cache_after = analysis_cache.stats()
+        hits = (cache_after["l1_hits"] + cache_after["l2_hits"]) - (cache_before["l1_hits"] + cache_before["l2_hits"])
+        lookups = hits + cache_after["misses"] - cache_before["misses"]
+        extra = {
+            "cache_hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "coalesced": sum(
+                single_flight.stats()[key] - flight_before[key] for key in ("thread_waits", "process_waits")
+            ),
+        }
+        if server:
+            server_after = server.stats()
+            extra["upstream_calls"] = server_after["requests"] - server_before["requests"]
+            extra["cached_prompt_tokens"] = server_after["cached_tokens"] - server_before["cached_tokens"]
+        for key, values in extra_metrics.items():
+            extra[f"{key}_p50"] = round(percentile(values, 50), 1)
+            extra[f"{key}_p95"] = round(percentile(values, 95), 1)
+        results.append(summarize(name, latencies, wall, extra))
+        print(json.dumps(results[-1], ensure_ascii=False))
+
+    def analyze(fund: Dict, use_cache: bool = True) -> Dict:
+        analyzer.analyze_fund_movement(
+            fund["code"], fund["name"], fund["daily_change_pct"],
+            fund["holdings"], fund["news"], use_cache=use_cache
+        )
+        return {}
+
+    def stream(fund: Dict) -> Dict:
+        start = time.perf_counter()
+        ttft = None
+        for event, _ in analyzer.stream_fund_movement(
+            fund["code"], fund["name"], fund["daily_change_pct"],
+            fund["holdings"], fund["news"], use_cache=False
+        ):
+            if event != "done" and ttft is None:
+                ttft = (time.perf_counter() - start) * 1000
+        return {"ttft_ms": ttft} if ttft is not None else {}
+
+    n = args.requests
+    # 每个场景使用独立的基金代码段，避免相互命中缓存
+    offset = 0
+
+    def new_funds(count: int) -> SyntheticFunds:
+        nonlocal offset
+        funds = SyntheticFunds(count, seed=args.seed + offset)
+        funds.funds = {
+            f"{int(code) + offset * 1000:06d}": dict(fund, code=f"{int(code) + offset * 1000:06d}")
+            for code, fund in funds.funds.items()
+        }
+        offset += 1
+        return funds
+
+    if "single" in args.workloads:
+        funds = new_funds(n)
+        measure("single", funds, funds.codes, lambda fund: analyze(fund, use_cache=False))
+
+    if "cached" in args.workloads:
+        funds = new_funds(max(1, n // 5))
+        for code in funds.codes:
+            analyze(funds.funds[code])
+        database.flush_writes()
+        calls = [funds.codes[i % len(funds.codes)] for i in range(n)]
+        measure("cached", funds, calls, analyze)
+
+    if "concurrent" in args.workloads:
+        # 少量基金被大量并发请求，考察在途请求合并
+        funds = new_funds(max(1, n // 5))
+        calls = [funds.codes[i % len(funds.codes)] for i in range(n)]
+        measure("concurrent", funds, calls, analyze, concurrency=args.concurrency)
+
+    if "stream" in args.workloads:
+        funds = new_funds(n)
+        measure("stream", funds, funds.codes, stream)
+
+    if "batch" in args.workloads:
+        from batch_analyzer import AsyncAnalysisEngine
+        funds = new_funds(n)
+        engine = AsyncAnalysisEngine(os.environ["DEEPSEEK_API_KEY"], max_concurrency=args.concurrency)
+        engine.provider = funds
+        server_before = server.stats() if server else {}
+        wall_start = time.perf_counter()
+        batch = list(engine.iter_batch(funds.codes, {code: f["name"] for code, f in funds.funds.items()}))
+        wall = time.perf_counter() - wall_start
+        extra = {"errors": sum(1 for item in batch if item["error"])}
+        if server:
+            extra["upstream_calls"] = server.stats()["requests"] - server_before["requests"]
+        results.append(summarize("batch", [item["elapsed_ms"] for item in batch], wall, extra))
+        print(json.dumps(results[-1], ensure_ascii=False))
+
+    database.flush_writes()
+    database.close_pool()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DeepInsight 研判性能压测")
+    parser.add_argument("--base-url", help="已运行的 OpenAI 兼容服务地址（缺省时启动内置模拟服务）")
+    parser.add_argument("--requests", type=int, default=20, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"逗号分隔，可选 {','.join(WORKLOADS)}")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="结果写入 JSON 文件")
+    for key in ("ttft", "tokens_per_second", "error_rate", "rate_limit_rate"):
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=DEFAULT_CONFIG[key])
+    args = parser.parse_args()
+    args.workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"未知场景: {sorted(unknown)}")
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = FakeDeepSeekServer(
+            ttft=args.ttft,
+            tokens_per_second=args.tokens_per_second,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            seed=args.seed
+        )
+        base_url = server.start()
+        print(f"内置模拟服务: {base_url}")
+
+    try:
+        results = run_bench(args, base_url, server)
+    finally:
+        if server:
+            server.stop()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+热点路径微基准：data_provider / cache_manager / database / 看板渲染
+按多个规模生成合成数据，与 baselines.json 中的基线比较以发现性能回退
+
+用法：
+    python benchmarks/bench_hotpaths.py                        # 运行 small、medium 规模并与基线比较
+    python benchmarks/bench_hotpaths.py --scales small,medium,large
+    python benchmarks/bench_hotpaths.py --save-baseline        # 以本次结果替换所测规模的全部基线
+    python benchmarks/bench_hotpaths.py --only contribution,news
+
+退出码：超出容差的用例经复测仍回退时为 1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Callable, Any, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines.json"
+
+# 各规模的合成数据量
+SCALES = {
+    "small": {"holdings": 10, "news": 10, "cache_entries": 100, "cost_rows": 10_000, "favorites": 3},
+    "medium": {"holdings": 100, "news": 100, "cache_entries": 1_000, "cost_rows": 100_000, "favorites": 10},
+    "large": {"holdings": 1_000, "news": 1_000, "cache_entries": 10_000, "cost_rows": 1_000_000, "favorites": 30},
+}
+
+CASES = ("contribution", "news", "cache_roundtrip", "cost_history", "dashboard")
+
+# 看板渲染每次只跑一遍完整脚本，单次耗时受 Streamlit 与调度抖动影响大：多渲染几次并放宽容差
+DASHBOARD_RENDERS = 10
+CASE_TOLERANCE = {"dashboard": 0.5}
+
+
+def time_it(func: Callable[[], Any], repeat: int, min_seconds: float = 1.0) -> Dict[str, float]:
+    """
+    多轮计时：每轮自动确定循环次数使耗时不低于 min_seconds / repeat
+
+    Returns:
+        {"median_ms", "min_ms", "loops"}（单次调用耗时）
+    """
+    func()  # 预热
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds / repeat or loops >= 1_000_000:
+            break
+        loops *= 10
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) * 1000 / loops)
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "min_ms": round(min(samples), 4),
+        "loops": loops,
+    }
+
+
+def synthetic_holdings(count: int, rng: random.Random) -> List[Dict]:
+    return [
+        {
+            "stock": f"股票{i}",
+            "code": f"{600000 + i}",
+            "weight": round(rng.uniform(0.1, 9.0), 2),
+            "change": round(rng.uniform(-8, 8), 2),
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_news(count: int, rng: random.Random) -> List[Dict]:
+    # 约三分之一为近似重复标题
+    return [
+        {
+            "source": rng.choice(["新华社", "财经网", "证券时报"]),
+            "title": f"行业动态第{i // 3 if i % 3 == 2 else i}期：政策与资金面变化" + ("！" if i % 3 == 2 else ""),
+            "summary": "行业出现新的政策与资金面变化，市场关注度提升。" * 3,
+            "time": "09:30",
+        }
+        for i in range(count)
+    ]
+
+
+def populate_cost_log(db_path: Path, rows: int, rng: random.Random) -> None:
+    """批量写入成本明细（近 30 天），随后由 init_database 回填汇总表"""
+    conn = sqlite3.connect(db_path)
+    now = datetime.now()
+    batch = []
+    for i in range(rows):
+        ts = now - timedelta(seconds=rng.randint(0, 30 * 86400))
+        tokens_in, tokens_out = rng.randint(200, 2000), rng.randint(500, 5000)
+        batch.append((
+            ts.strftime("%Y-%m-%d"), tokens_in + tokens_out, tokens_in, tokens_out, 0,
+            round((tokens_in * 0.55 + tokens_out * 2.19) / 1_000_000, 6),
+            rng.choice(["deepseek_analysis", "prewarm"]), ts.astimezone().isoformat(sep=" ", timespec="seconds")
+        ))
+        if len(batch) >= 50_000:
+            conn.executemany(
+                "INSERT INTO cost_log (date, tokens_used, input_tokens, output_tokens, cached_tokens, "
+                "estimated_cost, operation_type, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch
+            )
+            batch = []
+    if batch:
+        conn.executemany(
+            "INSERT INTO cost_log (date, tokens_used, input_tokens, output_tokens, cached_tokens, "
+            "estimated_cost, operation_type, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch
+        )
+    conn.commit()
+    conn.close()
+
+
+def use_database(path: Path) -> None:
+    """切换到指定数据库文件（重建连接池并建表）"""
+    import database
+    database.flush_writes()
+    database.close_pool()
+    database.DB_PATH = path
+    database.init_database()
+
+
+def run_scale(scale: str, only: List[str], repeat: int, workdir: Path) -> Dict[str, Dict[str, float]]:
+    import database
+    from cache_manager import CacheManager, analysis_cache
+    from data_provider import FundDataProvider
+
+    size = SCALES[scale]
+    rng = random.Random(42)
+    results: Dict[str, Dict[str, float]] = {}
+
+    def record(case: str, stats: Dict[str, float]) -> None:
+        key = f"{case}[{scale}]"
+        results[key] = stats
+        print(f"{key:<28} median {stats['median_ms']:>12.4f} ms   min {stats['min_ms']:>12.4f} ms")
+
+    if "contribution" in only:
+        holdings = synthetic_holdings(size["holdings"], rng)
+        fund_data = {"code": "000001", "daily_change_pct": 1.2}
+        record("contribution", time_it(
+            lambda: FundDataProvider.calculate_holding_contribution(fund_data, holdings), repeat
+        ))
+
+    if "news" in only:
+        news = synthetic_news(size["news"], rng)
+        record("news", time_it(lambda: CacheManager.optimize_news_input(news), repeat))
+
+    if "cache_roundtrip" in only:
+        use_database(workdir / f"cache-{scale}.db")
+        analysis = {"analysis_result": "x" * 2000, "tokens_used": 3000, "estimated_cost": 0.005}
+        # 预置历史版本，使查询在真实规模的表上进行
+        for i in range(size["cache_entries"]):
+            database.cache_analysis(f"{i % 500:06d}", "movement_analysis", json.dumps(analysis), f"h{i}")
+        database.flush_writes()
+        counter = iter(range(10 ** 9))
+
+        def roundtrip() -> None:
+            i = next(counter)
+            database.cache_analysis("999999", "movement_analysis", json.dumps(analysis), f"r{i}")
+            database.flush_writes()
+            assert database.get_cached_analysis("999999", "movement_analysis") is not None
+
+        record("cache_roundtrip", time_it(roundtrip, repeat))
+
+    if "cost_history" in only:
+        path = workdir / f"cost-{scale}.db"
+        use_database(path)
+        populate_cost_log(path, size["cost_rows"], rng)
+        # 清空汇总表后重新初始化，触发从明细表回填
+        with sqlite3.connect(path) as conn:
+            conn.execute("DELETE FROM cost_daily")
+            conn.execute("DELETE FROM cost_hourly")
+        use_database(path)
+        record("cost_history", time_it(lambda: database.get_cost_history(days=7), repeat))
+
+    if "dashboard" in only:
+        from streamlit.testing.v1 import AppTest
+        use_database(workdir / f"dashboard-{scale}.db")
+        # 模拟数据之外的基金代码由 FundDataProvider 按代码生成模拟行情与持仓，每张卡片都走完整渲染
+        mock_codes = list(FundDataProvider.MOCK_DATA)
+        for i in range(size["favorites"]):
+            code = mock_codes[i] if i < len(mock_codes) else f"{100000 + i}"
+            database.add_favorite(code, f"合成基金{i}")
+        analysis_cache.invalidate()
+
+        def render() -> None:
+            app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=120).run()
+            assert not app.exception, app.exception
+
+        record("dashboard", time_it(render, max(repeat, DASHBOARD_RENDERS), min_seconds=0))
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> Dict[str, str]:
+    """
+    返回超出容差的回退：{用例键: 描述}
+
+    比较各轮最快耗时（min_ms）：共享机器上的干扰只会让单轮变慢，最快一轮最接近代码本身的开销，
+    中位数在同一份代码的两次运行间可相差 40% 以上。看板等抖动大的用例按 CASE_TOLERANCE 放宽。
+    """
+    regressions = {}
+    for key, stats in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        tolerance_for = max(tolerance, CASE_TOLERANCE.get(key.split("[")[0], 0.0))
+        ratio = stats["min_ms"] / base["min_ms"] if base["min_ms"] else 1.0
+        marker = "回退" if ratio > 1 + tolerance_for else ("提升" if ratio < 1 - tolerance_for else "持平")
+        print(f"{key:<28} 基线 {base['min_ms']:>12.4f} ms   本次 {stats['min_ms']:>12.4f} ms   x{ratio:.2f} {marker}")
+        if ratio > 1 + tolerance_for:
+            regressions[key] = f"{key}: {base['min_ms']} -> {stats['min_ms']} ms (x{ratio:.2f})"
+    return regressions
+
+
+def main() -> Optional[int]:
+    parser = argparse.ArgumentParser(description="DeepInsight 热点路径微基准")
+    parser.add_argument("--scales", default="small,medium", help=f"逗号分隔，可选 {','.join(SCALES)}")
+    parser.add_argument("--only", default=",".join(CASES), help=f"逗号分隔，可选 {','.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对变慢比例")
+    parser.add_argument("--retries", type=int, default=2, help="回退用例的复测次数，取各次最快结果")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="以本次结果替换所测规模的全部基线")
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    only = [c.strip() for c in args.only.split(",") if c.strip()]
+    unknown = (set(scales) - set(SCALES)) | (set(only) - set(CASES))
+    if unknown:
+        parser.error(f"未知的规模或用例: {sorted(unknown)}")
+
+    # 看板渲染使用模拟数据，避免网络请求
+    os.environ.setdefault("DEEPSEEK_API_KEY", "")
+    workdir = Path(tempfile.mkdtemp(prefix="deepinsight-hotpaths-"))
+
+    results: Dict[str, Dict[str, float]] = {}
+    for scale in scales:
+        results.update(run_scale(scale, only, args.repeat, workdir))
+
+    import database
+    database.flush_writes()
+    database.close_pool()
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+
+    if args.save_baseline:
+        # 所测规模的旧条目全部丢弃（包括本次未运行的用例），基线不会混入不同代码版本的结果
+        baseline = {
+            key: value for key, value in baseline.items()
+            if key == "_meta" or key.split("[")[-1].rstrip("]") not in scales
+        }
+        baseline.update(results)
+        # 基线与机器相关，记录采集环境便于判断是否可比
+        baseline["_meta"] = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "recorded_at": datetime.now().strftime("%Y-%m-%d"),
+        }
+        baseline_path.write_text(json.dumps(baseline, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+        print(f"基线已更新: {baseline_path}")
+        return None
+
+    regressions = compare(results, baseline, args.tolerance)
+    # 机器上的短时争用会让某个用例整段变慢：复测超差用例，真实回退在复测中仍会复现
+    for attempt in range(args.retries):
+        if not regressions:
+            break
+        print(f"复测: {', '.join(regressions)}")
+        retry_dir = workdir / f"retry-{attempt}"  # 新库文件，避免在已填充的表上重复写入
+        retry_dir.mkdir()
+        for key in regressions:
+            case, scale = key.rstrip("]").split("[")
+            retry = run_scale(scale, [case], args.repeat, retry_dir)[key]
+            if retry["min_ms"] < results[key]["min_ms"]:
+                results[key] = retry
+        database.flush_writes()
+        database.close_pool()
+        regressions = compare({key: results[key] for key in regressions}, baseline, args.tolerance)
+
+    if regressions:
+        print("发现性能回退:\n" + "\n".join(regressions.values()))
+        return 1
+    return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
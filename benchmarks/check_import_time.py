@@ -0,0 +1,95 @@
+"""
+冷启动导入耗时检查：在全新解释器中以 -X importtime 导入项目模块
+确认重量级依赖（akshare、openai、pandas）未在导入阶段加载，且总耗时不超过预算
+
+用法：
+    python benchmarks/check_import_time.py                  # 默认预算 1.0 秒
+    python benchmarks/check_import_time.py --budget 0.8 --top 15
+    python benchmarks/check_import_time.py --with-streamlit # 计入 streamlit 自身的导入
+
+退出码：超出预算或加载了禁止的依赖时为 1
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 模拟模式启动路径上导入的项目模块
+PROJECT_MODULES = (
+    "config", "database", "prompt_compiler", "cache_manager", "data_provider",
+    "deepseek_analyzer", "batch_analyzer", "prewarm", "quote_poller", "nav_series",
+)
+
+# 只应在真正取数/调用 API/渲染表格时加载的依赖
+FORBIDDEN = ("akshare", "openai", "pandas", "httpx")
+
+
+def measure(modules: List[str]) -> Tuple[Dict[str, int], Set[str], float]:
+    """
+    子进程导入指定模块，解析 -X importtime 输出
+
+    Returns:
+        (顶层导入的包 -> 累计耗时微秒, 加载过的全部顶层包名, 总墙钟耗时秒)
+    """
+    env = dict(os.environ)
+    # 无 API Key 即模拟模式
+    env.pop("DEEPSEEK_API_KEY", None)
+    code = (
+        "import time; _s = time.perf_counter(); "
+        f"import {', '.join(modules)}; "
+        "print(time.perf_counter() - _s)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入失败:\n{proc.stderr[-2000:]}")
+
+    cumulative: Dict[str, int] = {}
+    loaded: Set[str] = set()
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumul, name = line[len("import time:"):].split("|")
+        top = name.strip().split(".")[0]
+        loaded.add(top)
+        # 耗时只统计顶层导入（包名前仅一个空格），嵌套导入已计入其父模块
+        if not name.startswith("  "):
+            cumulative[top] = cumulative.get(top, 0) + int(cumul)
+    return cumulative, loaded, float(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> Optional[int]:
+    parser = argparse.ArgumentParser(description="DeepInsight 冷启动导入耗时检查")
+    parser.add_argument("--budget", type=float, default=1.0, help="导入总耗时预算（秒）")
+    parser.add_argument("--top", type=int, default=10, help="列出耗时最多的前 N 个包")
+    parser.add_argument("--with-streamlit", action="store_true", help="同时导入 streamlit")
+    args = parser.parse_args()
+
+    modules = list(PROJECT_MODULES)
+    if args.with_streamlit:
+        modules.insert(0, "streamlit")
+    cumulative, loaded, wall = measure(modules)
+
+    print(f"{'包':<24}{'累计耗时 (ms)':>14}")
+    for name, micros in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<24}{micros / 1000:>14.1f}")
+    print(f"总耗时 {wall:.3f}s（预算 {args.budget:.3f}s）")
+
+    failures = [f"导入阶段加载了 {name}" for name in FORBIDDEN if name in loaded]
+    if wall > args.budget:
+        failures.append(f"导入耗时 {wall:.3f}s 超出预算 {args.budget:.3f}s")
+    if failures:
+        print("检查未通过:\n" + "\n".join(failures))
+        return 1
+    return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+本地 DeepSeek 模拟服务：OpenAI 兼容的 /chat/completions 接口
+可配置首 Token 延迟、输出速率、流式输出与错误注入，供离线压测使用
+
+用法：
+    python benchmarks/fake_deepseek.py --port 8765 --ttft 0.5 --tokens-per-second 300
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8765 DEEPSEEK_API_KEY=sk-fake streamlit run app.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, List, Any
+
+# 默认模拟参数
+DEFAULT_CONFIG = {
+    "ttft": 0.5,                    # 首 Token 延迟（秒）
+    "tokens_per_second": 300.0,     # 输出速率
+    "reasoning_tokens": 300,        # 思考过程 Token 数
+    "output_tokens": 500,           # 分析结果 Token 数
+    "chunk_tokens": 10,             # 流式输出每块 Token 数
+    "error_rate": 0.0,              # 返回 500 的概率
+    "rate_limit_rate": 0.0,         # 返回 429 的概率
+    "cache_unit_tokens": 64,        # 前缀缓存粒度（与 DeepSeek 一致按 64 Token 计）
+    "seed": None,
+}
+
+REASONING_TEXT = "先看重仓股贡献度，再对照新闻判断驱动因素是否可持续，最后比较估值与持仓走势是否背离。"
+CONTENT_TEXT = """### 思考过程
+重仓股集中波动，新闻面与行业景气度一致。
+
+### 波动性质判断
+混合信号
+
+### 持仓变动评估
+估值与持仓走势基本一致，暂无隐形变动证据。
+
+### 风险提示
+短期情绪波动放大，注意行业集中度风险。
+
+### 投资建议
+维持现有仓位，等待基本面数据确认。
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """按 DeepSeek 官方换算比例估算 Token 数（中文 0.6，其他 0.3）"""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def _fill(text: str, tokens: int) -> str:
+    """重复文本直到约为指定 Token 数"""
+    per_copy = max(estimate_tokens(text), 1)
+    return text * max(1, math.ceil(tokens / per_copy))
+
+
+def _split(text: str, parts: int) -> List[str]:
+    size = max(1, math.ceil(len(text) / max(parts, 1)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeDeepSeekServer:
+    """OpenAI 兼容的 DeepSeek 模拟服务（线程化 HTTP/1.1，支持 keep-alive）"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config: Any):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"未知的模拟参数: {sorted(unknown)}")
+        self.config = {**DEFAULT_CONFIG, **config}
+        self._random = random.Random(self.config["seed"])
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+        self._stats = {
+            "requests": 0,
+            "stream_requests": 0,
+            "errors_injected": 0,
+            "rate_limited": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+        }
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """后台线程启动，返回 base_url"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-deepseek", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def _injected_error(self) -> Optional[int]:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.config["rate_limit_rate"]:
+            self._count(rate_limited=1)
+            return 429
+        if roll < self.config["rate_limit_rate"] + self.config["error_rate"]:
+            self._count(errors_injected=1)
+            return 500
+        return None
+
+    def _usage(self, messages: List[Dict]) -> Dict[str, int]:
+        """输入 Token 与前缀缓存命中：首条消息（系统前缀）见过即按 64 Token 粒度命中"""
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        cached = 0
+        if messages:
+            prefix = str(messages[0].get("content", ""))
+            with self._lock:
+                if prefix in self._seen_prefixes:
+                    unit = self.config["cache_unit_tokens"]
+                    cached = estimate_tokens(prefix) // unit * unit
+                else:
+                    self._seen_prefixes.add(prefix)
+        completion_tokens = self.config["reasoning_tokens"] + self.config["output_tokens"]
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": cached,
+            "prompt_cache_miss_tokens": prompt_tokens - cached,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _send_json(self, status: int, payload: Dict) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "not_found"}})
+                    return
+
+                stream = bool(request.get("stream"))
+                server._count(requests=1, stream_requests=int(stream))
+
+                status = server._injected_error()
+                if status is not None:
+                    time.sleep(server.config["ttft"] / 4)
+                    self._send_json(status, {"error": {"message": "injected error", "type": "server_error"}})
+                    return
+
+                usage = server._usage(request.get("messages") or [])
+                server._count(
+                    prompt_tokens=usage["prompt_tokens"],
+                    cached_tokens=usage["prompt_cache_hit_tokens"],
+                    completion_tokens=usage["completion_tokens"]
+                )
+                model = request.get("model", "deepseek-reasoner")
+                reasoning = _fill(REASONING_TEXT, server.config["reasoning_tokens"])
+                content = _fill(CONTENT_TEXT, server.config["output_tokens"])
+                if stream:
+                    include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+                    self._stream(model, reasoning, content, usage if include_usage else None)
+                else:
+                    self._complete(model, reasoning, content, usage)
+
+            def _complete(self, model: str, reasoning: str, content: str, usage: Dict) -> None:
+                config = server.config
+                time.sleep(config["ttft"] + usage["completion_tokens"] / config["tokens_per_second"])
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content, "reasoning_content": reasoning},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+            def _stream(self, model: str, reasoning: str, content: str, usage: Optional[Dict]) -> None:
+                config = server.config
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(delta: Optional[Dict], finish_reason: Optional[str] = None, final_usage: Optional[Dict] = None) -> None:
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [] if delta is None else [
+                            {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                        ],
+                    }
+                    if final_usage is not None:
+                        payload["usage"] = final_usage
+                    self._send_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+                time.sleep(config["ttft"])
+                chunk_delay = config["chunk_tokens"] / config["tokens_per_second"]
+                event({"role": "assistant", "content": ""})
+                for field, text, tokens in (
+                    ("reasoning_content", reasoning, config["reasoning_tokens"]),
+                    ("content", content, config["output_tokens"]),
+                ):
+                    for piece in _split(text, math.ceil(tokens / config["chunk_tokens"])):
+                        event({field: piece})
+                        time.sleep(chunk_delay)
+                event({}, finish_reason="stop")
+                if usage is not None:
+                    event(None, final_usage=usage)
+                self._send_chunk(b"data: [DONE]\n\n")
+                self._send_chunk(b"")
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 DeepSeek 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, value in DEFAULT_CONFIG.items():
+        kind = float if isinstance(value, float) else int
+        parser.add_argument(f"--{key.replace('_', '-')}", type=kind, default=value)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+
+    server = FakeDeepSeekServer(host, port, **args)
+    print(f"DeepSeek 模拟服务已启动: {server.base_url}（设置 DEEPSEEK_BASE_URL 指向该地址）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
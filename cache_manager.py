@@ -2,9 +2,22 @@
 缓存管理模块：智能缓存与成本优化
 """
 import json
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-from database import get_cached_analysis, cache_analysis
+import hashlib
+import math
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple, List, Callable
+from config import DATA_CONFIG
+from prompt_compiler import TokenCounter, dedup_news
+from database import (
+    get_cached_analysis_entry, cache_analysis,
+    try_acquire_lock, renew_lock, release_lock, release_lock_after_writes,
+    record_cache_event, get_cache_telemetry
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,131 +41,177 @@ class CacheManager:
         }
     }
     
+    # 输入指纹中日涨跌幅的分桶宽度（%），边界与本地分析的 0.5% 及 volatility_threshold 阈值对齐
+    CHANGE_BUCKET_PCT = 0.5
+    
     @staticmethod
-    def should_use_cache(
+    def fingerprint_inputs(
         fund_code: str,
-        analysis_type: str,
-        volatility_pct: float
-    ) -> bool:
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict]
+    ) -> str:
         """
-        判断是否应该使用缓存
+        计算分析输入的规范化指纹
+        
+        包含基金代码与影响 Prompt 内容的数据（涨跌幅分桶、持仓、新闻）。
+        报告正文包含基金名称与涨跌幅，即使其他输入相同也不能跨基金复用。
         
         Args:
             fund_code: 基金代码
-            analysis_type: 分析类型
-            volatility_pct: 波动幅度（%）
+            daily_change_pct: 日涨跌幅
+            holdings_contribution: 重仓股贡献度列表
+            news_items: 相关新闻列表
         
         Returns:
-            是否使用缓存
+            十六进制指纹字符串
         """
-        
-        # 如果波动超过 ±1.5%，不使用缓存
-        if abs(volatility_pct) > 1.5:
-            logger.info(f"波动幅度 {volatility_pct}% 超过阈值，不使用缓存")
-            return False
-        
-        # 检查缓存是否存在且未过期
-        strategy = CacheManager.CACHE_STRATEGIES.get(analysis_type, {})
-        ttl_hours = strategy.get("ttl_hours", 1)
-        
-        cached = get_cached_analysis(fund_code, analysis_type, max_age_hours=ttl_hours)
-        
-        if cached:
-            logger.info(f"找到有效缓存: {fund_code} - {analysis_type}")
-            return True
-        
-        return False
+        holdings = sorted(
+            (
+                str(h.get("code", "")),
+                round(float(h.get("weight", 0)), 2),
+                round(float(h.get("change", 0)), 2)
+            )
+            for h in holdings_contribution
+        )
+        payload = {
+            "fund_code": fund_code,
+            "change_bucket": math.floor(daily_change_pct / CacheManager.CHANGE_BUCKET_PCT),
+            "holdings": holdings,
+            "news": CacheManager._news_key(news_items),
+        }
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
     
     @staticmethod
-    def get_cache_status(fund_code: str, analysis_type: str) -> Dict[str, Any]:
-        """获取缓存状态"""
-        cached = get_cached_analysis(fund_code, analysis_type, max_age_hours=24)
-        
-        if cached:
-            try:
-                data = json.loads(cached)
-                return {
-                    "exists": True,
-                    "analysis_time": data.get("analysis_time"),
-                    "is_valid": True
-                }
-            except json.JSONDecodeError:
-                return {
-                    "exists": True,
-                    "is_valid": False
-                }
-        
+    def _news_key(news_items: List[Dict]) -> List[Tuple[str, str, str]]:
+        """新闻的规范化表示（与顺序无关）"""
+        return sorted(
+            (n.get("source", ""), n.get("title", ""), n.get("summary", ""))
+            for n in news_items
+        )
+    
+    @staticmethod
+    def news_digest(news_items: List[Dict]) -> str:
+        """新闻摘要指纹：新闻增删或内容变化时改变"""
+        canonical = json.dumps(CacheManager._news_key(news_items), ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    
+    @staticmethod
+    def input_snapshot(
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict]
+    ) -> Dict[str, Any]:
+        """分析时的输入快照，随分析结果一起缓存，供失效策略计算漂移"""
         return {
-            "exists": False,
-            "is_valid": False
+            "daily_change_pct": daily_change_pct,
+            "holdings": [
+                {
+                    "code": str(h.get("code", "")),
+                    "weight": float(h.get("weight", 0)),
+                    "change": float(h.get("change", 0))
+                }
+                for h in holdings_contribution
+            ],
+            "news_digest": CacheManager.news_digest(news_items)
         }
     
     @staticmethod
-    def estimate_token_savings(
-        original_tokens: int,
-        cache_hit_rate: float = 0.7
-    ) -> Dict[str, Any]:
+    def record_lookup(
+        fund_code: str,
+        analysis_type: str,
+        outcome: str,
+        cached: Optional[Dict[str, Any]] = None
+    ) -> None:
         """
-        估计缓存节省的 Token
+        记录一次缓存查找
         
         Args:
-            original_tokens: 原始 Token 数
-            cache_hit_rate: 缓存命中率（0-1）
-        
-        Returns:
-            节省统计
+            fund_code: 基金代码
+            analysis_type: 分析类型
+            outcome: hit（命中）/ miss（无可用缓存）/ bypass（缓存存在但漂移显著或调用方跳过缓存）/
+                     prewarm（后台预热强制刷新，不计入命中率）
+            cached: 命中的分析结果，其 Token、费用和耗时即为本次实际节省
         """
+        cached = cached or {}
+        try:
+            record_cache_event(
+                fund_code, analysis_type, outcome,
+                tokens_avoided=int(cached.get("tokens_used") or 0),
+                cost_avoided=float(cached.get("estimated_cost") or 0.0),
+                latency_avoided_ms=float(cached.get("latency_ms") or 0.0)
+            )
+        except Exception as e:
+            logger.warning(f"缓存遥测记录失败: {e}")
+    
+    @staticmethod
+    def measure_token_savings(days: int = 7) -> Dict[str, Any]:
+        """
+        实测缓存节省（基于 cache_telemetry 表）
         
-        cached_tokens = int(original_tokens * cache_hit_rate)
-        saved_tokens = cached_tokens
-        
-        # 基于 DeepSeek 定价
-        input_price = 0.55 / 1_000_000
-        output_price = 2.19 / 1_000_000
+        Args:
+            days: 统计最近 N 天
         
-        # 假设 output 是 input 的 2 倍
-        avg_price = (input_price + output_price * 2) / 3
-        saved_cost = saved_tokens * avg_price
+        Returns:
+            汇总统计与按分析类型的明细
+        """
+        by_type = get_cache_telemetry(days, group_by="type")
+        totals = {
+            key: sum(item[key] for item in by_type)
+            for key in ("hits", "misses", "bypasses", "prewarms", "tokens_avoided", "cost_avoided", "latency_avoided_ms")
+        }
+        lookups = totals["hits"] + totals["misses"] + totals["bypasses"]
         
         return {
-            "total_tokens": original_tokens,
-            "cached_tokens": cached_tokens,
-            "saved_tokens": saved_tokens,
-            "saved_cost": round(saved_cost, 4),
-            "cache_hit_rate": cache_hit_rate
+            "days": days,
+            "lookups": lookups,
+            "hits": totals["hits"],
+            "misses": totals["misses"],
+            "bypasses": totals["bypasses"],
+            "prewarms": totals["prewarms"],
+            "cache_hit_rate": round(totals["hits"] / lookups, 4) if lookups else 0.0,
+            "saved_tokens": totals["tokens_avoided"],
+            "saved_cost": round(totals["cost_avoided"], 4),
+            "saved_latency_ms": round(totals["latency_avoided_ms"], 1),
+            "by_type": by_type
         }
     
     @staticmethod
-    def optimize_news_input(news_items: list, max_chars: int = 300) -> str:
+    def optimize_news_input(news_items: list, max_tokens: int = 180) -> str:
         """
-        优化新闻输入：精简内容以节省 Token
+        优化新闻输入：去除近似重复新闻并按 Token 预算精简内容
         
         Args:
             news_items: 新闻列表
-            max_chars: 最大字符数
+            max_tokens: Token 预算（本地估算）
         
         Returns:
             精简后的新闻文本
         """
         
+        counter = TokenCounter()
+        unique_news = dedup_news(news_items)
+        
         optimized = []
-        total_chars = 0
+        total_tokens = 0
         
-        for news in news_items:
+        for news in unique_news:
             title = news.get("title", "")
             summary = news.get("summary", "")[:100]  # 限制摘要长度
             
             item_text = f"{title}. {summary}"
+            item_tokens = counter.count(item_text)
             
-            if total_chars + len(item_text) <= max_chars:
+            if total_tokens + item_tokens <= max_tokens:
                 optimized.append(item_text)
-                total_chars += len(item_text)
+                total_tokens += item_tokens
             else:
                 break
         
         result = " | ".join(optimized)
         
-        logger.info(f"新闻输入优化: {len(news_items)} 条 -> {len(result)} 字符")
+        logger.info(f"新闻输入优化: {len(news_items)} 条（去重后 {len(unique_news)} 条） -> 约 {total_tokens} Token")
         
         return result
     
@@ -161,8 +220,453 @@ class CacheManager:
         """获取缓存统计信息"""
         return {
             "strategies": CacheManager.CACHE_STRATEGIES,
-            "description": "缓存策略配置"
+            "description": "缓存策略配置",
+            "memory_tier": analysis_cache.stats(),
+            "invalidation_policies": invalidation_engine.stats()
         }
 
+
+class InvalidationPolicy:
+    """
+    缓存失效策略基类
+    
+    drift() 返回缓存生成时与当前输入之间的漂移量，超过 threshold 视为显著变化。
+    快照缺失（旧版缓存）时返回 None，表示该策略不做判断。
+    """
+    
+    name = "base"
+    threshold = 0.0
+    
+    def drift(self, cached: Dict[str, Any], current: Dict[str, Any]) -> Optional[float]:
+        raise NotImplementedError
+    
+    def is_material(self, drift: float) -> bool:
+        return drift > self.threshold
+
+
+class NavChangePolicy(InvalidationPolicy):
+    """净值涨跌幅变化（百分点）"""
+    
+    name = "nav_change"
+    
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+    
+    def drift(self, cached: Dict[str, Any], current: Dict[str, Any]) -> Optional[float]:
+        if cached.get("daily_change_pct") is None:
+            return None
+        return abs(current["daily_change_pct"] - cached["daily_change_pct"])
+
+
+class VolatilityRegimePolicy(InvalidationPolicy):
+    """是否跨越波动阈值（DATA_CONFIG["volatility_threshold"]），跨越即失效"""
+    
+    name = "volatility_regime"
+    threshold = 0.0
+    
+    def drift(self, cached: Dict[str, Any], current: Dict[str, Any]) -> Optional[float]:
+        if cached.get("daily_change_pct") is None:
+            return None
+        limit = DATA_CONFIG["volatility_threshold"]
+        was_volatile = abs(cached["daily_change_pct"]) >= limit
+        is_volatile = abs(current["daily_change_pct"]) >= limit
+        return 1.0 if was_volatile != is_volatile else 0.0
+
+
+class HoldingMovePolicy(InvalidationPolicy):
+    """重仓股涨跌变化对净值贡献的累计漂移（百分点），持仓构成变化即失效"""
+    
+    name = "holding_move"
+    
+    def __init__(self, threshold: float = 0.3):
+        self.threshold = threshold
+    
+    def drift(self, cached: Dict[str, Any], current: Dict[str, Any]) -> Optional[float]:
+        if cached.get("holdings") is None or current.get("holdings") is None:
+            return None
+        before = {h["code"]: h for h in cached["holdings"]}
+        after = {h["code"]: h for h in current["holdings"]}
+        if before.keys() != after.keys():
+            return math.inf
+        return sum(
+            h["weight"] * abs(h["change"] - before[code]["change"]) / 100
+            for code, h in after.items()
+        )
+
+
+class NewsChangePolicy(InvalidationPolicy):
+    """相关新闻是否变化（比较新闻摘要指纹），出现新消息即失效"""
+    
+    name = "news_change"
+    threshold = 0.0
+    
+    def drift(self, cached: Dict[str, Any], current: Dict[str, Any]) -> Optional[float]:
+        if cached.get("news_digest") is None or current.get("news_digest") is None:
+            return None
+        return 0.0 if cached["news_digest"] == current["news_digest"] else 1.0
+
+
+class CacheInvalidationEngine:
+    """失效策略引擎：任一策略判定漂移显著即失效，并按策略统计命中率"""
+    
+    def __init__(self, policies: Optional[List[InvalidationPolicy]] = None):
+        self.policies: List[InvalidationPolicy] = list(policies or [])
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+    
+    def register(self, policy: InvalidationPolicy) -> None:
+        """注册策略（同名策略会被替换）"""
+        self.policies = [p for p in self.policies if p.name != policy.name] + [policy]
+    
+    def evaluate(self, cached: Dict[str, Any], current: Dict[str, Any]) -> Tuple[bool, Dict[str, float]]:
+        """
+        判断缓存分析是否仍可复用
+        
+        Args:
+            cached: 缓存的分析结果（读取其 input_snapshot，旧版缓存退回 daily_change_pct）
+            current: 当前输入快照（CacheManager.input_snapshot 的格式）
+        
+        Returns:
+            (是否可复用, 各策略漂移量)
+        """
+        snapshot = cached.get("input_snapshot") or {
+            "daily_change_pct": cached.get("daily_change_pct"),
+            "holdings": None,
+            "news_digest": None
+        }
+        
+        reusable = True
+        drifts: Dict[str, float] = {}
+        with self._lock:
+            for policy in self.policies:
+                drift = policy.drift(snapshot, current)
+                if drift is None:
+                    continue
+                drifts[policy.name] = drift
+                stats = self._stats.setdefault(policy.name, {"checks": 0, "invalidations": 0})
+                stats["checks"] += 1
+                if policy.is_material(drift):
+                    stats["invalidations"] += 1
+                    reusable = False
+        return reusable, drifts
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各策略的检查次数、失效次数与命中率"""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                checks = stats["checks"]
+                result[name] = {
+                    **stats,
+                    "hit_rate": round(1 - stats["invalidations"] / checks, 4) if checks else 0.0
+                }
+            return result
+
+
+class AnalysisCache:
+    """
+    两级分析缓存：进程内 LRU（L1，保存已解析的 dict）+ SQLite analysis_cache 表（L2）
+    
+    条目按 (基金代码, 分析类型, 输入指纹) 区分；L1 命中时既不访问磁盘也不重新
+    json.loads，L1 未命中时回源 L2 并回填。
+    """
+    
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict]]" = OrderedDict()
+        self._latest: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+    
+    @staticmethod
+    def ttl_hours(analysis_type: str) -> float:
+        """分析类型对应的 TTL（小时）"""
+        strategy = CacheManager.CACHE_STRATEGIES.get(analysis_type, {})
+        return strategy.get("ttl_hours", 1)
+    
+    def get(
+        self,
+        fund_code: str,
+        analysis_type: str,
+        max_age_hours: Optional[float] = None,
+        input_hash: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        读取分析结果
+        
+        Args:
+            fund_code: 基金代码
+            analysis_type: 分析类型
+            max_age_hours: 最大时效（小时），默认使用缓存策略 TTL
+            input_hash: 输入指纹，None 表示取该基金最新版本
+        
+        Returns:
+            分析结果字典（副本），未命中返回 None
+        """
+        ttl_seconds = self.ttl_hours(analysis_type) * 3600
+        max_age = ttl_seconds if max_age_hours is None else max_age_hours * 3600
+        now = time.time()
+        
+        with self._lock:
+            lookup_hash = input_hash
+            if lookup_hash is None:
+                lookup_hash = self._latest.get((fund_code, analysis_type))
+            if lookup_hash is not None:
+                key = (fund_code, analysis_type, lookup_hash)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    age = now - entry[0]
+                    if age <= max_age:
+                        self._entries.move_to_end(key)
+                        self._stats["l1_hits"] += 1
+                        return dict(entry[1])
+                    if age > ttl_seconds:
+                        self._remove(key)
+                        self._stats["expirations"] += 1
+        
+        row = get_cached_analysis_entry(fund_code, analysis_type, max_age / 3600, input_hash)
+        if row is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        
+        result, created_at, row_hash = row
+        data = json.loads(result)
+        created_ts = datetime.fromisoformat(created_at).timestamp()
+        with self._lock:
+            self._stats["l2_hits"] += 1
+            if now - created_ts <= ttl_seconds:
+                self._put((fund_code, analysis_type, row_hash), created_ts, data)
+        return dict(data)
+    
+    def set(
+        self,
+        fund_code: str,
+        analysis_type: str,
+        analysis: Dict,
+        input_hash: str = ""
+    ) -> None:
+        """写入 L1 并持久化到 L2"""
+        cache_analysis(fund_code, analysis_type, json.dumps(analysis), input_hash)
+        with self._lock:
+            self._put((fund_code, analysis_type, input_hash), time.time(), dict(analysis))
+    
+    def _put(self, key: Tuple[str, str, str], created_ts: float, data: Dict) -> None:
+        self._entries[key] = (created_ts, data)
+        self._entries.move_to_end(key)
+        latest_key = (key[0], key[1], self._latest.get((key[0], key[1])))
+        latest = self._entries.get(latest_key)
+        if latest is None or latest[0] <= created_ts:
+            self._latest[(key[0], key[1])] = key[2]
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+    
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        del self._entries[key]
+        if self._latest.get((key[0], key[1])) == key[2]:
+            del self._latest[(key[0], key[1])]
+    
+    def invalidate(self, fund_code: Optional[str] = None, analysis_type: Optional[str] = None) -> None:
+        """失效 L1 条目（不删除 L2 持久化数据）"""
+        with self._lock:
+            for key in list(self._entries):
+                if fund_code is not None and key[0] != fund_code:
+                    continue
+                if analysis_type is not None and key[1] != analysis_type:
+                    continue
+                self._remove(key)
+    
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 4) if lookups else 0.0
+        stats["l1_hit_rate"] = round(stats["l1_hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class _InFlightCall:
+    """进程内一次在途调用"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+
+
+class SingleFlight:
+    """
+    在途请求合并：相同 key 的并发调用只执行一次，其余调用方等待并共享结果
+    
+    进程内通过线程事件合并；跨进程通过 SQLite analysis_locks 表加锁，
+    未抢到锁的进程轮询 lookup（通常是缓存查询）直到结果落盘或锁过期。
+    执行期间后台线程按 HEARTBEAT_SECONDS 续期锁，耗时超过 TTL 的推理调用不会丢锁；
+    进程崩溃后停止续期，锁在 TTL 后过期。
+    """
+    
+    LOCK_TTL_SECONDS = 180          # 跨进程锁有效期（防止崩溃进程长期占锁）
+    HEARTBEAT_SECONDS = 60          # 持锁期间的续期间隔
+    POLL_INTERVAL_SECONDS = 0.5     # 跨进程等待时的轮询间隔
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._held: set = set()     # 当前进程持有的跨进程锁
+        self._heartbeat: Optional[threading.Thread] = None
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stats = {
+            "leaders": 0,
+            "thread_waits": 0,
+            "process_waits": 0,
+        }
+    
+    def acquire(self, key: str, lookup: Optional[Callable[[], Any]] = None) -> Tuple[bool, Any]:
+        """
+        申请执行权
+        
+        Args:
+            key: 合并键
+            lookup: 等待其他进程时用于获取其结果的查询函数
+        
+        Returns:
+            (是否由当前调用方执行, 其他调用方的结果)；为 True 时必须调用 release
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                is_leader = call is None
+                if is_leader:
+                    call = _InFlightCall()
+                    self._calls[key] = call
+                else:
+                    self._stats["thread_waits"] += 1
+            
+            if not is_leader:
+                call.event.wait(self.LOCK_TTL_SECONDS)
+                if call.result is not None:
+                    return False, call.result
+                # 执行方失败或放弃，重新竞争
+                continue
+            
+            try:
+                result = self._wait_for_other_process(key, lookup)
+            except Exception:
+                self._finish(key, None)
+                raise
+            if result is not None:
+                self._finish(key, result)
+                return False, result
+            
+            with self._lock:
+                self._stats["leaders"] += 1
+                self._held.add(key)
+                self._ensure_heartbeat()
+            return True, None
+    
+    def release(self, key: str, result: Any) -> None:
+        """
+        执行方发布结果并释放锁（result 为 None 表示失败，等待方将重新竞争）
+        
+        进程内的等待方立即拿到结果；跨进程锁的释放排在结果写入之后经后台批量写入提交，
+        其他进程拿到锁时已能查到结果，当前调用无需等待刷盘。
+        """
+        self._finish(key, result)
+        with self._lock:
+            self._held.discard(key)
+        release_lock_after_writes(key, self._owner)
+    
+    def run(self, key: str, compute: Callable[[], Any], lookup: Optional[Callable[[], Any]] = None) -> Any:
+        """执行 compute，相同 key 的并发调用共享同一次结果"""
+        is_leader, result = self.acquire(key, lookup)
+        if not is_leader:
+            return result
+        
+        result = None
+        try:
+            result = compute()
+        finally:
+            self.release(key, result)
+        return result
+    
+    def _wait_for_other_process(self, key: str, lookup: Optional[Callable[[], Any]]) -> Any:
+        waited = False
+        while not try_acquire_lock(key, self._owner, self.LOCK_TTL_SECONDS):
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._stats["process_waits"] += 1
+            if lookup is not None:
+                result = lookup()
+                if result is not None:
+                    return result
+            time.sleep(self.POLL_INTERVAL_SECONDS)
+        
+        # 拿到锁后再查一次，其他进程可能刚刚完成
+        if waited and lookup is not None:
+            result = lookup()
+            if result is not None:
+                release_lock(key, self._owner)
+                return result
+        return None
+    
+    def _ensure_heartbeat(self) -> None:
+        """启动续期线程（调用方持有 self._lock）"""
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            self._heartbeat = threading.Thread(
+                target=self._renew_loop, name="single-flight-heartbeat", daemon=True
+            )
+            self._heartbeat.start()
+    
+    def _renew_loop(self) -> None:
+        while True:
+            time.sleep(self.HEARTBEAT_SECONDS)
+            with self._lock:
+                keys = list(self._held)
+            for key in keys:
+                try:
+                    if not renew_lock(key, self._owner, self.LOCK_TTL_SECONDS):
+                        logger.warning(f"跨进程锁已丢失: {key}")
+                except Exception as e:
+                    logger.warning(f"跨进程锁续期失败: {key} {e}")
+    
+    def _finish(self, key: str, result: Any) -> None:
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call.result = result
+            call.event.set()
+    
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+# 进程级两级缓存
+analysis_cache = AnalysisCache()
+
+# 进程级在途请求合并
+single_flight = SingleFlight()
+
+# 进程级缓存失效策略引擎
+invalidation_engine = CacheInvalidationEngine([
+    VolatilityRegimePolicy(),
+    NavChangePolicy(),
+    HoldingMovePolicy(),
+    NewsChangePolicy(),
+])
+
 # 导出单例
 cache_manager = CacheManager()
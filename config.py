@@ -10,9 +10,21 @@ DB_PATH = PROJECT_ROOT / "deepinsight.db"
 
 # DeepSeek 配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
-DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")  # 可指向本地模拟服务
 DEEPSEEK_MODEL = "deepseek-reasoner"
 
+# DeepSeek HTTP 连接配置（进程内按 API Key + Base URL 复用客户端）
+HTTP_CONFIG = {
+    "connect_timeout": 10.0,            # 建立连接（含 TLS 握手）超时（秒）
+    "read_timeout": 300.0,              # 读取超时（R1 推理耗时较长）
+    "write_timeout": 30.0,
+    "pool_timeout": 30.0,               # 等待空闲连接超时
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 120.0,          # 空闲连接保活时间（秒）
+    "http2": True,                      # 安装 h2 时启用 HTTP/2
+}
+
 # 定价配置（RMB）
 PRICING = {
     "input": 0.55 / 1_000_000,      # ¥0.55 per 1M tokens
@@ -26,6 +38,13 @@ CACHE_CONFIG = {
     "news_summary_ttl": 7200,           # 2 小时
 }
 
+# 页面数据缓存（Streamlit 跨重跑、跨会话共享，收藏增删时主动失效）
+UI_CACHE_CONFIG = {
+    "favorites_ttl": 300,               # 收藏列表
+    "holdings_ttl": 3600,               # 重仓股持仓
+    "news_ttl": 600,                    # 行业新闻
+}
+
 # 数据获取配置
 DATA_CONFIG = {
     "use_mock_data": True,              # 默认使用模拟数据
@@ -34,6 +53,40 @@ DATA_CONFIG = {
     "max_holdings_display": 5,          # 最多显示持仓数
 }
 
+# Prompt 配置
+PROMPT_CONFIG = {
+    "max_input_tokens": 1500,           # 单次分析 Prompt 的 Token 预算
+    "max_holdings": 10,                 # 最多放入的重仓股数
+    "max_news": 6,                      # 最多放入的新闻数
+    "news_summary_chars": 100,          # 新闻摘要截断长度
+    "news_dedup_similarity": 0.8,       # 新闻标题相似度达到该值视为重复
+    "tokenizer_path": os.getenv("DEEPSEEK_TOKENIZER_PATH", ""),  # 可选：DeepSeek tokenizer.json
+}
+
+# 行情推送配置（quote_poller.py，实时净值/涨跌幅由后台轮询推送，不再按 TTL 缓存）
+QUOTE_CONFIG = {
+    "poll_interval": 15.0,              # 后台轮询周期（秒），也是看板局部刷新周期
+    "subscription_idle_timeout": 600.0, # 会话超过该时间未取更新即回收订阅（秒）
+}
+
+# 净值时间序列配置（nav_series.py）
+SERIES_CONFIG = {
+    "intraday_retention_days": 7,       # 日内点位保留天数，更早的压缩为日线
+    "daily_retention_days": 730,        # 日线保留天数
+    "retention_check_interval": 3600,   # 保留策略执行间隔（秒）
+    "default_bar_minutes": 5,           # 默认 K 线周期（分钟）
+}
+
+# 服务 API 配置（api_server.py）
+API_CONFIG = {
+    "host": os.getenv("DEEPINSIGHT_API_HOST", "127.0.0.1"),
+    "port": int(os.getenv("DEEPINSIGHT_API_PORT", "8000")),
+    "max_batch_size": 500,              # 单次批量请求最多基金数
+    "max_concurrent_requests": 16,      # 同时进行的研判请求数（单只与批量各占一个名额）
+    "queue_timeout": 10.0,              # 等待研判名额的最长时间（秒），超时返回 503
+    "batch_concurrency": 8,             # 单个批量请求内并发分析的基金数
+}
+
 # Streamlit 配置
 STREAMLIT_CONFIG = {
     "page_title": "DeepInsight 基金智投系统",
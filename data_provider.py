@@ -2,18 +2,213 @@
 数据提供者模块：从 AkShare 获取基金实时数据
 支持模拟数据以应对网络问题
 """
-import akshare as ak
-import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from io import StringIO
+import json
 import random
-from typing import Dict, Optional, List
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Optional, List, Iterable, Any, TYPE_CHECKING
 import logging
+from config import QUOTE_CONFIG
+from database import get_market_data, save_market_data, delete_market_data
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+
+def _akshare():
+    """延迟导入 AkShare（依赖树庞大，模拟模式与缓存命中时无需加载）"""
+    import akshare
+    return akshare
+
+
+class MarketDataCache:
+    """
+    AkShare 行情数据缓存
+    
+    - 按接口配置 TTL：持仓按季度更新，净值/行情按日内刷新
+    - 过期但仍在 stale 窗口内时先返回旧数据，后台异步刷新（stale-while-revalidate）；
+      上游失败时同样只退回 stale 窗口内的旧数据
+    - 结果持久化到 SQLite，重启后仍可复用；内存中按 LRU 最多保留 max_entries 个结果
+    - 相同接口、相同参数的并发请求合并为一次上游调用
+    """
+    
+    # 接口 TTL 配置（秒）：ttl 内视为新鲜，stale 内可先返回旧数据再后台刷新
+    # 实时行情的 ttl 不超过轮询周期且不返回过期数据，每次轮询都拿到上游最新值
+    ENDPOINT_TTLS = {
+        "fund_basic_info_sina": {"ttl": QUOTE_CONFIG["poll_interval"], "stale": 0},
+        "fund_portfolio_hold_sina": {"ttl": 7 * 86400, "stale": 120 * 86400},
+    }
+    DEFAULT_TTL = {"ttl": 300, "stale": 3600}
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()    # key -> (fetched_at, DataFrame)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="market-refresh")
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "errors": 0,
+            "evictions": 0,
+        }
+    
+    @staticmethod
+    def _cache_key(endpoint: str, params: Dict) -> str:
+        return f"{endpoint}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+    
+    def fetch(self, endpoint: str, **params) -> "pd.DataFrame":
+        """
+        获取 AkShare 接口数据（带缓存）
+        
+        Args:
+            endpoint: AkShare 函数名，如 fund_portfolio_hold_sina
+            **params: 接口参数
+        
+        Returns:
+            接口返回的 DataFrame
+        """
+        key = self._cache_key(endpoint, params)
+        policy = self.ENDPOINT_TTLS.get(endpoint, self.DEFAULT_TTL)
+        
+        entry = self._get_entry(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age <= policy["ttl"]:
+                self._count("hits")
+                return entry[1]
+            if age <= policy["stale"]:
+                self._count("stale_hits")
+                self._refresh_async(key, endpoint, params)
+                return entry[1]
+        
+        self._count("misses")
+        try:
+            return self._load(key, endpoint, params).result()
+        except Exception:
+            if entry is not None and time.time() - entry[0] <= policy["stale"]:
+                logger.warning(f"{endpoint} 刷新失败，返回过期数据")
+                return entry[1]
+            raise
+    
+    def _get_entry(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            return entry
+        
+        row = get_market_data(key)
+        if row is None:
+            return None
+        payload, fetched_at = row
+        import pandas as pd
+        df = pd.read_json(StringIO(payload), orient="split", dtype=False)
+        with self._lock:
+            entry = self._entries.get(key) or (fetched_at, df)
+            self._put(key, entry)
+        return entry
+    
+    def _put(self, key: str, entry: tuple) -> None:
+        """写入内存条目并按 LRU 淘汰（调用方持有 self._lock）"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+    
+    def _load(self, key: str, endpoint: str, params: Dict) -> Future:
+        """发起（或加入已在途的）上游请求"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future
+            future = Future()
+            self._inflight[key] = future
+        
+        try:
+            df = getattr(_akshare(), endpoint)(**params)
+            fetched_at = time.time()
+            with self._lock:
+                self._put(key, (fetched_at, df))
+            try:
+                save_market_data(key, endpoint, df.to_json(orient="split", force_ascii=False), fetched_at)
+            except Exception as e:
+                logger.warning(f"行情缓存持久化失败: {e}")
+            future.set_result(df)
+        except Exception as e:
+            self._count("errors")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future
+    
+    def _refresh_async(self, key: str, endpoint: str, params: Dict) -> None:
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._stats["refreshes"] += 1
+        self._refresher.submit(self._load, key, endpoint, params)
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+    
+    def invalidate(self, endpoint: Optional[str] = None, **params) -> None:
+        """
+        清除缓存条目（内存与持久化数据），下一次读取将请求上游
+        
+        Args:
+            endpoint: 接口名，None 表示全部
+            **params: 接口参数，提供时只清除该参数对应的条目
+        """
+        key = self._cache_key(endpoint, params) if endpoint is not None and params else None
+        with self._lock:
+            for existing in list(self._entries):
+                if key is not None:
+                    matched = existing == key
+                else:
+                    matched = endpoint is None or existing.startswith(f"{endpoint}:")
+                if matched:
+                    del self._entries[existing]
+        delete_market_data(endpoint, key)
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+# 进程级行情缓存
+market_data = MarketDataCache()
+
 class FundDataProvider:
     """基金数据提供者"""
     
+    # 批量行情并发配置
+    BATCH_MAX_WORKERS = 8           # 并发线程上限
+    BATCH_TIMEOUT_SECONDS = 10.0    # 整批超时时间
+    
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.RLock()
+    _inflight: Dict[tuple, Future] = {}     # (基金代码, 是否模拟) -> 执行中的获取任务
+    
     # 模拟数据库（用于演示）
     MOCK_DATA = {
         "005827": {
@@ -51,7 +246,7 @@ class FundDataProvider:
             
             # 尝试从 AkShare 获取
             try:
-                df = ak.fund_basic_info_sina(symbol=fund_code)
+                df = market_data.fetch("fund_basic_info_sina", symbol=fund_code)
                 if df.empty:
                     return FundDataProvider._get_mock_data(fund_code)
                 
@@ -72,9 +267,94 @@ class FundDataProvider:
             logger.error(f"获取基金数据失败: {e}")
             return None
     
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        """进程级共享线程池，避免每次重跑都新建线程"""
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=cls.BATCH_MAX_WORKERS,
+                        thread_name_prefix="fund-realtime"
+                    )
+        return cls._executor
+    
+    @classmethod
+    def get_funds_realtime(
+        cls,
+        fund_codes: Iterable[str],
+        use_mock: bool = False,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Optional[Dict]]:
+        """
+        并发批量获取基金实时数据
+        
+        Args:
+            fund_codes: 基金代码列表
+            use_mock: 是否使用模拟数据
+            timeout: 整批超时时间（秒），从调用时计时，排队中的基金同样受限
+        
+        Returns:
+            {基金代码: 实时数据}，超时或失败的基金对应 None（部分结果）
+        """
+        codes = list(dict.fromkeys(fund_codes))
+        timeout = cls.BATCH_TIMEOUT_SECONDS if timeout is None else timeout
+        results: Dict[str, Optional[Dict]] = {code: None for code in codes}
+        if not codes:
+            return results
+        
+        deadline = time.monotonic() + timeout
+        pending: Dict[Future, str] = {cls._submit_realtime(code, use_mock): code for code in codes}
+        
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                code = pending.pop(future)
+                try:
+                    results[code] = future.result()
+                except Exception as e:
+                    logger.warning(f"批量获取 {code} 失败: {e}")
+        
+        if pending:
+            # 尚在排队的任务直接取消；已在执行的无法中断，由 _submit_realtime 避免重复占用线程
+            for future in pending:
+                future.cancel()
+            logger.warning(
+                f"批量获取超时（{timeout}s），{len(pending)} 只基金未返回: {', '.join(pending.values())}"
+            )
+        
+        return results
+    
+    @classmethod
+    def _submit_realtime(cls, fund_code: str, use_mock: bool) -> Future:
+        """
+        提交单只基金的行情获取
+        
+        同一基金上一次获取仍在执行（例如上游挂起）时复用该任务，
+        挂起的请求最多占用一个工作线程，不会随轮询次数累积占满线程池。
+        """
+        key = (fund_code, use_mock)
+        with cls._executor_lock:
+            future = cls._inflight.get(key)
+            if future is not None and not future.done():
+                return future
+            future = cls._get_executor().submit(cls.get_fund_realtime, fund_code, use_mock)
+            cls._inflight[key] = future
+        future.add_done_callback(lambda f: cls._forget_inflight(key, f))
+        return future
+    
+    @classmethod
+    def _forget_inflight(cls, key: tuple, future: Future) -> None:
+        with cls._executor_lock:
+            if cls._inflight.get(key) is future:
+                del cls._inflight[key]
+    
     @staticmethod
     def _get_mock_data(fund_code: str) -> Dict:
-        """获取模拟数据"""
+        """获取模拟数据（带 is_mock 标记，真实模式下降级返回时也不会被当作真实净值记录）"""
         if fund_code not in FundDataProvider.MOCK_DATA:
             # 生成随机基金数据
             return {
@@ -83,7 +363,8 @@ class FundDataProvider:
                 "current_value": round(2.5 + random.random() * 2, 4),
                 "daily_change_pct": round((random.random() - 0.5) * 3, 2),
                 "daily_change_amount": round((random.random() - 0.5) * 0.1, 4),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                "is_mock": True
             }
         
         data = FundDataProvider.MOCK_DATA[fund_code]
@@ -96,31 +377,41 @@ class FundDataProvider:
             "daily_change_pct": round(data["daily_change"] + (random.random() - 0.5) * 0.3, 2),
             "daily_change_amount": round((data["daily_change"] / 100) * data["base_value"], 4),
             "timestamp": datetime.now().isoformat(),
-            "top_holdings": data["top_holdings"]
+            "top_holdings": data["top_holdings"],
+            "is_mock": True
         }
     
+    @staticmethod
+    def _get_mock_holdings(fund_code: str) -> List[Dict]:
+        """获取模拟持仓（与 _get_mock_data 一致，未知基金按代码生成固定的随机持仓）"""
+        if fund_code in FundDataProvider.MOCK_DATA:
+            return FundDataProvider.MOCK_DATA[fund_code].get("top_holdings", [])
+        
+        rng = random.Random(fund_code)
+        return [
+            {
+                "stock": f"股票{fund_code}-{i}",
+                "code": f"{600000 + rng.randrange(4000):06d}",
+                "weight": round(rng.uniform(2, 9), 1),
+                "change": round(rng.uniform(-3, 3), 2),
+            }
+            for i in range(5)
+        ]
+    
     @staticmethod
     def get_fund_holdings(fund_code: str, use_mock: bool = False) -> List[Dict]:
         """获取基金持仓"""
         try:
             if use_mock or fund_code in FundDataProvider.MOCK_DATA:
-                return FundDataProvider.MOCK_DATA[fund_code].get("top_holdings", [])
+                return FundDataProvider._get_mock_holdings(fund_code)
             
             # 尝试从 AkShare 获取
             try:
-                df = ak.fund_portfolio_hold_sina(symbol=fund_code)
+                df = market_data.fetch("fund_portfolio_hold_sina", symbol=fund_code)
                 if df.empty:
                     return FundDataProvider.MOCK_DATA[fund_code].get("top_holdings", [])
                 
-                holdings = []
-                for _, row in df.head(5).iterrows():
-                    holdings.append({
-                        "stock": row.get("stock_name", ""),
-                        "code": row.get("stock_code", ""),
-                        "weight": float(row.get("hold_ratio", 0)),
-                        "change": 0  # AkShare 可能不提供实时涨跌
-                    })
-                return holdings
+                return FundDataProvider._holdings_from_frame(df.head(5))
             except Exception as e:
                 logger.warning(f"AkShare 获取持仓失败，使用模拟数据: {e}")
                 return FundDataProvider.MOCK_DATA[fund_code].get("top_holdings", [])
@@ -162,32 +453,129 @@ class FundDataProvider:
         
         return mock_news[:3]  # 返回最近 3 条新闻
     
+    @staticmethod
+    def _holdings_from_frame(df: "pd.DataFrame") -> List[Dict]:
+        """AkShare 持仓表转换为持仓列表（按列整体转换，不逐行遍历）"""
+        import pandas as pd
+        holdings = pd.DataFrame({
+            "stock": df.get("stock_name", pd.Series("", index=df.index)).astype(str),
+            "code": df.get("stock_code", pd.Series("", index=df.index)).astype(str),
+            "weight": pd.to_numeric(
+                df.get("hold_ratio", pd.Series(0, index=df.index)), errors="coerce"
+            ).fillna(0.0),
+            "change": 0.0  # AkShare 可能不提供实时涨跌
+        })
+        return holdings.to_dict("records")
+    
+    @staticmethod
+    def contribution_matrix(
+        weights: Any,
+        changes: Any,
+        top_n: int = 5
+    ) -> Dict[str, np.ndarray]:
+        """
+        向量化计算多只基金的持仓贡献度
+        
+        Args:
+            weights: 持仓权重（%），形状 (基金数, 持仓数)，不足的位置用 NaN 或 0 填充
+            changes: 持仓涨跌幅（%），形状同 weights
+            top_n: 每只基金保留的贡献度绝对值前 N 名
+        
+        Returns:
+            contribution: 贡献度矩阵（%）
+            top_index / top_contribution: 每只基金前 N 名的列下标与贡献度
+            fund_contribution: 基金层面的合计贡献度
+            positive / negative: 正、负贡献合计
+            total_weight: 持仓权重合计
+        """
+        weights = np.nan_to_num(np.atleast_2d(np.asarray(weights, dtype=np.float64)))
+        changes = np.nan_to_num(np.atleast_2d(np.asarray(changes, dtype=np.float64)))
+        
+        # weight% × change% → 对净值的贡献（%）
+        contribution = weights * changes / 100
+        
+        top_n = min(top_n, contribution.shape[1])
+        top_index = np.argsort(-np.abs(contribution), axis=1, kind="stable")[:, :top_n]
+        
+        return {
+            "contribution": contribution,
+            "top_index": top_index,
+            "top_contribution": np.take_along_axis(contribution, top_index, axis=1),
+            "fund_contribution": contribution.sum(axis=1),
+            "positive": np.where(contribution > 0, contribution, 0.0).sum(axis=1),
+            "negative": np.where(contribution < 0, contribution, 0.0).sum(axis=1),
+            "total_weight": weights.sum(axis=1),
+        }
+    
+    @staticmethod
+    def calculate_contributions_frame(holdings: "pd.DataFrame", top_n: int = 5) -> Dict[str, "pd.DataFrame"]:
+        """
+        批量计算持仓贡献度（长表输入，适合全组合归因）
+        
+        Args:
+            holdings: 包含 fund_code、weight、change 列（可选 stock、code）的持仓表
+            top_n: 每只基金保留的贡献度前 N 名
+        
+        Returns:
+            holdings: 原表追加 contribution 列
+            top: 每只基金按贡献度绝对值排序的前 N 条持仓
+            funds: 基金层面汇总（合计/正/负贡献、权重合计、持仓数）
+        """
+        import pandas as pd
+        df = holdings.copy()
+        weight = df["weight"].to_numpy(dtype=np.float64, na_value=0.0)
+        change = df["change"].to_numpy(dtype=np.float64, na_value=0.0)
+        contribution = weight * change / 100
+        df["contribution"] = contribution
+        
+        abs_rank = pd.Series(-np.abs(contribution), index=df.index)
+        top = (
+            df.assign(_rank=abs_rank)
+            .sort_values(["fund_code", "_rank"], kind="stable")
+            .groupby("fund_code", sort=False)
+            .head(top_n)
+            .drop(columns="_rank")
+        )
+        
+        funds = (
+            df.assign(
+                positive=np.where(contribution > 0, contribution, 0.0),
+                negative=np.where(contribution < 0, contribution, 0.0)
+            )
+            .groupby("fund_code")
+            .agg(
+                fund_contribution=("contribution", "sum"),
+                positive=("positive", "sum"),
+                negative=("negative", "sum"),
+                total_weight=("weight", "sum"),
+                holdings_count=("weight", "size")
+            )
+        )
+        
+        return {"holdings": df, "top": top, "funds": funds}
+    
     @staticmethod
     def calculate_holding_contribution(fund_data: Dict, holdings: List[Dict]) -> List[Dict]:
         """计算重仓股对净值的贡献度"""
         if not holdings:
             return []
         
-        total_weight = sum(h.get("weight", 0) for h in holdings)
-        if total_weight == 0:
-            total_weight = 1
+        weights = np.fromiter((h.get("weight", 0) for h in holdings), dtype=np.float64, count=len(holdings))
+        changes = np.fromiter((h.get("change", 0) for h in holdings), dtype=np.float64, count=len(holdings))
+        
+        result = FundDataProvider.contribution_matrix(weights, changes, top_n=len(holdings))
         
+        # 按贡献度排序，输出与原有格式一致的字典视图
         contributions = []
-        for holding in holdings:
-            weight = holding.get("weight", 0) / 100  # 转换为小数
-            change_pct = holding.get("change", 0) / 100
-            contribution = weight * change_pct * 100  # 转换为百分比
-            
+        for idx, contribution in zip(result["top_index"][0], result["top_contribution"][0]):
+            holding = holdings[idx]
             contributions.append({
                 "stock": holding.get("stock", ""),
                 "code": holding.get("code", ""),
                 "weight": holding.get("weight", 0),
                 "change": holding.get("change", 0),
-                "contribution": round(contribution, 3)
+                "contribution": round(float(contribution), 3)
             })
-        
-        # 按贡献度排序
-        contributions.sort(key=lambda x: abs(x["contribution"]), reverse=True)
         return contributions
 
 # 导出单例
@@ -2,176 +2,1020 @@
 数据库管理模块：基金收藏、缓存、成本统计
 """
 import sqlite3
-import json
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
-import os
+from typing import List, Dict, Optional, Tuple, Iterator, Callable
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = Path(__file__).parent / "deepinsight.db"
 
+# 连接池配置
+POOL_CONFIG = {
+    "max_connections": 8,           # 最大连接数
+    "acquire_timeout": 10.0,        # 获取连接超时（秒）
+    "busy_timeout_ms": 5000,        # SQLite 锁等待时间
+    "cached_statements": 256,       # 预编译语句缓存数
+}
+
+# 后台批量写入配置（log_cost / cache_analysis）
+WRITE_BEHIND_CONFIG = {
+    "enabled": True,
+    "max_queue": 1000,              # 队列上限（满时调用方阻塞等待）
+    "put_timeout": 1.0,             # 队列满时最长等待（秒），超时改为同步写入
+    "flush_interval": 0.2,          # 合并写入的时间窗口（秒）
+    "max_batch": 200,               # 单个事务最多写入条数
+}
+
+# 每只基金、每种分析类型保留的缓存版本数（按输入指纹区分）
+MAX_CACHE_VERSIONS = 5
+
+# 连接级 PRAGMA（WAL 允许读写并发，NORMAL 同步在 WAL 下仍保证一致性）
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=67108864",
+)
+
+
+class ConnectionPool:
+    """SQLite 连接池：复用长连接，避免每次查询都重新 connect/close"""
+
+    def __init__(self, db_path: Path, max_connections: int = POOL_CONFIG["max_connections"]):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._stats = {
+            "connections_created": 0,
+            "acquisitions": 0,
+            "connect_time_ms": 0.0,
+            "wait_time_ms": 0.0,
+            "hold_time_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "timeouts": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建并调优一条新连接"""
+        start = time.perf_counter()
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=POOL_CONFIG["busy_timeout_ms"] / 1000,
+            check_same_thread=False,
+            cached_statements=POOL_CONFIG["cached_statements"],
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute(f"PRAGMA busy_timeout={POOL_CONFIG['busy_timeout_ms']}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["connections_created"] += 1
+            self._stats["connect_time_ms"] += elapsed_ms
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.max_connections:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=POOL_CONFIG["acquire_timeout"])
+                except queue.Empty:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise TimeoutError("等待数据库连接超时")
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["acquisitions"] += 1
+            self._stats["wait_time_ms"] += wait_ms
+            self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一条连接；正常退出时提交，异常时回滚"""
+        conn = self._acquire()
+        start = time.perf_counter()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            hold_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats["hold_time_ms"] += hold_ms
+            self._release(conn)
+
+    def close(self) -> None:
+        """关闭所有空闲连接（借出中的连接在归还时关闭）"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict:
+        """连接池耗时统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_connections"] = self._created
+        stats["idle_connections"] = self._idle.qsize()
+        acquisitions = max(1, stats["acquisitions"])
+        stats["avg_wait_ms"] = round(stats["wait_time_ms"] / acquisitions, 4)
+        stats["avg_hold_ms"] = round(stats["hold_time_ms"] / acquisitions, 4)
+        return stats
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """获取进程级连接池（DB_PATH 变化时自动重建）"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.db_path == DB_PATH:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.db_path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def close_pool() -> None:
+    """关闭进程级连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_connection():
+    """从连接池借出连接（上下文管理器）"""
+    return get_pool().connection()
+
+
+def get_pool_stats() -> Dict:
+    """获取连接池统计"""
+    return get_pool().stats()
+
+class WriteBehindWriter:
+    """
+    后台批量写入：调用方只入队，后台线程按时间窗口把多条写入合并为一个事务
+    
+    队列有界，满时调用方阻塞（背压），超时后改为同步写入以保证不丢数据；
+    进程退出时通过 atexit 刷盘。
+    """
+    
+    def __init__(self, config: Dict = WRITE_BEHIND_CONFIG):
+        self.config = config
+        self._queue: "queue.Queue[Tuple[Callable, tuple]]" = queue.Queue(maxsize=config["max_queue"])
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()      # flush/shutdown 时跳过合并窗口立即写入
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "flush_time_ms": 0.0,
+            "max_queue_depth": 0,
+            "blocked_puts": 0,
+            "blocked_time_ms": 0.0,
+            "sync_fallbacks": 0,
+            "errors": 0,
+        }
+    
+    def submit(self, write: Callable, *args) -> None:
+        """提交一次写入：write(conn, *args) 将在后台事务中执行"""
+        self._ensure_started()
+        item = (write, args)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            try:
+                self._queue.put(item, timeout=self.config["put_timeout"])
+            except queue.Full:
+                with self._lock:
+                    self._stats["sync_fallbacks"] += 1
+                with get_connection() as conn:
+                    write(conn, *args)
+                return
+            finally:
+                with self._lock:
+                    self._stats["blocked_puts"] += 1
+                    self._stats["blocked_time_ms"] += (time.perf_counter() - start) * 1000
+        
+        with self._lock:
+            self._stats["enqueued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+    
+    def flush(self) -> None:
+        """阻塞直到已入队的写入全部落盘"""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return
+        self._wake.set()
+        self._queue.join()
+    
+    def shutdown(self) -> None:
+        """停止后台线程并刷盘"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=10)
+        self._drain()
+    
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+                self._thread.start()
+    
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.config["flush_interval"])
+            except queue.Empty:
+                continue
+            # 等待一个时间窗口，让同一波写入合并进同一个事务（积压已满一批或有人等待刷盘时直接写）
+            if self._queue.qsize() < self.config["max_batch"] - 1:
+                self._wake.wait(self.config["flush_interval"])
+            self._write_batch([first] + self._take(self.config["max_batch"] - 1))
+            if self._queue.empty() and not self._stop.is_set():
+                self._wake.clear()
+        self._drain()
+    
+    def _take(self, limit: int) -> List[Tuple[Callable, tuple]]:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+    
+    def _drain(self) -> None:
+        while True:
+            batch = self._take(self.config["max_batch"])
+            if not batch:
+                return
+            self._write_batch(batch)
+    
+    def _write_batch(self, batch: List[Tuple[Callable, tuple]]) -> None:
+        start = time.perf_counter()
+        try:
+            try:
+                with get_connection() as conn:
+                    for write, args in batch:
+                        write(conn, *args)
+            except Exception as e:
+                # 整批失败时逐条重试，避免一条坏数据拖累整批
+                logger.warning(f"批量写入失败，改为逐条写入: {e}")
+                for write, args in batch:
+                    try:
+                        with get_connection() as conn:
+                            write(conn, *args)
+                    except Exception as item_error:
+                        logger.error(f"写入失败: {item_error}")
+                        with self._lock:
+                            self._stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+                self._stats["flush_time_ms"] += (time.perf_counter() - start) * 1000
+            for _ in batch:
+                self._queue.task_done()
+    
+    def stats(self) -> Dict:
+        """背压与刷盘统计"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        flushes = max(1, stats["flushes"])
+        stats["avg_batch_size"] = round(stats["written"] / flushes, 2)
+        stats["avg_flush_ms"] = round(stats["flush_time_ms"] / flushes, 3)
+        return stats
+
+
+_writer = WriteBehindWriter()
+atexit.register(_writer.shutdown)
+
+
+def submit_write(write: Callable, *args) -> None:
+    """按配置后台批量写入或立即写入"""
+    if WRITE_BEHIND_CONFIG["enabled"]:
+        _writer.submit(write, *args)
+    else:
+        with get_connection() as conn:
+            write(conn, *args)
+
+
+def flush_writes() -> None:
+    """等待后台写入全部落盘"""
+    _writer.flush()
+
+
+def get_write_behind_stats() -> Dict:
+    """获取后台写入统计"""
+    return _writer.stats()
+
 def init_database():
     """初始化数据库表结构"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # 基金收藏表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS favorites (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code TEXT UNIQUE NOT NULL,
+                fund_name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 缓存表（用于 DeepSeek 分析结果，input_hash 为输入指纹）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code TEXT NOT NULL,
+                analysis_type TEXT NOT NULL,
+                input_hash TEXT NOT NULL DEFAULT '',
+                result TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, analysis_type, input_hash)
+            )
+        """)
+        _migrate_analysis_cache(cursor)
+        # 指纹已包含基金代码，不再按指纹跨基金查找
+        cursor.execute("DROP INDEX IF EXISTS idx_analysis_cache_hash")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analysis_cache_latest
+            ON analysis_cache (fund_code, analysis_type, created_at)
+        """)
+        
+        # 分析锁表（跨进程合并相同的在途 DeepSeek 调用）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_locks (
+                lock_key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        
+        # 行情数据缓存表（AkShare 接口结果，重启后仍可复用）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS market_data_cache (
+                cache_key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        
+        # 成本统计表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cost_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                tokens_used INTEGER DEFAULT 0,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                estimated_cost REAL DEFAULT 0.0,
+                operation_type TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        _migrate_cost_log(cursor)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cost_log_date ON cost_log (date)")
+        
+        # 成本汇总表（log_cost 增量维护，看板只读汇总表）
+        for table, period in (("cost_daily", "date"), ("cost_hourly", "hour")):
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {period} TEXT NOT NULL,
+                    operation_type TEXT NOT NULL DEFAULT '',
+                    calls INTEGER DEFAULT 0,
+                    tokens_used INTEGER DEFAULT 0,
+                    input_tokens INTEGER DEFAULT 0,
+                    output_tokens INTEGER DEFAULT 0,
+                    cached_tokens INTEGER DEFAULT 0,
+                    estimated_cost REAL DEFAULT 0.0,
+                    PRIMARY KEY ({period}, operation_type)
+                )
+            """)
+            _add_missing_columns(cursor, table, ("cached_tokens",))
+        _backfill_cost_rollups(cursor)
+        
+        # 缓存效率遥测（按日、基金、分析类型汇总查找结果与实测节省）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_telemetry (
+                date TEXT NOT NULL,
+                fund_code TEXT NOT NULL,
+                analysis_type TEXT NOT NULL,
+                hits INTEGER DEFAULT 0,
+                misses INTEGER DEFAULT 0,
+                bypasses INTEGER DEFAULT 0,
+                prewarms INTEGER DEFAULT 0,
+                tokens_avoided INTEGER DEFAULT 0,
+                cost_avoided REAL DEFAULT 0.0,
+                latency_avoided_ms REAL DEFAULT 0.0,
+                PRIMARY KEY (date, fund_code, analysis_type)
+            )
+        """)
+        _add_missing_columns(cursor, "cache_telemetry", ("prewarms",))
+        
+        # 日内净值时间序列（只追加，按 (基金, 时间) 聚簇存储，ts 为 Unix 时间戳）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS nav_ticks (
+                fund_code TEXT NOT NULL,
+                ts REAL NOT NULL,
+                nav REAL NOT NULL,
+                change_pct REAL,
+                PRIMARY KEY (fund_code, ts)
+            ) WITHOUT ROWID
+        """)
+        
+        # 日线（超出日内保留期的 nav_ticks 压缩为每日 OHLC）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS nav_daily (
+                fund_code TEXT NOT NULL,
+                date TEXT NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                change_pct REAL,
+                ticks INTEGER DEFAULT 0,
+                PRIMARY KEY (fund_code, date)
+            ) WITHOUT ROWID
+        """)
+
+def _migrate_cost_log(cursor: sqlite3.Cursor) -> None:
+    """旧版 cost_log 没有输入/输出/缓存命中 Token 列，补齐"""
+    _add_missing_columns(cursor, "cost_log", ("input_tokens", "output_tokens", "cached_tokens"))
+
+def _add_missing_columns(cursor: sqlite3.Cursor, table: str, columns: Tuple[str, ...]) -> None:
+    """为旧表补齐整数计数列"""
+    existing = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    for column in columns:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER DEFAULT 0")
+
+def _backfill_cost_rollups(cursor: sqlite3.Cursor) -> None:
+    """
+    汇总表为空而明细表有数据时（升级后首次启动），从明细表回填
     
-    # 基金收藏表
+    旧版明细的 created_at 是 SQLite CURRENT_TIMESTAMP（UTC，不带时区），先转为本地时间再按小时分桶；
+    新版明细写入带时区偏移的本地时间，前 13 个字符即本地小时。date 列新旧版本都是本地日期。
+    """
+    if cursor.execute("SELECT 1 FROM cost_daily LIMIT 1").fetchone():
+        return
+    if not cursor.execute("SELECT 1 FROM cost_log LIMIT 1").fetchone():
+        return
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS favorites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fund_code TEXT UNIQUE NOT NULL,
-            fund_name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        INSERT INTO cost_daily (date, operation_type, calls, tokens_used, input_tokens, output_tokens,
+                                cached_tokens, estimated_cost)
+        SELECT date, COALESCE(operation_type, ''), COUNT(*), SUM(tokens_used),
+               SUM(input_tokens), SUM(output_tokens), SUM(cached_tokens), SUM(estimated_cost)
+        FROM cost_log GROUP BY date, COALESCE(operation_type, '')
+    """)
+    cursor.execute("""
+        INSERT INTO cost_hourly (hour, operation_type, calls, tokens_used, input_tokens, output_tokens,
+                                 cached_tokens, estimated_cost)
+        SELECT hour, operation_type, COUNT(*), SUM(tokens_used),
+               SUM(input_tokens), SUM(output_tokens), SUM(cached_tokens), SUM(estimated_cost)
+        FROM (
+            SELECT CASE WHEN length(created_at) = 19
+                        THEN strftime('%Y-%m-%d %H', created_at, 'localtime')
+                        ELSE substr(created_at, 1, 13) END AS hour,
+                   COALESCE(operation_type, '') AS operation_type,
+                   tokens_used, input_tokens, output_tokens, cached_tokens, estimated_cost
+            FROM cost_log
         )
+        GROUP BY hour, operation_type
     """)
-    
-    # 缓存表（用于 DeepSeek 分析结果）
+
+def _migrate_analysis_cache(cursor: sqlite3.Cursor) -> None:
+    """旧版 analysis_cache 以 (fund_code, analysis_type) 唯一，迁移为带 input_hash 的多版本表"""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(analysis_cache)")]
+    if "input_hash" in columns:
+        return
+    cursor.execute("ALTER TABLE analysis_cache RENAME TO analysis_cache_old")
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS analysis_cache (
+        CREATE TABLE analysis_cache (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             fund_code TEXT NOT NULL,
             analysis_type TEXT NOT NULL,
+            input_hash TEXT NOT NULL DEFAULT '',
             result TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(fund_code, analysis_type)
+            UNIQUE(fund_code, analysis_type, input_hash)
         )
     """)
-    
-    # 成本统计表
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cost_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            tokens_used INTEGER DEFAULT 0,
-            estimated_cost REAL DEFAULT 0.0,
-            operation_type TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        INSERT INTO analysis_cache (fund_code, analysis_type, input_hash, result, created_at)
+        SELECT fund_code, analysis_type, '', result, created_at FROM analysis_cache_old
     """)
-    
-    conn.commit()
-    conn.close()
+    cursor.execute("DROP TABLE analysis_cache_old")
 
 def add_favorite(fund_code: str, fund_name: str) -> bool:
     """添加收藏基金"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO favorites (fund_code, fund_name) VALUES (?, ?)",
-            (fund_code, fund_name)
-        )
-        conn.commit()
-        conn.close()
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT INTO favorites (fund_code, fund_name) VALUES (?, ?)",
+                (fund_code, fund_name)
+            )
         return True
     except sqlite3.IntegrityError:
         return False
 
 def remove_favorite(fund_code: str) -> bool:
     """删除收藏基金"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM favorites WHERE fund_code = ?", (fund_code,))
-    conn.commit()
-    conn.close()
-    return cursor.rowcount > 0
+    with get_connection() as conn:
+        cursor = conn.execute("DELETE FROM favorites WHERE fund_code = ?", (fund_code,))
+        return cursor.rowcount > 0
 
 def get_favorites() -> List[Dict]:
     """获取所有收藏基金"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT fund_code, fund_name FROM favorites ORDER BY created_at DESC")
-    rows = cursor.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT fund_code, fund_name FROM favorites ORDER BY created_at DESC"
+        ).fetchall()
     return [{"code": row[0], "name": row[1]} for row in rows]
 
-def cache_analysis(fund_code: str, analysis_type: str, result: str) -> None:
-    """缓存分析结果"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT OR REPLACE INTO analysis_cache (fund_code, analysis_type, result, created_at)
-        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-    """, (fund_code, analysis_type, result))
-    conn.commit()
-    conn.close()
+def cache_analysis(fund_code: str, analysis_type: str, result: str, input_hash: str = "") -> None:
+    """缓存分析结果（同一基金按输入指纹保留多个版本）"""
+    # created_at 使用本地时间 ISO 格式，与读取时的截止时间保持同一格式
+    submit_write(
+        _write_cache_analysis,
+        fund_code, analysis_type, result, input_hash, datetime.now().isoformat()
+    )
 
-def get_cached_analysis(fund_code: str, analysis_type: str, max_age_hours: int = 1) -> Optional[str]:
-    """获取缓存的分析结果（检查时效性）"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _write_cache_analysis(
+    conn: sqlite3.Connection,
+    fund_code: str,
+    analysis_type: str,
+    result: str,
+    input_hash: str,
+    created_at: str
+) -> None:
+    conn.execute("""
+        INSERT OR REPLACE INTO analysis_cache (fund_code, analysis_type, input_hash, result, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (fund_code, analysis_type, input_hash, result, created_at))
+    conn.execute("""
+        DELETE FROM analysis_cache
+        WHERE fund_code = ? AND analysis_type = ? AND id NOT IN (
+            SELECT id FROM analysis_cache
+            WHERE fund_code = ? AND analysis_type = ?
+            ORDER BY created_at DESC LIMIT ?
+        )
+    """, (fund_code, analysis_type, fund_code, analysis_type, MAX_CACHE_VERSIONS))
+
+def get_cached_analysis_entry(
+    fund_code: str,
+    analysis_type: str,
+    max_age_hours: float = 1,
+    input_hash: Optional[str] = None
+) -> Optional[Tuple[str, str, str]]:
+    """
+    获取缓存的分析结果 (result, created_at, input_hash)
     
+    input_hash 为 None 时返回该基金最新的一个版本，否则精确匹配输入指纹。
+    """
     cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-    cursor.execute("""
-        SELECT result FROM analysis_cache 
-        WHERE fund_code = ? AND analysis_type = ? AND created_at > ?
-    """, (fund_code, analysis_type, cutoff_time.isoformat()))
-    
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+    with get_connection() as conn:
+        if input_hash is None:
+            row = conn.execute("""
+                SELECT result, created_at, input_hash FROM analysis_cache 
+                WHERE fund_code = ? AND analysis_type = ? AND created_at > ?
+                ORDER BY created_at DESC LIMIT 1
+            """, (fund_code, analysis_type, cutoff_time.isoformat())).fetchone()
+        else:
+            row = conn.execute("""
+                SELECT result, created_at, input_hash FROM analysis_cache 
+                WHERE fund_code = ? AND analysis_type = ? AND input_hash = ? AND created_at > ?
+            """, (fund_code, analysis_type, input_hash, cutoff_time.isoformat())).fetchone()
+    return (row[0], row[1], row[2]) if row else None
 
-def log_cost(tokens_used: int, estimated_cost: float, operation_type: str = "analysis") -> None:
-    """记录成本消耗"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def get_cached_analysis(fund_code: str, analysis_type: str, max_age_hours: int = 1) -> Optional[str]:
+    """获取缓存的分析结果（检查时效性）"""
+    entry = get_cached_analysis_entry(fund_code, analysis_type, max_age_hours)
+    return entry[0] if entry else None
+
+def save_market_data(cache_key: str, endpoint: str, payload: str, fetched_at: float) -> None:
+    """持久化行情接口结果"""
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO market_data_cache (cache_key, endpoint, payload, fetched_at)
+            VALUES (?, ?, ?, ?)
+        """, (cache_key, endpoint, payload, fetched_at))
+
+def get_market_data(cache_key: str) -> Optional[Tuple[str, float]]:
+    """读取持久化的行情接口结果 (payload, fetched_at)"""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT payload, fetched_at FROM market_data_cache WHERE cache_key = ?",
+            (cache_key,)
+        ).fetchone()
+    return (row[0], row[1]) if row else None
+
+def delete_market_data(endpoint: Optional[str] = None, cache_key: Optional[str] = None) -> None:
+    """删除持久化的行情接口结果（按缓存键、按接口或全部）"""
+    with get_connection() as conn:
+        if cache_key is not None:
+            conn.execute("DELETE FROM market_data_cache WHERE cache_key = ?", (cache_key,))
+        elif endpoint is not None:
+            conn.execute("DELETE FROM market_data_cache WHERE endpoint = ?", (endpoint,))
+        else:
+            conn.execute("DELETE FROM market_data_cache")
+
+def try_acquire_lock(lock_key: str, owner: str, ttl_seconds: float) -> bool:
+    """尝试获取跨进程锁（过期锁视为已释放）"""
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute(
+            "DELETE FROM analysis_locks WHERE lock_key = ? AND expires_at < ?",
+            (lock_key, now)
+        )
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO analysis_locks (lock_key, owner, expires_at) VALUES (?, ?, ?)",
+            (lock_key, owner, now + ttl_seconds)
+        )
+        return cursor.rowcount == 1
+
+def renew_lock(lock_key: str, owner: str, ttl_seconds: float) -> bool:
+    """续期自己持有的跨进程锁，返回锁是否仍由自己持有"""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "UPDATE analysis_locks SET expires_at = ? WHERE lock_key = ? AND owner = ?",
+            (time.time() + ttl_seconds, lock_key, owner)
+        )
+        return cursor.rowcount == 1
+
+def release_lock(lock_key: str, owner: str) -> None:
+    """释放跨进程锁（只释放自己持有的锁）"""
+    with get_connection() as conn:
+        _write_release_lock(conn, lock_key, owner)
+
+def release_lock_after_writes(lock_key: str, owner: str) -> None:
+    """
+    经后台批量写入释放跨进程锁
     
-    cursor.execute("""
-        INSERT INTO cost_log (date, tokens_used, estimated_cost, operation_type)
-        VALUES (?, ?, ?, ?)
-    """, (today, tokens_used, estimated_cost, operation_type))
+    排在此前提交的写入（如分析结果）之后提交，其他进程拿到锁时结果已经落盘，
+    调用方无需等待 flush_writes()。
+    """
+    submit_write(_write_release_lock, lock_key, owner)
+
+def _write_release_lock(conn: sqlite3.Connection, lock_key: str, owner: str) -> None:
+    conn.execute(
+        "DELETE FROM analysis_locks WHERE lock_key = ? AND owner = ?",
+        (lock_key, owner)
+    )
+
+def log_cost(
+    tokens_used: int,
+    estimated_cost: float,
+    operation_type: str = "analysis",
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cached_tokens: int = 0
+) -> None:
+    """
+    记录成本消耗（同一事务内更新日/小时汇总表）
     
-    conn.commit()
-    conn.close()
+    cached_tokens 为输入中命中服务端上下文缓存的 Token 数（已包含在 input_tokens 内）
+    """
+    submit_write(
+        _write_cost, datetime.now(), tokens_used, estimated_cost,
+        operation_type or "", input_tokens, output_tokens, cached_tokens
+    )
+
+def _write_cost(
+    conn: sqlite3.Connection,
+    now: datetime,
+    tokens_used: int,
+    estimated_cost: float,
+    operation_type: str,
+    input_tokens: int,
+    output_tokens: int,
+    cached_tokens: int
+) -> None:
+    today = now.strftime("%Y-%m-%d")
+    hour = now.strftime("%Y-%m-%d %H")
+    conn.execute("""
+        INSERT INTO cost_log (date, tokens_used, input_tokens, output_tokens, cached_tokens,
+                              estimated_cost, operation_type, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (today, tokens_used, input_tokens, output_tokens, cached_tokens, estimated_cost, operation_type,
+          now.astimezone().isoformat(sep=" ", timespec="seconds")))
+    for table, period, key in (("cost_daily", "date", today), ("cost_hourly", "hour", hour)):
+        conn.execute(f"""
+            INSERT INTO {table} ({period}, operation_type, calls, tokens_used, input_tokens, output_tokens,
+                                 cached_tokens, estimated_cost)
+            VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT ({period}, operation_type) DO UPDATE SET
+                calls = calls + 1,
+                tokens_used = tokens_used + excluded.tokens_used,
+                input_tokens = input_tokens + excluded.input_tokens,
+                output_tokens = output_tokens + excluded.output_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens,
+                estimated_cost = estimated_cost + excluded.estimated_cost
+        """, (key, operation_type, tokens_used, input_tokens, output_tokens, cached_tokens, estimated_cost))
 
 def get_today_cost() -> Tuple[int, float]:
     """获取今日累计成本"""
     today = datetime.now().strftime("%Y-%m-%d")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT SUM(tokens_used), SUM(estimated_cost) FROM cost_log WHERE date = ?
-    """, (today,))
-    
-    row = cursor.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        row = conn.execute("""
+            SELECT SUM(tokens_used), SUM(estimated_cost) FROM cost_daily WHERE date = ?
+        """, (today,)).fetchone()
     
     tokens = row[0] or 0
     cost = row[1] or 0.0
     return tokens, cost
 
+def get_today_usage(operation_type: str) -> Tuple[int, int]:
+    """获取某类操作今日的调用次数与 Token 消耗（读取前先落盘待写成本）"""
+    flush_writes()
+    today = datetime.now().strftime("%Y-%m-%d")
+    with get_connection() as conn:
+        row = conn.execute("""
+            SELECT calls, tokens_used FROM cost_daily WHERE date = ? AND operation_type = ?
+        """, (today, operation_type)).fetchone()
+    
+    if row is None:
+        return 0, 0
+    return row[0] or 0, row[1] or 0
+
 def get_cost_history(days: int = 7) -> List[Dict]:
     """获取成本历史"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT date, SUM(tokens_used), SUM(estimated_cost) 
+            FROM cost_daily 
+            WHERE date >= ?
+            GROUP BY date
+            ORDER BY date DESC
+        """, (start_date,)).fetchall()
     
+    return [{"date": row[0], "tokens": row[1] or 0, "cost": row[2] or 0.0} for row in rows]
+
+def get_cost_breakdown(days: int = 7) -> List[Dict]:
+    """按操作类型拆分的成本汇总（含输入/输出及缓存命中 Token）"""
     start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-    cursor.execute("""
-        SELECT date, SUM(tokens_used), SUM(estimated_cost) 
-        FROM cost_log 
-        WHERE date >= ?
-        GROUP BY date
-        ORDER BY date DESC
-    """, (start_date,))
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT operation_type, SUM(calls), SUM(tokens_used), SUM(input_tokens),
+                   SUM(output_tokens), SUM(estimated_cost), SUM(cached_tokens)
+            FROM cost_daily
+            WHERE date >= ?
+            GROUP BY operation_type
+            ORDER BY SUM(estimated_cost) DESC
+        """, (start_date,)).fetchall()
     
-    rows = cursor.fetchall()
-    conn.close()
+    return [
+        {
+            "operation_type": row[0],
+            "calls": row[1] or 0,
+            "tokens": row[2] or 0,
+            "input_tokens": row[3] or 0,
+            "output_tokens": row[4] or 0,
+            "cached_tokens": row[6] or 0,
+            "cost": row[5] or 0.0
+        }
+        for row in rows
+    ]
+
+def get_hourly_cost(hours: int = 24) -> List[Dict]:
+    """最近 N 小时的逐小时成本"""
+    start_hour = (datetime.now() - timedelta(hours=hours)).strftime("%Y-%m-%d %H")
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT hour, SUM(calls), SUM(tokens_used), SUM(estimated_cost)
+            FROM cost_hourly
+            WHERE hour >= ?
+            GROUP BY hour
+            ORDER BY hour DESC
+        """, (start_hour,)).fetchall()
     
-    return [{"date": row[0], "tokens": row[1] or 0, "cost": row[2] or 0.0} for row in rows]
+    return [{"hour": row[0], "calls": row[1] or 0, "tokens": row[2] or 0, "cost": row[3] or 0.0} for row in rows]
+
+CACHE_OUTCOMES = ("hit", "miss", "bypass", "prewarm")
+
+def record_cache_event(
+    fund_code: str,
+    analysis_type: str,
+    outcome: str,
+    tokens_avoided: int = 0,
+    cost_avoided: float = 0.0,
+    latency_avoided_ms: float = 0.0
+) -> None:
+    """
+    记录一次缓存查找结果（hit / miss / bypass / prewarm），命中时附带实测节省
+    
+    prewarm 为后台预热的强制刷新，单独计数，不计入查找次数与命中率
+    """
+    if outcome not in CACHE_OUTCOMES:
+        raise ValueError(f"未知的缓存查找结果: {outcome}")
+    submit_write(
+        _write_cache_event, datetime.now().strftime("%Y-%m-%d"), fund_code, analysis_type,
+        outcome, tokens_avoided, cost_avoided, latency_avoided_ms
+    )
+
+def _write_cache_event(
+    conn: sqlite3.Connection,
+    today: str,
+    fund_code: str,
+    analysis_type: str,
+    outcome: str,
+    tokens_avoided: int,
+    cost_avoided: float,
+    latency_avoided_ms: float
+) -> None:
+    counters = {"hits": 0, "misses": 0, "bypasses": 0, "prewarms": 0}
+    counters[{"hit": "hits", "miss": "misses", "bypass": "bypasses", "prewarm": "prewarms"}[outcome]] = 1
+    conn.execute("""
+        INSERT INTO cache_telemetry (date, fund_code, analysis_type, hits, misses, bypasses, prewarms,
+                                     tokens_avoided, cost_avoided, latency_avoided_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (date, fund_code, analysis_type) DO UPDATE SET
+            hits = hits + excluded.hits,
+            misses = misses + excluded.misses,
+            bypasses = bypasses + excluded.bypasses,
+            prewarms = prewarms + excluded.prewarms,
+            tokens_avoided = tokens_avoided + excluded.tokens_avoided,
+            cost_avoided = cost_avoided + excluded.cost_avoided,
+            latency_avoided_ms = latency_avoided_ms + excluded.latency_avoided_ms
+    """, (today, fund_code, analysis_type, counters["hits"], counters["misses"], counters["bypasses"],
+          counters["prewarms"], tokens_avoided, cost_avoided, latency_avoided_ms))
+
+def get_cache_telemetry(days: int = 7, group_by: str = "fund") -> List[Dict]:
+    """
+    缓存效率汇总
+    
+    Args:
+        days: 统计最近 N 天
+        group_by: fund（按基金 + 分析类型）、date（按日）或 type（按分析类型）
+    """
+    columns = {
+        "fund": "fund_code, analysis_type",
+        "date": "date",
+        "type": "analysis_type",
+    }[group_by]
+    start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    with get_connection() as conn:
+        cursor = conn.execute(f"""
+            SELECT {columns}, SUM(hits), SUM(misses), SUM(bypasses), SUM(prewarms),
+                   SUM(tokens_avoided), SUM(cost_avoided), SUM(latency_avoided_ms)
+            FROM cache_telemetry
+            WHERE date >= ?
+            GROUP BY {columns}
+            ORDER BY {columns}
+        """, (start_date,))
+        keys = [desc[0] for desc in cursor.description]
+        rows = cursor.fetchall()
+    
+    keys[-7:] = ["hits", "misses", "bypasses", "prewarms", "tokens_avoided", "cost_avoided", "latency_avoided_ms"]
+    results = []
+    for row in rows:
+        item = dict(zip(keys, row))
+        lookups = item["hits"] + item["misses"] + item["bypasses"]
+        item["lookups"] = lookups
+        item["hit_rate"] = round(item["hits"] / lookups, 4) if lookups else 0.0
+        results.append(item)
+    return results
+
+def save_nav_points(points: List[Tuple[str, float, float, Optional[float]]]) -> None:
+    """批量追加净值点 (fund_code, ts, nav, change_pct)，同一基金同一时刻重复写入时忽略"""
+    if points:
+        submit_write(_write_nav_points, points)
+
+def _write_nav_points(conn: sqlite3.Connection, points: List[Tuple[str, float, float, Optional[float]]]) -> None:
+    conn.executemany(
+        "INSERT OR IGNORE INTO nav_ticks (fund_code, ts, nav, change_pct) VALUES (?, ?, ?, ?)",
+        points
+    )
+
+def get_nav_points(fund_code: str, start_ts: float, end_ts: float) -> List[Tuple[float, float, Optional[float]]]:
+    """按时间范围读取净值点 [(ts, nav, change_pct)]，按时间升序（左闭右开）；读取前先落盘待写点位"""
+    flush_writes()
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT ts, nav, change_pct FROM nav_ticks
+            WHERE fund_code = ? AND ts >= ? AND ts < ?
+            ORDER BY ts
+        """, (fund_code, start_ts, end_ts)).fetchall()
+
+def get_nav_daily(fund_code: str, start_date: str, end_date: str) -> List[Dict]:
+    """按日期范围读取日线（含两端）；读取前先落盘待写的点位与压缩"""
+    flush_writes()
+    with get_connection() as conn:
+        cursor = conn.execute("""
+            SELECT date, open, high, low, close, change_pct, ticks FROM nav_daily
+            WHERE fund_code = ? AND date >= ? AND date <= ?
+            ORDER BY date
+        """, (fund_code, start_date, end_date))
+        keys = [desc[0] for desc in cursor.description]
+        return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+def compact_nav_ticks(before_ts: float) -> None:
+    """把 before_ts 之前的净值点按本地日期压缩进 nav_daily 后删除"""
+    submit_write(_compact_nav_ticks, before_ts)
+
+def _compact_nav_ticks(conn: sqlite3.Connection, before_ts: float) -> None:
+    # 压缩按时间向前推进，同一天再次压缩的点一定晚于已压缩的点：保留原开盘，收盘取新值
+    conn.execute("""
+        INSERT INTO nav_daily (fund_code, date, open, high, low, close, change_pct, ticks)
+        SELECT g.fund_code, g.day,
+               (SELECT nav FROM nav_ticks f WHERE f.fund_code = g.fund_code AND f.ts = g.first_ts),
+               g.high, g.low,
+               l.nav, l.change_pct, g.ticks
+        FROM (
+            SELECT fund_code, date(ts, 'unixepoch', 'localtime') AS day,
+                   MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                   MAX(nav) AS high, MIN(nav) AS low, COUNT(*) AS ticks
+            FROM nav_ticks
+            WHERE ts < ?
+            GROUP BY fund_code, day
+        ) g
+        JOIN nav_ticks l ON l.fund_code = g.fund_code AND l.ts = g.last_ts
+        WHERE true
+        ON CONFLICT (fund_code, date) DO UPDATE SET
+            high = MAX(high, excluded.high),
+            low = MIN(low, excluded.low),
+            close = excluded.close,
+            change_pct = excluded.change_pct,
+            ticks = ticks + excluded.ticks
+    """, (before_ts,))
+    conn.execute("DELETE FROM nav_ticks WHERE ts < ?", (before_ts,))
+
+def prune_nav_daily(before_date: str) -> None:
+    """删除 before_date 之前的日线"""
+    submit_write(_prune_nav_daily, before_date)
+
+def _prune_nav_daily(conn: sqlite3.Connection, before_date: str) -> None:
+    conn.execute("DELETE FROM nav_daily WHERE date < ?", (before_date,))
 
 def clear_old_cache(days: int = 7) -> None:
     """清理过期缓存"""
     cutoff_time = datetime.now() - timedelta(days=days)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "DELETE FROM analysis_cache WHERE created_at < ?",
-        (cutoff_time.isoformat(),)
-    )
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute(
+            "DELETE FROM analysis_cache WHERE created_at < ?",
+            (cutoff_time.isoformat(),)
+        )
 
 # 初始化数据库
 if not DB_PATH.exists():
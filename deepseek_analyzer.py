@@ -2,37 +2,160 @@
 DeepSeek-R1 分析引擎：深度研判与思考过程展示
 集成成本控制和缓存机制
 """
+import asyncio
 import os
-import json
-from typing import Dict, Optional, Tuple, List
-from openai import OpenAI
+import threading
+import time
+from typing import Dict, Optional, Tuple, List, Iterator, Any, Callable, TYPE_CHECKING
 from datetime import datetime
 import logging
-from database import cache_analysis, get_cached_analysis, log_cost
+from config import DEEPSEEK_BASE_URL, HTTP_CONFIG, DATA_CONFIG
+from database import log_cost
+from cache_manager import CacheManager, analysis_cache, single_flight, invalidation_engine
+from prompt_compiler import prompt_compiler, PromptBudgetExceeded
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
+# 进程级客户端注册表：(api_key, base_url) -> OpenAI
+_clients: Dict[Tuple[str, str], "OpenAI"] = {}
+_clients_lock = threading.Lock()
+
+# 异步客户端按事件循环区分：(api_key, base_url, id(loop)) -> (loop, AsyncOpenAI)
+_async_clients: Dict[Tuple[str, str, int], Tuple[asyncio.AbstractEventLoop, "AsyncOpenAI"]] = {}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_client(api_key: str, base_url: str = DEEPSEEK_BASE_URL) -> "OpenAI":
+    """
+    获取进程内共享的 OpenAI 客户端
+    
+    相同 API Key 与 Base URL 复用同一个客户端及其 HTTP 连接池（keep-alive，
+    安装 h2 时启用 HTTP/2），重复分析无需重新进行 TLS 握手。
+    httpx 与 openai 在首次创建客户端时才导入，模拟模式下不会加载。
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+            http_client = httpx.Client(**_http_client_options())
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _clients[key] = client
+            logger.info(f"创建 DeepSeek 客户端: {base_url}")
+        return client
+
+
+def get_async_client(api_key: str, base_url: str = DEEPSEEK_BASE_URL) -> "AsyncOpenAI":
+    """
+    获取当前事件循环共享的 AsyncOpenAI 客户端（须在事件循环中调用）
+    
+    与 get_client 使用相同的 HTTP_CONFIG 超时与连接池配置。异步连接池绑定创建它的
+    事件循环，因此按循环区分；已关闭循环的客户端在下次创建时清理。
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url, id(loop))
+    with _clients_lock:
+        entry = _async_clients.get(key)
+        if entry is not None and entry[0] is loop:
+            return entry[1]
+        import httpx
+        from openai import AsyncOpenAI
+        for stale in [k for k, (owner, _) in _async_clients.items() if owner.is_closed()]:
+            del _async_clients[stale]
+        client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url,
+            http_client=httpx.AsyncClient(**_http_client_options())
+        )
+        _async_clients[key] = (loop, client)
+        logger.info(f"创建 DeepSeek 异步客户端: {base_url}")
+        return client
+
+
+def _http_client_options() -> Dict[str, Any]:
+    """httpx 客户端参数（同步与异步客户端共用）"""
+    import httpx
+    return {
+        "http2": HTTP_CONFIG["http2"] and _http2_available(),
+        "timeout": httpx.Timeout(
+            connect=HTTP_CONFIG["connect_timeout"],
+            read=HTTP_CONFIG["read_timeout"],
+            write=HTTP_CONFIG["write_timeout"],
+            pool=HTTP_CONFIG["pool_timeout"]
+        ),
+        "limits": httpx.Limits(
+            max_connections=HTTP_CONFIG["max_connections"],
+            max_keepalive_connections=HTTP_CONFIG["max_keepalive_connections"],
+            keepalive_expiry=HTTP_CONFIG["keepalive_expiry"]
+        ),
+    }
+
+
+def close_clients() -> None:
+    """关闭所有共享客户端的连接池"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+async def close_async_clients() -> None:
+    """关闭当前事件循环的异步客户端"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        keys = [key for key, (owner, _) in _async_clients.items() if owner is loop]
+        clients = [_async_clients.pop(key)[1] for key in keys]
+    for client in clients:
+        await client.close()
+
+
 class DeepSeekAnalyzer:
     """DeepSeek-R1 分析器"""
     
     # 定价信息（基于 DeepSeek 官方）
     PRICING = {
         "input": 0.55 / 1_000_000,      # ¥0.55 per 1M tokens
+        "input_cached": 0.14 / 1_000_000,   # ¥0.14 per 1M tokens（命中上下文缓存）
         "output": 2.19 / 1_000_000,     # ¥2.19 per 1M tokens
     }
     
+    # 成本记录的操作类型：预热调用单独记账，便于按日核算预热预算
+    OPERATION_ANALYSIS = "deepseek_analysis"
+    OPERATION_PREWARM = "prewarm"
+    
     def __init__(self, api_key: Optional[str] = None):
         """初始化分析器"""
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
-        self.client = None
+        self._client = None
         self.total_tokens_today = 0
         self.total_cost_today = 0.0
-        
-        if self.api_key:
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url="https://api.deepseek.com"
-            )
+    
+    @property
+    def client(self) -> Optional["OpenAI"]:
+        """API 客户端（首次真正调用 API 时创建；未配置 API Key 时为 None）"""
+        if self._client is None and self.api_key:
+            self._client = get_client(self.api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, value: Optional["OpenAI"]) -> None:
+        self._client = value
+    
+    @property
+    def remote_available(self) -> bool:
+        """是否可以调用 DeepSeek（不创建客户端，模拟模式下不会导入 SDK）"""
+        return self._client is not None or bool(self.api_key)
     
     def analyze_fund_movement(
         self,
@@ -42,7 +165,8 @@ class DeepSeekAnalyzer:
         holdings_contribution: List[Dict],
         news_items: List[Dict],
         use_cache: bool = True,
-        use_mock: bool = False
+        use_mock: bool = False,
+        operation_type: str = OPERATION_ANALYSIS
     ) -> Dict:
         """
         分析基金波动
@@ -55,38 +179,183 @@ class DeepSeekAnalyzer:
             news_items: 相关新闻列表
             use_cache: 是否使用缓存
             use_mock: 是否使用模拟数据
+            operation_type: 成本记录的操作类型（后台预热传 OPERATION_PREWARM）
         
         Returns:
             分析结果字典
+        
+        Raises:
+            PromptBudgetExceeded: Prompt 固定部分超出 Token 预算（不降级、不写缓存）
+        """
+        input_hash, result = self.prepare(
+            fund_code, fund_name, daily_change_pct,
+            holdings_contribution, news_items, use_cache, use_mock, operation_type
+        )
+        if result is not None:
+            return result
+        
+        # 调用 DeepSeek-R1（相同基金、相同输入的并发调用只发起一次）
+        return single_flight.run(
+            self.flight_key(fund_code, input_hash),
+            lambda: self._deepseek_analysis(
+                fund_code, fund_name, daily_change_pct,
+                holdings_contribution, news_items, input_hash, operation_type
+            ),
+            lookup=self.flight_lookup(fund_code, input_hash)
+        )
+    
+    def stream_fund_movement(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict],
+        use_cache: bool = True,
+        use_mock: bool = False
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        流式分析基金波动
+        
+        参数与 analyze_fund_movement 相同。依次产出 (事件类型, 内容)：
+        - ("reasoning", str): 思考过程增量
+        - ("content", str): 分析结果增量
+        - ("done", Dict): 完整分析结果（已记录成本并写入缓存）
+        
+        缓存命中或本地分析时只产出一个 "done" 事件。Prompt 超出 Token 预算时抛出 PromptBudgetExceeded。
         """
+        input_hash, result = self.prepare(
+            fund_code, fund_name, daily_change_pct,
+            holdings_contribution, news_items, use_cache, use_mock
+        )
+        if result is not None:
+            yield "done", result
+            return
+        
+        # 已有相同的在途调用时等待其结果，否则由当前调用方流式执行
+        key = self.flight_key(fund_code, input_hash)
+        is_leader, result = single_flight.acquire(key, self.flight_lookup(fund_code, input_hash))
+        if not is_leader:
+            yield "done", result
+            return
+        
+        analysis = None
+        try:
+            for event, payload in self._deepseek_analysis_stream(
+                fund_code, fund_name, daily_change_pct,
+                holdings_contribution, news_items, input_hash
+            ):
+                if event == "done":
+                    analysis = payload
+                yield event, payload
+        finally:
+            single_flight.release(key, analysis)
+    
+    def prepare(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict],
+        use_cache: bool = True,
+        use_mock: bool = False,
+        operation_type: str = OPERATION_ANALYSIS
+    ) -> Tuple[str, Optional[Dict]]:
+        """
+        调用 DeepSeek 之前的公共步骤：计算输入指纹、查找缓存（记录遥测），
+        波动不大、模拟模式或未配置 API Key 时直接做本地分析
+        
+        同步、流式与批量研判共用。
+        
+        Returns:
+            (输入指纹, 分析结果)；分析结果为 None 表示需要调用 DeepSeek
+        """
+        # 输入指纹：持仓或新闻变化后不会命中旧报告
+        input_hash = CacheManager.fingerprint_inputs(
+            fund_code, daily_change_pct, holdings_contribution, news_items
+        )
         
-        # 检查缓存
         if use_cache:
-            cached = get_cached_analysis(fund_code, "movement_analysis")
+            cached = self._lookup_cache(
+                fund_code, fund_name, input_hash, daily_change_pct, holdings_contribution, news_items
+            )
             if cached:
-                logger.info(f"使用缓存分析: {fund_code}")
-                return json.loads(cached)
+                return input_hash, cached
+        else:
+            # 预热的强制刷新单独计数，不拉低命中率
+            outcome = "prewarm" if operation_type == self.OPERATION_PREWARM else "bypass"
+            CacheManager.record_lookup(fund_code, "movement_analysis", outcome)
         
         # 如果波动不大或无 API Key，使用本地分析
-        if abs(daily_change_pct) < 1.5 or use_mock or not self.client:
-            return self._local_analysis(
+        if abs(daily_change_pct) < DATA_CONFIG["volatility_threshold"] or use_mock or not self.remote_available:
+            return input_hash, self.local_analysis(
                 fund_code, fund_name, daily_change_pct,
-                holdings_contribution, news_items
+                holdings_contribution, news_items, input_hash
             )
+        return input_hash, None
+    
+    @staticmethod
+    def flight_key(fund_code: str, input_hash: str) -> str:
+        """在途请求合并键"""
+        return f"movement_analysis:{fund_code}:{input_hash}"
+    
+    @staticmethod
+    def flight_lookup(fund_code: str, input_hash: str) -> Callable[[], Optional[Dict]]:
+        """等待其他进程时的结果查询：只接受本次等待开始后写入的缓存"""
+        started = time.time()
         
-        # 调用 DeepSeek-R1
-        return self._deepseek_analysis(
-            fund_code, fund_name, daily_change_pct,
-            holdings_contribution, news_items
-        )
+        def lookup() -> Optional[Dict]:
+            max_age_hours = (time.time() - started) / 3600
+            return analysis_cache.get(
+                fund_code, "movement_analysis",
+                max_age_hours=max_age_hours, input_hash=input_hash
+            )
+        
+        return lookup
     
-    def _local_analysis(
+    def _lookup_cache(
         self,
         fund_code: str,
         fund_name: str,
+        input_hash: str,
         daily_change_pct: float,
         holdings_contribution: List[Dict],
         news_items: List[Dict]
+    ) -> Optional[Dict]:
+        """
+        按输入指纹查找缓存；指纹不同但漂移不显著时复用最近一次分析
+        
+        每次查找都会记录到缓存遥测（hit / miss / bypass）
+        """
+        cached = analysis_cache.get(fund_code, "movement_analysis", input_hash=input_hash)
+        if cached:
+            logger.info(f"使用缓存分析: {fund_code}")
+            CacheManager.record_lookup(fund_code, "movement_analysis", "hit", cached)
+            return cached
+        
+        # 输入有变化时由失效策略判断漂移是否显著
+        latest = analysis_cache.get(fund_code, "movement_analysis")
+        if latest:
+            current = CacheManager.input_snapshot(daily_change_pct, holdings_contribution, news_items)
+            reusable, drifts = invalidation_engine.evaluate(latest, current)
+            if reusable:
+                logger.info(f"输入漂移不显著，复用最近分析: {fund_code} {drifts}")
+                CacheManager.record_lookup(fund_code, "movement_analysis", "hit", latest)
+                return latest
+        
+        # 有缓存但被失效策略否决记为 bypass，否则为 miss
+        CacheManager.record_lookup(fund_code, "movement_analysis", "bypass" if latest else "miss")
+        return None
+    
+    def local_analysis(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict],
+        input_hash: str = ""
     ) -> Dict:
         """本地分析（无需调用 API）"""
         
@@ -94,10 +363,11 @@ class DeepSeekAnalyzer:
         top_contributor = holdings_contribution[0] if holdings_contribution else None
         
         # 判断波动性质
+        threshold = DATA_CONFIG["volatility_threshold"]
         if abs(daily_change_pct) < 0.5:
             volatility_type = "低波动"
             assessment = "市场情绪平稳，基金表现稳定"
-        elif abs(daily_change_pct) < 1.5:
+        elif abs(daily_change_pct) < threshold:
             volatility_type = "正常波动"
             assessment = "市场波动正常，持仓结构未发生重大变化"
         else:
@@ -124,10 +394,11 @@ class DeepSeekAnalyzer:
 """,
             "top_contributor": top_contributor,
             "assessment": assessment,
-            "risk_warning": "无明显风险信号" if abs(daily_change_pct) < 1.5 else "建议关注市场风险",
+            "risk_warning": "无明显风险信号" if abs(daily_change_pct) < threshold else "建议关注市场风险",
             "recommendation": "继续持有" if daily_change_pct > -1 else "建议评估",
             "tokens_used": 0,
             "estimated_cost": 0.0,
+            "input_snapshot": CacheManager.input_snapshot(daily_change_pct, holdings_contribution, news_items),
             "is_cached": False,
             "is_mock": True
         }
@@ -147,11 +418,11 @@ class DeepSeekAnalyzer:
 """
         
         # 缓存结果
-        cache_analysis(fund_code, "movement_analysis", json.dumps(analysis))
+        analysis_cache.set(fund_code, "movement_analysis", analysis, input_hash)
         
         return analysis
     
-    def _deepseek_analysis(
+    def build_prompt(
         self,
         fund_code: str,
         fund_name: str,
@@ -159,120 +430,230 @@ class DeepSeekAnalyzer:
         holdings_contribution: List[Dict],
         news_items: List[Dict]
     ) -> Dict:
-        """调用 DeepSeek-R1 进行深度分析"""
+        """
+        构建 DeepSeek Prompt（在 Token 预算内按相关性装配持仓与新闻）
         
-        # 准备输入数据
-        holdings_text = "\\n".join([
-            f"- {h['stock']} ({h['code']}): 权重 {h['weight']:.1f}%, 涨跌 {h['change']:+.2f}%, 贡献 {h['contribution']:+.3f}%"
-            for h in holdings_contribution[:5]
-        ])
+        Returns:
+            PromptCompiler.compile 的结果，prompt 字段为 Prompt 文本
         
-        news_text = "\\n".join([
-            f"- [{n['source']}] {n['title']}: {n['summary'][:100]}"
-            for n in news_items[:3]
-        ])
+        Raises:
+            PromptBudgetExceeded: Prompt 超出 Token 预算
+        """
+        compiled = prompt_compiler.compile(
+            fund_code, fund_name, daily_change_pct, holdings_contribution, news_items
+        )
+        logger.info(
+            f"Prompt 编译完成: {fund_code} 约 {compiled['prompt_tokens']}/{compiled['max_tokens']} Token, "
+            f"持仓 {compiled['holdings_used']}/{compiled['holdings_total']}, "
+            f"新闻 {compiled['news_used']}/{compiled['news_total']}（去重 {compiled['duplicates_removed']}）"
+        )
+        return compiled
+    
+    @staticmethod
+    def cached_prompt_tokens(usage: Any) -> int:
+        """
+        响应中命中服务端上下文缓存的输入 Token 数
         
-        prompt = f"""
-你是一位资深的基金研究分析师。请对以下基金进行深度分析，展示你的思考过程。
-
-## 基金信息
-- 基金代码: {fund_code}
-- 基金名称: {fund_name}
-- 日涨跌幅: {daily_change_pct:+.2f}%
-
-## 重仓股贡献度
-{holdings_text}
-
-## 相关新闻（过去12小时）
-{news_text}
-
-## 分析要求
-1. 深度分析这个波动是"情绪噪音"还是"基本面反转"
-2. 检查是否存在"隐形持仓变动"（估值与持仓走势背离）
-3. 给出明确的投资建议
-
-## 输出格式
-请按以下格式输出：
-
-### 思考过程
-[详细的分析思路]
-
-### 波动性质判断
-[情绪噪音/基本面反转/混合信号]
-
-### 持仓变动评估
-[是否存在隐形变动，有什么证据]
-
-### 风险提示
-[主要风险点]
-
-### 投资建议
-[具体建议]
-"""
+        DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 兼容接口返回 prompt_tokens_details.cached_tokens
+        """
+        if usage is None:
+            return 0
+        hit = getattr(usage, "prompt_cache_hit_tokens", None)
+        if hit is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            hit = getattr(details, "cached_tokens", None) if details is not None else None
+        return int(hit or 0)
+    
+    def finalize_analysis(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        thinking: str,
+        content: str,
+        input_tokens: int,
+        output_tokens: int,
+        input_hash: str,
+        latency_ms: float,
+        ttft_ms: Optional[float] = None,
+        input_snapshot: Optional[Dict] = None,
+        prompt_tokens_estimated: Optional[int] = None,
+        cached_tokens: int = 0,
+        operation_type: str = OPERATION_ANALYSIS
+    ) -> Dict:
+        """计算成本、记录成本并缓存分析结果（cached_tokens 为命中上下文缓存的输入 Token）"""
+        total_tokens = input_tokens + output_tokens
+        
+        input_cost = (
+            (input_tokens - cached_tokens) * self.PRICING["input"]
+            + cached_tokens * self.PRICING["input_cached"]
+        )
+        output_cost = output_tokens * self.PRICING["output"]
+        total_cost = input_cost + output_cost
+        
+        # 记录成本
+        log_cost(
+            total_tokens, total_cost, operation_type,
+            input_tokens, output_tokens, cached_tokens
+        )
+        
+        # 构建分析结果
+        analysis = {
+            "fund_code": fund_code,
+            "fund_name": fund_name,
+            "analysis_time": datetime.now().isoformat(),
+            "daily_change_pct": daily_change_pct,
+            "thinking_process": thinking,
+            "analysis_result": content,
+            "tokens_used": total_tokens,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
+            "prompt_tokens_estimated": prompt_tokens_estimated,
+            "estimated_cost": round(total_cost, 4),
+            "latency_ms": round(latency_ms, 1),
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "input_snapshot": input_snapshot,
+            "is_cached": False,
+            "is_mock": False
+        }
+        
+        # 缓存结果
+        analysis_cache.set(fund_code, "movement_analysis", analysis, input_hash)
+        
+        return analysis
+    
+    def _deepseek_analysis(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict],
+        input_hash: str = "",
+        operation_type: str = OPERATION_ANALYSIS
+    ) -> Dict:
+        """调用 DeepSeek-R1 进行深度分析"""
         
         try:
+            compiled = self.build_prompt(
+                fund_code, fund_name, daily_change_pct,
+                holdings_contribution, news_items
+            )
+            
             # 调用 DeepSeek API
-            response = self.client.messages.create(
+            start = time.perf_counter()
+            response = self.client.chat.completions.create(
                 model="deepseek-reasoner",
                 max_tokens=8000,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+                messages=compiled["messages"]
             )
+            latency_ms = (time.perf_counter() - start) * 1000
             
             # 提取思考过程和回复
-            thinking = ""
-            content = ""
-            
-            for block in response.content:
-                if block.type == "thinking":
-                    thinking = block.thinking
-                elif block.type == "text":
-                    content = block.text
-            
-            # 计算成本
-            input_tokens = response.usage.input_tokens
-            output_tokens = response.usage.output_tokens
-            total_tokens = input_tokens + output_tokens
+            message = response.choices[0].message
+            thinking = getattr(message, "reasoning_content", None) or ""
+            content = message.content or ""
             
-            input_cost = input_tokens * self.PRICING["input"]
-            output_cost = output_tokens * self.PRICING["output"]
-            total_cost = input_cost + output_cost
+            return self.finalize_analysis(
+                fund_code, fund_name, daily_change_pct,
+                thinking, content,
+                response.usage.prompt_tokens, response.usage.completion_tokens,
+                input_hash, latency_ms,
+                input_snapshot=CacheManager.input_snapshot(daily_change_pct, holdings_contribution, news_items),
+                prompt_tokens_estimated=compiled["prompt_tokens"],
+                cached_tokens=self.cached_prompt_tokens(response.usage),
+                operation_type=operation_type
+            )
             
-            # 记录成本
-            log_cost(total_tokens, total_cost, "deepseek_analysis")
+        except PromptBudgetExceeded:
+            # 输入本身超出预算，本地分析结果不能代替研判写入缓存，交由调用方处理
+            raise
+        except Exception as e:
+            logger.error(f"DeepSeek API 调用失败: {e}")
+            # 降级到本地分析
+            return self.local_analysis(
+                fund_code, fund_name, daily_change_pct,
+                holdings_contribution, news_items, input_hash
+            )
+    
+    def _deepseek_analysis_stream(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict],
+        input_hash: str = ""
+    ) -> Iterator[Tuple[str, Any]]:
+        """流式调用 DeepSeek-R1，记录首 Token 时间与总耗时"""
+        
+        thinking_parts: List[str] = []
+        content_parts: List[str] = []
+        usage = None
+        ttft_ms = None
+        
+        try:
+            compiled = self.build_prompt(
+                fund_code, fund_name, daily_change_pct,
+                holdings_contribution, news_items
+            )
             
-            # 构建分析结果
-            analysis = {
-                "fund_code": fund_code,
-                "fund_name": fund_name,
-                "analysis_time": datetime.now().isoformat(),
-                "daily_change_pct": daily_change_pct,
-                "thinking_process": thinking,
-                "analysis_result": content,
-                "tokens_used": total_tokens,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "estimated_cost": round(total_cost, 4),
-                "is_cached": False,
-                "is_mock": False
-            }
+            start = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                model="deepseek-reasoner",
+                max_tokens=8000,
+                messages=compiled["messages"],
+                stream=True,
+                stream_options={"include_usage": True}
+            )
             
-            # 缓存结果
-            cache_analysis(fund_code, "movement_analysis", json.dumps(analysis))
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                reasoning = getattr(delta, "reasoning_content", None)
+                text = delta.content
+                if (reasoning or text) and ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                if reasoning:
+                    thinking_parts.append(reasoning)
+                    yield "reasoning", reasoning
+                if text:
+                    content_parts.append(text)
+                    yield "content", text
             
-            return analysis
+            latency_ms = (time.perf_counter() - start) * 1000
             
+        except PromptBudgetExceeded:
+            # 输入本身超出预算，本地分析结果不能代替研判写入缓存，交由调用方处理
+            raise
         except Exception as e:
-            logger.error(f"DeepSeek API 调用失败: {e}")
+            logger.error(f"DeepSeek 流式调用失败: {e}")
             # 降级到本地分析
-            return self._local_analysis(
+            yield "done", self.local_analysis(
                 fund_code, fund_name, daily_change_pct,
-                holdings_contribution, news_items
+                holdings_contribution, news_items, input_hash
             )
+            return
+        
+        thinking = "".join(thinking_parts)
+        content = "".join(content_parts)
+        input_tokens = usage.prompt_tokens if usage else 0
+        output_tokens = usage.completion_tokens if usage else 0
+        
+        logger.info(f"DeepSeek 流式分析完成: {fund_code} 首 Token {ttft_ms}ms, 总耗时 {latency_ms:.0f}ms")
+        
+        yield "done", self.finalize_analysis(
+            fund_code, fund_name, daily_change_pct,
+            thinking, content, input_tokens, output_tokens,
+            input_hash, latency_ms, ttft_ms,
+            input_snapshot=CacheManager.input_snapshot(daily_change_pct, holdings_contribution, news_items),
+            prompt_tokens_estimated=compiled["prompt_tokens"],
+            cached_tokens=self.cached_prompt_tokens(usage)
+        )
     
     def get_analysis_summary(self, analysis: Dict) -> str:
         """获取分析摘要"""
@@ -0,0 +1,283 @@
+"""
+持仓快照存储：按报告期保存全量基金持仓的列式文件
+每列一个 .npy 文件，读取时内存映射，按基金切片不复制数据
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, List, Iterable, Tuple
+import logging
+
+import numpy as np
+import pandas as pd
+
+from data_provider import FundDataProvider, market_data
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = Path(__file__).parent / "holdings_store"
+
+
+class HoldingsStore:
+    """
+    持仓快照列式存储
+
+    目录结构：<root>/<报告期>/
+    - CURRENT：当前版本目录名，整体替换时原子改写
+    - v<纳秒时间戳>/：一个版本的快照
+      - weight.npy / stock_code.npy / stock_name.npy：按基金代码排序的列
+      - index.json：基金代码 -> [起始行, 结束行)
+
+    旧版布局（列文件直接位于报告期目录）仍可读取，下一次写入时迁移。
+    """
+
+    CURRENT_FILE = "CURRENT"
+
+    COLUMNS = {
+        "stock_code": "U16",
+        "stock_name": "U32",
+        "weight": "float64",
+    }
+
+    def __init__(self, root: Path = STORE_PATH):
+        self.root = Path(root)
+        # 报告期 -> (版本目录, 索引, 内存映射列)
+        self._snapshots: Dict[str, Tuple[Path, Dict[str, List[int]], Dict[str, np.ndarray]]] = {}
+        self._lock = threading.Lock()
+
+    def report_dates(self) -> List[str]:
+        """已存储的报告期（升序）"""
+        if not self.root.exists():
+            return []
+        return sorted(
+            p.name for p in self.root.iterdir()
+            if p.is_dir() and self._version_path(p.name) is not None
+        )
+
+    def _version_path(self, report_date: str) -> Optional[Path]:
+        """报告期当前版本的目录（读取 CURRENT；旧版布局返回报告期目录本身）"""
+        path = self.root / report_date
+        try:
+            version = (path / self.CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return path if (path / "index.json").exists() else None
+        return path / version
+
+    def latest_report_date(self) -> Optional[str]:
+        """最新报告期"""
+        dates = self.report_dates()
+        return dates[-1] if dates else None
+
+    def write_snapshot(self, report_date: str, holdings: pd.DataFrame) -> int:
+        """
+        写入一个报告期的全量持仓快照（整体替换）
+
+        Args:
+            report_date: 报告期，如 2024Q3
+            holdings: 包含 fund_code、stock_code、stock_name、weight 列的持仓表
+
+        Returns:
+            写入的持仓行数
+        """
+        df = holdings.sort_values(["fund_code", "weight"], ascending=[True, False], kind="stable")
+        fund_codes = df["fund_code"].astype(str).to_numpy()
+
+        # 基金代码已排序，按首次出现位置切分区间
+        codes, starts = np.unique(fund_codes, return_index=True)
+        stops = np.append(starts[1:], len(fund_codes))
+        index = {
+            code: [int(start), int(stop)]
+            for code, start, stop in zip(codes, starts, stops)
+        }
+
+        target = self.root / report_date
+        version = f"v{time.time_ns()}"
+        staging = target / version
+        staging.mkdir(parents=True)
+
+        for column, dtype in self.COLUMNS.items():
+            if dtype == "float64":
+                values = pd.to_numeric(df[column], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+            else:
+                values = df[column].astype(str).to_numpy().astype(dtype)
+            np.save(staging / f"{column}.npy", values, allow_pickle=False)
+        (staging / "index.json").write_text(json.dumps(index), encoding="utf-8")
+
+        # 新版本写完后原子改写 CURRENT：读者要么看到旧版本，要么看到新版本；
+        # 写入中途崩溃时 CURRENT 仍指向旧版本
+        pointer = target / f".{self.CURRENT_FILE}.{version}.tmp"
+        pointer.write_text(version, encoding="utf-8")
+        with self._lock:
+            previous = self._version_path(report_date)
+            os.replace(pointer, target / self.CURRENT_FILE)
+            self._snapshots.pop(report_date, None)
+        # 保留上一个版本，替换瞬间正在打开旧版本的读者不受影响
+        self._remove_old_versions(target, version, previous.name if previous is not None else None)
+
+        logger.info(f"持仓快照 {report_date} 已写入: {len(index)} 只基金, {len(df)} 条持仓")
+        return len(df)
+
+    @staticmethod
+    def _remove_old_versions(target: Path, current: str, previous: Optional[str]) -> None:
+        """删除早于当前版本且不再保留的版本（含崩溃遗留的半成品）与旧版布局的列文件"""
+        for path in target.iterdir():
+            if path.is_dir() and path.name.startswith("v"):
+                # 更新的版本可能是另一个写入方正在写的，不删除
+                if path.name not in (current, previous) and int(path.name[1:] or 0) < int(current[1:]):
+                    shutil.rmtree(path, ignore_errors=True)
+            elif path.is_file() and (path.suffix == ".npy" or path.name == "index.json"):
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning(f"清理旧版持仓快照文件失败: {path} {e}")
+
+    def import_from_akshare(self, fund_codes: Iterable[str], report_date: Optional[str] = None) -> int:
+        """
+        从 AkShare 批量导入全量持仓（经由行情缓存，已缓存的基金不会重复下载）
+
+        Args:
+            fund_codes: 基金代码列表
+            report_date: 报告期，默认为最近一个已结束的季度
+
+        Returns:
+            写入的持仓行数
+        """
+        report_date = report_date or self.current_report_date()
+        executor = FundDataProvider._get_executor()
+
+        def fetch(code: str) -> Optional[pd.DataFrame]:
+            try:
+                df = market_data.fetch("fund_portfolio_hold_sina", symbol=code)
+            except Exception as e:
+                logger.warning(f"导入 {code} 持仓失败: {e}")
+                return None
+            if df.empty:
+                return None
+            return pd.DataFrame({
+                "fund_code": code,
+                "stock_code": df.get("stock_code", ""),
+                "stock_name": df.get("stock_name", ""),
+                "weight": df.get("hold_ratio", 0.0),
+            })
+
+        frames = [df for df in executor.map(fetch, dict.fromkeys(fund_codes)) if df is not None]
+        if not frames:
+            return 0
+        return self.write_snapshot(report_date, pd.concat(frames, ignore_index=True))
+
+    @staticmethod
+    def current_report_date(today: Optional[datetime] = None) -> str:
+        """最近一个已结束的季度，如 2024Q3"""
+        today = today or datetime.now()
+        quarter = (today.month - 1) // 3
+        if quarter == 0:
+            return f"{today.year - 1}Q4"
+        return f"{today.year}Q{quarter}"
+
+    def _open(self, report_date: Optional[str]) -> Optional[Tuple[Dict[str, List[int]], Dict[str, np.ndarray]]]:
+        """按报告期懒加载索引和内存映射列（其他进程替换了版本时重新打开）"""
+        report_date = report_date or self.latest_report_date()
+        if report_date is None:
+            return None
+        with self._lock:
+            path = self._version_path(report_date)
+            if path is None:
+                return None
+            snapshot = self._snapshots.get(report_date)
+            if snapshot is not None and snapshot[0] == path:
+                return snapshot[1], snapshot[2]
+            index = json.loads((path / "index.json").read_text(encoding="utf-8"))
+            columns = {
+                column: np.load(path / f"{column}.npy", mmap_mode="r", allow_pickle=False)
+                for column in self.COLUMNS
+            }
+            self._snapshots[report_date] = (path, index, columns)
+            return index, columns
+
+    def get_fund(self, fund_code: str, report_date: Optional[str] = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        读取单只基金的持仓列（内存映射切片，不复制数据）
+
+        Returns:
+            {"stock_code", "stock_name", "weight"} 数组，按权重降序；不存在返回 None
+        """
+        snapshot = self._open(report_date)
+        if snapshot is None:
+            return None
+        index, columns = snapshot
+        bounds = index.get(fund_code)
+        if bounds is None:
+            return None
+        start, stop = bounds
+        return {column: values[start:stop] for column, values in columns.items()}
+
+    def get_holdings(self, fund_code: str, report_date: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """读取单只基金持仓，格式与 FundDataProvider.get_fund_holdings 一致"""
+        fund = self.get_fund(fund_code, report_date)
+        if fund is None:
+            return []
+        count = len(fund["weight"]) if limit is None else min(limit, len(fund["weight"]))
+        return [
+            {
+                "stock": str(fund["stock_name"][i]),
+                "code": str(fund["stock_code"][i]),
+                "weight": float(fund["weight"][i]),
+                "change": 0.0,
+            }
+            for i in range(count)
+        ]
+
+    def attribution(
+        self,
+        fund_codes: Iterable[str],
+        stock_changes: Dict[str, float],
+        report_date: Optional[str] = None,
+        top_n: int = 5
+    ) -> Dict[str, object]:
+        """
+        多基金持仓归因：把快照权重与个股涨跌幅对齐后交给 contribution_matrix
+
+        contribution_matrix 需要二维输入，所选基金的切片会复制到按最大持仓数补零的
+        稠密矩阵（基金数 × 最大持仓数），内存映射只省去未选中基金的读取。
+
+        Args:
+            fund_codes: 基金代码列表（快照中不存在的基金会被跳过）
+            stock_changes: 股票代码 -> 涨跌幅（%）
+            report_date: 报告期，默认最新
+            top_n: 每只基金保留的贡献度前 N 名
+
+        Returns:
+            contribution_matrix 的结果，另含 fund_codes 与 stock_codes（与矩阵列对齐）
+        """
+        funds = [(code, self.get_fund(code, report_date)) for code in fund_codes]
+        funds = [(code, fund) for code, fund in funds if fund is not None]
+        width = max((len(fund["weight"]) for _, fund in funds), default=0)
+
+        weights = np.zeros((len(funds), width), dtype=np.float64)
+        stock_codes = np.full((len(funds), width), "", dtype=self.COLUMNS["stock_code"])
+        for row, (_, fund) in enumerate(funds):
+            size = len(fund["weight"])
+            weights[row, :size] = fund["weight"]
+            stock_codes[row, :size] = fund["stock_code"]
+
+        change_lookup = pd.Series(stock_changes, dtype=np.float64)
+        changes = (
+            pd.Series(stock_codes.ravel())
+            .map(change_lookup)
+            .fillna(0.0)
+            .to_numpy(dtype=np.float64)
+            .reshape(stock_codes.shape)
+        )
+
+        result = FundDataProvider.contribution_matrix(weights, changes, top_n=top_n)
+        result["fund_codes"] = [code for code, _ in funds]
+        result["stock_codes"] = stock_codes
+        return result
+
+
+# 导出单例
+holdings_store = HoldingsStore()
@@ -0,0 +1,227 @@
+"""
+基金净值时间序列：日内点位只追加存储，按需降采样为 N 分钟 OHLC
+超出保留期的日内点位压缩为日线，图表与波动率计算无需重新获取历史行情
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, List, Iterable, Union
+
+import numpy as np
+
+from config import SERIES_CONFIG
+from database import (
+    save_nav_points, get_nav_points, get_nav_daily, compact_nav_ticks, prune_nav_daily
+)
+
+TimeLike = Union[datetime, str, float, int]
+
+
+def _to_ts(value: TimeLike) -> float:
+    """datetime / ISO 字符串 / Unix 时间戳 统一为 Unix 时间戳"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+def _local_midnight(days_ago: int = 0) -> datetime:
+    return (datetime.now() - timedelta(days=days_ago)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class NavSeriesStore:
+    """
+    净值时间序列存储
+
+    - 日内点位写入 nav_ticks（(fund_code, ts) 聚簇，经后台批量写入）
+    - 查询时用 numpy 按 N 分钟分桶计算 OHLC，不预先存储各周期 K 线
+    - 超过 intraday_retention_days 的点位按日压缩进 nav_daily，日线保留 daily_retention_days
+    """
+
+    def __init__(self, retention_check_interval: float = SERIES_CONFIG["retention_check_interval"]):
+        self.retention_check_interval = retention_check_interval
+        self._last_retention: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, quotes: Iterable[Optional[Dict]]) -> int:
+        """
+        写入行情（get_fund_realtime 的返回格式），返回写入的点数
+
+        时间取行情自带的 timestamp（获取时间），缺失时取当前时间。
+        模拟行情（is_mock，含真实模式下上游失败时的降级数据）不写入。
+        """
+        now = time.time()
+        points = [
+            (
+                quote["code"],
+                _to_ts(quote["timestamp"]) if quote.get("timestamp") else now,
+                float(quote["current_value"]),
+                quote.get("daily_change_pct")
+            )
+            for quote in quotes
+            if quote and quote.get("code") and quote.get("current_value") is not None
+            and not quote.get("is_mock")
+        ]
+        save_nav_points(points)
+        self.maybe_apply_retention()
+        return len(points)
+
+    def points(
+        self,
+        fund_code: str,
+        start: Optional[TimeLike] = None,
+        end: Optional[TimeLike] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        读取区间内的原始点位（默认今日）
+
+        Returns:
+            {"ts", "nav", "change_pct"} 三个等长数组，按时间升序
+        """
+        start_ts = _to_ts(start) if start is not None else _local_midnight().timestamp()
+        end_ts = _to_ts(end) if end is not None else math.inf
+        rows = get_nav_points(fund_code, start_ts, end_ts)
+        if not rows:
+            empty = np.empty(0, dtype=np.float64)
+            return {"ts": empty, "nav": empty, "change_pct": empty}
+        data = np.array(
+            [(ts, nav, np.nan if change is None else change) for ts, nav, change in rows],
+            dtype=np.float64
+        )
+        return {"ts": data[:, 0], "nav": data[:, 1], "change_pct": data[:, 2]}
+
+    @staticmethod
+    def downsample(ts: np.ndarray, nav: np.ndarray, seconds: float, offset: float = 0.0) -> Dict[str, np.ndarray]:
+        """
+        按固定宽度分桶计算 OHLC（输入按时间升序，没有点位的桶不输出）
+
+        Args:
+            ts: Unix 时间戳
+            nav: 净值
+            seconds: 桶宽（秒）
+            offset: 分桶前加到时间戳上的偏移（按本地日期分桶时传入 UTC 偏移）
+
+        Returns:
+            {"ts"（桶起点）, "open", "high", "low", "close", "ticks"}
+        """
+        if not len(ts):
+            empty = np.empty(0, dtype=np.float64)
+            return {"ts": empty, "open": empty, "high": empty, "low": empty, "close": empty,
+                    "ticks": np.empty(0, dtype=np.int64)}
+        bucket = np.floor((ts + offset) / seconds).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        bounds = np.r_[starts, len(ts)]
+        return {
+            "ts": bucket[starts] * seconds - offset,
+            "open": nav[starts],
+            "high": np.maximum.reduceat(nav, starts),
+            "low": np.minimum.reduceat(nav, starts),
+            "close": nav[bounds[1:] - 1],
+            "ticks": np.diff(bounds),
+        }
+
+    def ohlc(
+        self,
+        fund_code: str,
+        minutes: int = SERIES_CONFIG["default_bar_minutes"],
+        start: Optional[TimeLike] = None,
+        end: Optional[TimeLike] = None
+    ) -> List[Dict]:
+        """
+        N 分钟 K 线（默认今日）；N 能整除 60 时桶与整点对齐
+
+        Returns:
+            [{"time", "ts", "open", "high", "low", "close", "ticks"}]，time 为本地时间 ISO 字符串
+        """
+        series = self.points(fund_code, start, end)
+        bars = self.downsample(series["ts"], series["nav"], minutes * 60, time.localtime().tm_gmtoff)
+        return self._rows(bars)
+
+    def daily(self, fund_code: str, days: int = 30) -> List[Dict]:
+        """
+        日线：已压缩的 nav_daily 与尚在日内保留期的点位（即时聚合）合并
+
+        Returns:
+            [{"date", "open", "high", "low", "close", "change_pct", "ticks"}]
+        """
+        start = _local_midnight(days)
+        series = self.points(fund_code, start)
+        bars = self.downsample(series["ts"], series["nav"], 86400, time.localtime().tm_gmtoff)
+        # 每日最后一个点的涨跌幅即当日涨跌幅
+        last_index = np.cumsum(bars["ticks"]) - 1
+        recent = {
+            row["time"][:10]: dict(
+                {k: row[k] for k in ("open", "high", "low", "close", "ticks")},
+                date=row["time"][:10],
+                change_pct=None if math.isnan(change) else change
+            )
+            for row, change in zip(self._rows(bars), series["change_pct"][last_index].tolist())
+        }
+        compacted = get_nav_daily(fund_code, start.strftime("%Y-%m-%d"), datetime.now().strftime("%Y-%m-%d"))
+        merged = {row["date"]: row for row in compacted}
+        for date, row in recent.items():
+            if date in merged:
+                # 同一天部分已压缩：合并为一根日线
+                old = merged[date]
+                row = dict(
+                    row, open=old["open"], high=max(old["high"], row["high"]),
+                    low=min(old["low"], row["low"]), ticks=old["ticks"] + row["ticks"]
+                )
+            merged[date] = row
+        return [merged[date] for date in sorted(merged)]
+
+    def volatility(
+        self,
+        fund_code: str,
+        minutes: int = SERIES_CONFIG["default_bar_minutes"],
+        start: Optional[TimeLike] = None,
+        end: Optional[TimeLike] = None
+    ) -> Optional[float]:
+        """区间内 N 分钟收盘价对数收益率的标准差（%），K 线少于 3 根时返回 None"""
+        series = self.points(fund_code, start, end)
+        closes = self.downsample(series["ts"], series["nav"], minutes * 60, time.localtime().tm_gmtoff)["close"]
+        if len(closes) < 3 or np.any(closes <= 0):
+            return None
+        return float(np.std(np.diff(np.log(closes)), ddof=1) * 100)
+
+    def apply_retention(self) -> None:
+        """日内点位超过保留期的压缩为日线，日线超过保留期的删除"""
+        with self._lock:
+            self._last_retention = time.monotonic()
+        compact_nav_ticks(_local_midnight(SERIES_CONFIG["intraday_retention_days"]).timestamp())
+        prune_nav_daily(_local_midnight(SERIES_CONFIG["daily_retention_days"]).strftime("%Y-%m-%d"))
+
+    def maybe_apply_retention(self) -> bool:
+        """距上次执行超过 retention_check_interval 时执行保留策略"""
+        with self._lock:
+            if (
+                self._last_retention is not None
+                and time.monotonic() - self._last_retention < self.retention_check_interval
+            ):
+                return False
+        self.apply_retention()
+        return True
+
+    @staticmethod
+    def _rows(bars: Dict[str, np.ndarray]) -> List[Dict]:
+        return [
+            {
+                "time": datetime.fromtimestamp(ts).isoformat(),
+                "ts": ts,
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "ticks": n,
+            }
+            for ts, o, h, l, c, n in zip(
+                bars["ts"].tolist(), bars["open"].tolist(), bars["high"].tolist(),
+                bars["low"].tolist(), bars["close"].tolist(), bars["ticks"].tolist()
+            )
+        ]
+
+
+# 导出单例
+nav_series = NavSeriesStore()
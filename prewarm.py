@@ -0,0 +1,227 @@
+"""
+后台预热模块：在收藏基金的研判缓存过期前提前刷新
+高波动基金优先，并受每日 Token 预算约束
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, List, Set, Tuple
+import logging
+
+from config import DATA_CONFIG
+from database import get_favorites, get_cached_analysis_entry, get_today_usage
+from data_provider import FundDataProvider
+from deepseek_analyzer import DeepSeekAnalyzer
+from cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+
+class PrewarmScheduler:
+    """研判预热调度器"""
+
+    ANALYSIS_TYPE = "movement_analysis"
+
+    # 调度配置
+    CHECK_INTERVAL_SECONDS = 60         # 检查周期
+    REFRESH_MARGIN_RATIO = 0.2          # 剩余有效期低于 TTL 的 20% 时刷新
+    DAILY_TOKEN_BUDGET = 200_000        # 每日预热 Token 预算
+    DEFAULT_TOKENS_PER_CALL = 4000      # 尚无历史数据时的单次调用预估
+
+    def __init__(
+        self,
+        analyzer: DeepSeekAnalyzer,
+        daily_token_budget: int = DAILY_TOKEN_BUDGET,
+        use_mock: bool = False
+    ):
+        self.analyzer = analyzer
+        self.provider = FundDataProvider()
+        self.daily_token_budget = daily_token_budget
+        self.use_mock = use_mock
+        self._owners: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "refreshed": 0,
+            "skipped_budget": 0,
+            "errors": 0,
+            "last_run": None,
+        }
+
+    def start(self, owner: str = "") -> None:
+        """登记启用方（如 Streamlit 会话），首个启用方启动后台线程"""
+        with self._lock:
+            self._owners.add(owner)
+            self._stop.clear()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="prewarm", daemon=True)
+                self._thread.start()
+
+    def stop(self, owner: str = "") -> None:
+        """注销启用方，所有启用方都停用后才停止后台线程"""
+        with self._lock:
+            self._owners.discard(owner)
+            if not self._owners:
+                self._stop.set()
+
+    def enabled_by(self, owner: str = "") -> bool:
+        with self._lock:
+            return owner in self._owners
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return self._thread is not None and not self._stop.is_set()
+
+    def _loop(self) -> None:
+        while True:
+            # 退出判断与 start() 互斥，避免线程退出时漏掉新的启用方
+            with self._lock:
+                if self._stop.is_set():
+                    self._thread = None
+                    return
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"预热失败: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+            self._stop.wait(self.CHECK_INTERVAL_SECONDS)
+
+    def run_once(self) -> List[Dict]:
+        """
+        执行一轮预热
+
+        Returns:
+            本轮刷新的基金列表 [{"fund_code", "priority", "tokens_used"}]
+        """
+        due = self._collect_due()
+
+        # 高波动优先，其次按剩余有效期从短到长
+        due.sort(key=lambda item: (not item["high_volatility"], item["remaining_seconds"]))
+
+        refreshed = []
+        for item in due:
+            if self._stop.is_set():
+                break
+            if item["uses_api"] and not self._within_budget():
+                with self._lock:
+                    self._stats["skipped_budget"] += 1
+                logger.info(f"预热跳过 {item['fund_code']}：今日 Token 预算已用尽")
+                continue
+
+            try:
+                analysis = self.analyzer.analyze_fund_movement(
+                    fund_code=item["fund_code"],
+                    fund_name=item["fund_name"],
+                    daily_change_pct=item["daily_change_pct"],
+                    holdings_contribution=item["contributions"],
+                    news_items=item["news"],
+                    use_cache=False,
+                    use_mock=self.use_mock,
+                    operation_type=DeepSeekAnalyzer.OPERATION_PREWARM
+                )
+            except Exception as e:
+                logger.error(f"预热 {item['fund_code']} 失败: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                continue
+
+            tokens = analysis.get("tokens_used", 0)
+            with self._lock:
+                self._stats["refreshed"] += 1
+            refreshed.append({
+                "fund_code": item["fund_code"],
+                "priority": "high" if item["high_volatility"] else "normal",
+                "tokens_used": tokens
+            })
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_run"] = datetime.now().isoformat()
+        return refreshed
+
+    def _collect_due(self) -> List[Dict]:
+        """找出缓存缺失或即将过期的收藏基金"""
+        favorites = get_favorites()
+        if not favorites:
+            return []
+
+        ttl_seconds = CacheManager.CACHE_STRATEGIES.get(self.ANALYSIS_TYPE, {}).get("ttl_hours", 1) * 3600
+        margin = ttl_seconds * self.REFRESH_MARGIN_RATIO
+        threshold = DATA_CONFIG["volatility_threshold"]
+
+        quotes = self.provider.get_funds_realtime(
+            [fav["code"] for fav in favorites], use_mock=self.use_mock
+        )
+
+        due = []
+        for fav in favorites:
+            fund_data = quotes.get(fav["code"])
+            if not fund_data:
+                continue
+            daily_change_pct = fund_data.get("daily_change_pct", 0)
+            holdings = self.provider.get_fund_holdings(fav["code"], use_mock=self.use_mock)
+            contributions = self.provider.calculate_holding_contribution(fund_data, holdings)
+            news = self.provider.get_industry_news(fav["name"], hours=DATA_CONFIG["news_lookback_hours"])
+
+            # 以当前输入指纹判断缓存是否仍然有效
+            input_hash = CacheManager.fingerprint_inputs(fav["code"], daily_change_pct, contributions, news)
+            entry = get_cached_analysis_entry(
+                fav["code"], self.ANALYSIS_TYPE, ttl_seconds / 3600, input_hash
+            )
+            if entry is None:
+                remaining = 0.0
+            else:
+                age = time.time() - datetime.fromisoformat(entry[1]).timestamp()
+                remaining = ttl_seconds - age
+            if remaining > margin:
+                continue
+
+            due.append({
+                "fund_code": fav["code"],
+                "fund_name": fav["name"],
+                "daily_change_pct": daily_change_pct,
+                "contributions": contributions,
+                "news": news,
+                "remaining_seconds": remaining,
+                "high_volatility": abs(daily_change_pct) >= threshold,
+                "uses_api": abs(daily_change_pct) >= threshold and not self.use_mock and self.analyzer.remote_available
+            })
+        return due
+
+    def _within_budget(self) -> bool:
+        """今日预热消耗取自 cost_daily（进程重启后不清零），再预留一次调用的预估用量"""
+        calls, tokens_spent = get_today_usage(DeepSeekAnalyzer.OPERATION_PREWARM)
+        estimate = tokens_spent / calls if calls else self.DEFAULT_TOKENS_PER_CALL
+        return tokens_spent + estimate <= self.daily_token_budget
+
+    def stats(self) -> Dict:
+        """调度统计"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_spent_today"] = get_today_usage(DeepSeekAnalyzer.OPERATION_PREWARM)[1]
+        stats["daily_token_budget"] = self.daily_token_budget
+        stats["running"] = self.running
+        return stats
+
+
+_schedulers: Dict[Tuple[str, bool], PrewarmScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(api_key: Optional[str] = None, use_mock: bool = False) -> PrewarmScheduler:
+    """
+    获取进程级预热调度器：每个 (API Key, 数据源) 一个后台线程，多个 Streamlit 会话共用
+    
+    调度器持有自己的分析器，不会被后渲染的会话改绑到其他 Key 或数据源。
+    """
+    key = (api_key or "", use_mock)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = PrewarmScheduler(DeepSeekAnalyzer(api_key or None), use_mock=use_mock)
+            _schedulers[key] = scheduler
+        return scheduler
@@ -0,0 +1,249 @@
+"""
+Prompt 编译器：在 Token 预算内按相关性装配持仓与新闻
+本地估算 Token 数（离线），发送前即可得知 Prompt 规模
+"""
+import math
+import os
+import re
+from typing import Dict, Optional, List, Set
+import logging
+
+from config import PROMPT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class PromptBudgetExceeded(ValueError):
+    """Prompt 固定部分已超出 Token 预算"""
+
+
+class TokenCounter:
+    """
+    离线 Token 计数
+
+    配置了 DeepSeek tokenizer.json（PROMPT_CONFIG["tokenizer_path"]）且安装了
+    tokenizers 时精确计数；否则按 DeepSeek 官方换算比例估算
+    （1 个中文字符 ≈ 0.6 Token，1 个英文字符 ≈ 0.3 Token）。
+    """
+
+    CJK_RATIO = 0.6
+    OTHER_RATIO = 0.3
+
+    _CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+    def __init__(self, tokenizer_path: Optional[str] = None):
+        self._tokenizer = None
+        path = tokenizer_path if tokenizer_path is not None else PROMPT_CONFIG["tokenizer_path"]
+        if path and os.path.exists(path):
+            try:
+                from tokenizers import Tokenizer
+                self._tokenizer = Tokenizer.from_file(path)
+            except Exception as e:
+                logger.warning(f"加载 tokenizer 失败，改用估算: {e}")
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        """文本的 Token 数"""
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        cjk = len(self._CJK.findall(text))
+        return math.ceil(cjk * self.CJK_RATIO + (len(text) - cjk) * self.OTHER_RATIO)
+
+
+def _shingles(text: str) -> Set[str]:
+    """去掉空白与标点后的字符二元组，用于近似重复判断"""
+    normalized = re.sub(r"[\W_]+", "", text.lower())
+    if len(normalized) < 2:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + 2] for i in range(len(normalized) - 1)}
+
+
+def dedup_news(news_items: List[Dict], similarity: Optional[float] = None) -> List[Dict]:
+    """
+    去除近似重复的新闻（标题字符二元组 Jaccard 相似度达到阈值视为重复，保留先出现的一条）
+    """
+    similarity = PROMPT_CONFIG["news_dedup_similarity"] if similarity is None else similarity
+    kept: List[Dict] = []
+    kept_shingles: List[Set[str]] = []
+    for news in news_items:
+        shingles = _shingles(news.get("title", ""))
+        duplicate = any(
+            shingles and other and len(shingles & other) / len(shingles | other) >= similarity
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(news)
+            kept_shingles.append(shingles)
+    return kept
+
+
+class PromptCompiler:
+    """基金波动分析 Prompt 编译器"""
+
+    # 固定的系统前缀：所有基金逐字节相同，放在最前面以命中服务端上下文（前缀）缓存，
+    # 不要在这里插入任何随基金或时间变化的内容
+    SYSTEM_PROMPT = """你是一位资深的基金研究分析师。用户会提供一只基金的基本信息、重仓股贡献度和相关新闻，请对其进行深度分析，展示你的思考过程。
+
+## 分析要求
+1. 深度分析这个波动是"情绪噪音"还是"基本面反转"
+2. 检查是否存在"隐形持仓变动"（估值与持仓走势背离）
+3. 给出明确的投资建议
+
+## 输出格式
+请按以下格式输出：
+
+### 思考过程
+[详细的分析思路]
+
+### 波动性质判断
+[情绪噪音/基本面反转/混合信号]
+
+### 持仓变动评估
+[是否存在隐形变动，有什么证据]
+
+### 风险提示
+[主要风险点]
+
+### 投资建议
+[具体建议]
+"""
+
+    # 随基金变化的数据，作为用户消息追加在固定前缀之后
+    PAYLOAD_TEMPLATE = """## 基金信息
+- 基金代码: {fund_code}
+- 基金名称: {fund_name}
+- 日涨跌幅: {daily_change_pct:+.2f}%
+
+## 重仓股贡献度
+{holdings_text}
+
+## 相关新闻（过去12小时）
+{news_text}
+"""
+
+    def __init__(self, max_tokens: Optional[int] = None, counter: Optional[TokenCounter] = None):
+        self.max_tokens = max_tokens or PROMPT_CONFIG["max_input_tokens"]
+        self.counter = counter or TokenCounter()
+
+    @staticmethod
+    def holding_line(h: Dict) -> str:
+        return (
+            f"- {h['stock']} ({h['code']}): 权重 {h['weight']:.1f}%, "
+            f"涨跌 {h['change']:+.2f}%, 贡献 {h['contribution']:+.3f}%"
+        )
+
+    @staticmethod
+    def news_line(n: Dict, summary_chars: int) -> str:
+        summary = n.get("summary", "")[:summary_chars]
+        if summary:
+            return f"- [{n.get('source', '')}] {n.get('title', '')}: {summary}"
+        return f"- [{n.get('source', '')}] {n.get('title', '')}"
+
+    @staticmethod
+    def rank_news(news_items: List[Dict], holdings: List[Dict]) -> List[Dict]:
+        """按提及重仓股的贡献度加权排序，同分保持原有（时间）顺序"""
+        def score(news: Dict) -> float:
+            text = f"{news.get('title', '')}{news.get('summary', '')}"
+            return sum(
+                abs(h.get("contribution", 0))
+                for h in holdings
+                if h.get("stock") and h["stock"] in text
+            )
+        return sorted(news_items, key=score, reverse=True)
+
+    def compile(
+        self,
+        fund_code: str,
+        fund_name: str,
+        daily_change_pct: float,
+        holdings_contribution: List[Dict],
+        news_items: List[Dict]
+    ) -> Dict:
+        """
+        在 Token 预算内装配 Prompt：持仓按贡献度绝对值、新闻按相关性依次放入，放不下即停止
+
+        预算包含固定的系统前缀；messages 为 [系统前缀, 基金数据] 两条消息。
+
+        Returns:
+            {"messages", "prompt", "prompt_tokens", "max_tokens", "holdings_used", "holdings_total",
+             "news_used", "news_total", "duplicates_removed"}，prompt 为基金数据部分
+
+        Raises:
+            PromptBudgetExceeded: 不含持仓与新闻的固定部分已超出预算
+        """
+        def render(holding_lines: List[str], news_lines: List[str]) -> str:
+            return self.PAYLOAD_TEMPLATE.format(
+                fund_code=fund_code,
+                fund_name=fund_name,
+                daily_change_pct=daily_change_pct,
+                holdings_text="\n".join(holding_lines),
+                news_text="\n".join(news_lines)
+            )
+
+        system_tokens = self.counter.count(self.SYSTEM_PROMPT)
+        used = system_tokens + self.counter.count(render([], []))
+        if used > self.max_tokens:
+            raise PromptBudgetExceeded(
+                f"Prompt 固定部分 {used} Token 超出预算 {self.max_tokens}"
+            )
+
+        holdings = sorted(
+            holdings_contribution, key=lambda h: abs(h.get("contribution", 0)), reverse=True
+        )[:PROMPT_CONFIG["max_holdings"]]
+        unique_news = dedup_news(news_items)
+        ranked_news = self.rank_news(unique_news, holdings)[:PROMPT_CONFIG["max_news"]]
+
+        # 每行另计一个换行符
+        holding_lines: List[str] = []
+        for h in holdings:
+            line = self.holding_line(h)
+            cost = self.counter.count(line) + 1
+            if used + cost > self.max_tokens:
+                break
+            holding_lines.append(line)
+            used += cost
+
+        news_lines: List[str] = []
+        for n in ranked_news:
+            line = self.news_line(n, PROMPT_CONFIG["news_summary_chars"])
+            cost = self.counter.count(line) + 1
+            if used + cost > self.max_tokens:
+                # 摘要放不下时退而只放标题
+                line = self.news_line(n, 0)
+                cost = self.counter.count(line) + 1
+                if used + cost > self.max_tokens:
+                    break
+            news_lines.append(line)
+            used += cost
+
+        # 分行计数与整体计数可能略有出入，超出时从尾部回退
+        prompt = render(holding_lines, news_lines)
+        prompt_tokens = system_tokens + self.counter.count(prompt)
+        while prompt_tokens > self.max_tokens and (news_lines or holding_lines):
+            (news_lines or holding_lines).pop()
+            prompt = render(holding_lines, news_lines)
+            prompt_tokens = system_tokens + self.counter.count(prompt)
+
+        return {
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            "prompt": prompt,
+            "prompt_tokens": prompt_tokens,
+            "max_tokens": self.max_tokens,
+            "holdings_used": len(holding_lines),
+            "holdings_total": len(holdings_contribution),
+            "news_used": len(news_lines),
+            "news_total": len(news_items),
+            "duplicates_removed": len(news_items) - len(unique_news),
+        }
+
+
+# 导出单例
+prompt_compiler = PromptCompiler()
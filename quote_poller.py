@@ -0,0 +1,307 @@
+"""
+行情推送模块：后台轮询收藏基金行情，与上一次快照比对后只向订阅者推送有变化的基金
+同一数据源的所有会话共享同一次轮询结果，上游请求数不再随会话数增长
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Iterable, Set, FrozenSet, Callable
+import logging
+
+from config import QUOTE_CONFIG
+from data_provider import FundDataProvider
+from nav_series import nav_series
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    单个会话的行情订阅
+
+    待推送的更新按基金代码合并（同一基金只保留最新行情），消费慢的会话不会积压。
+    同步消费方用 wait() 阻塞等待；异步消费方传入 on_update 回调（在发布线程中调用，
+    不能阻塞），由回调唤醒事件循环后再 drain()。
+    """
+
+    def __init__(
+        self,
+        hub: "QuoteHub",
+        subscription_id: int,
+        fund_codes: Iterable[str],
+        on_update: Optional[Callable[[], None]] = None
+    ):
+        self.id = subscription_id
+        self.fund_codes: FrozenSet[str] = frozenset(fund_codes)
+        self.last_seen = time.monotonic()
+        self._hub = hub
+        self._on_update = on_update
+        self._pending: Dict[str, Dict] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def offer(self, changes: Dict[str, Dict]) -> bool:
+        """投递更新（只保留订阅的基金），返回是否有投递"""
+        relevant = {code: quote for code, quote in changes.items() if code in self.fund_codes}
+        if not relevant:
+            return False
+        with self._cond:
+            self._pending.update(relevant)
+            self._cond.notify_all()
+        self._notify()
+        return True
+
+    def drain(self) -> Dict[str, Dict]:
+        """取走所有待推送的更新（无更新时返回空字典）"""
+        with self._cond:
+            pending, self._pending = self._pending, {}
+            self.last_seen = time.monotonic()
+        return pending
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Dict]:
+        """阻塞等待更新，超时或订阅关闭时返回已有的更新（可能为空）"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._closed, timeout)
+        return self.drain()
+
+    def close(self) -> None:
+        self._hub.unsubscribe(self)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._notify()
+
+    def _notify(self) -> None:
+        if self._on_update is None:
+            return
+        try:
+            self._on_update()
+        except Exception as e:
+            logger.warning(f"行情订阅回调失败: {e}")
+
+
+class QuoteHub:
+    """进程内行情发布/订阅中心"""
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "published": 0,
+            "deliveries": 0,
+            "pruned": 0,
+        }
+
+    def subscribe(
+        self,
+        fund_codes: Iterable[str],
+        on_update: Optional[Callable[[], None]] = None
+    ) -> Subscription:
+        with self._lock:
+            self._next_id += 1
+            subscription = Subscription(self, self._next_id, fund_codes, on_update)
+            self._subscriptions[subscription.id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.pop(subscription.id, None)
+
+    def subscribed_codes(self) -> Set[str]:
+        """所有订阅者关注的基金代码（轮询范围）"""
+        with self._lock:
+            return set().union(*(s.fund_codes for s in self._subscriptions.values()))
+
+    def publish(self, changes: Dict[str, Dict]) -> int:
+        """向订阅了对应基金的会话推送更新，返回投递的订阅数"""
+        if not changes:
+            return 0
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+        delivered = sum(1 for s in subscriptions if s.offer(changes))
+        with self._lock:
+            self._stats["published"] += len(changes)
+            self._stats["deliveries"] += delivered
+        return delivered
+
+    def prune(self, idle_seconds: float) -> int:
+        """
+        关闭长时间未取更新的订阅
+
+        Streamlit 没有会话结束回调，已关闭页面的订阅只能按空闲时间回收。
+        """
+        cutoff = time.monotonic() - idle_seconds
+        with self._lock:
+            stale = [s for s in self._subscriptions.values() if s.last_seen < cutoff]
+        for subscription in stale:
+            subscription.close()
+        if stale:
+            with self._lock:
+                self._stats["pruned"] += len(stale)
+        return len(stale)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["subscriptions"] = len(self._subscriptions)
+        return stats
+
+
+class QuotePoller:
+    """行情轮询器：一次批量获取所有订阅基金的行情，比对快照后发布变化并记入净值时间序列（仅真实行情）"""
+
+    # 参与比对的字段（timestamp 每次都会变化，不参与比对）
+    QUOTE_FIELDS = ("current_value", "daily_change_pct", "daily_change_amount")
+
+    def __init__(
+        self,
+        hub: "QuoteHub",
+        interval: float = QUOTE_CONFIG["poll_interval"],
+        use_mock: bool = False
+    ):
+        self.hub = hub
+        self.provider = FundDataProvider()
+        self.interval = interval
+        self.use_mock = use_mock
+        self._snapshot: Dict[str, Dict] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # 串行化上游请求：后台轮询与会话首次取数不会重复获取同一批基金
+        self._poll_lock = threading.RLock()
+        self._stats = {
+            "polls": 0,
+            "funds_fetched": 0,
+            "changes": 0,
+            "failures": 0,
+            "last_poll": None,
+        }
+
+    def start(self) -> None:
+        """启动后台线程"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="quote-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台线程"""
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.hub.prune(QUOTE_CONFIG["subscription_idle_timeout"])
+                codes = self.hub.subscribed_codes()
+                # 没有订阅者时不请求上游
+                if codes:
+                    self.run_once(codes)
+            except Exception as e:
+                logger.error(f"行情轮询失败: {e}")
+                with self._lock:
+                    self._stats["failures"] += 1
+            self._stop.wait(self.interval)
+
+    @classmethod
+    def diff(cls, previous: Dict[str, Dict], quotes: Dict[str, Optional[Dict]]) -> Dict[str, Dict]:
+        """与上一次快照比对，返回有变化（含首次出现）的基金；获取失败的基金不视为变化"""
+        return {
+            code: quote
+            for code, quote in quotes.items()
+            if quote and (
+                code not in previous
+                or any(quote.get(field) != previous[code].get(field) for field in cls.QUOTE_FIELDS)
+            )
+        }
+
+    def run_once(self, fund_codes: Iterable[str]) -> Dict[str, Dict]:
+        """
+        获取一批基金的行情并发布变化
+
+        Returns:
+            本次有变化的基金 {基金代码: 行情}
+        """
+        codes = list(dict.fromkeys(fund_codes))
+        with self._poll_lock:
+            quotes = self.provider.get_funds_realtime(codes, use_mock=self.use_mock)
+            with self._lock:
+                changed = self.diff(self._snapshot, quotes)
+                self._snapshot.update(changed)
+                self._stats["polls"] += 1
+                self._stats["funds_fetched"] += len(codes)
+                self._stats["changes"] += len(changed)
+                self._stats["failures"] += sum(1 for quote in quotes.values() if not quote)
+                self._stats["last_poll"] = datetime.now().isoformat()
+        self.hub.publish(changed)
+        # 只追加有变化的点位，未变化的时段由上一点延续；模拟行情（含降级数据）由 record() 过滤
+        if not self.use_mock:
+            nav_series.record(changed.values())
+        return changed
+
+    def ensure(self, fund_codes: Iterable[str]) -> Dict[str, Dict]:
+        """
+        返回这些基金的最新行情，快照中缺少的基金立即获取一次（结果同样发布给其他会话）
+
+        新会话打开页面时调用，之后的变化通过订阅推送。
+        """
+        codes = list(dict.fromkeys(fund_codes))
+        missing = [code for code in codes if code not in self.latest(codes)]
+        if missing:
+            with self._poll_lock:
+                # 等锁期间可能已被其他会话或后台轮询取到
+                missing = [code for code in missing if code not in self.latest(missing)]
+                if missing:
+                    self.run_once(missing)
+        return self.latest(codes)
+
+    def latest(self, fund_codes: Iterable[str]) -> Dict[str, Dict]:
+        """快照中这些基金的最新行情（不请求上游）"""
+        with self._lock:
+            return {code: self._snapshot[code] for code in fund_codes if code in self._snapshot}
+
+    def stats(self) -> Dict:
+        """轮询统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["snapshot_size"] = len(self._snapshot)
+        stats["running"] = self.running
+        stats["interval"] = self.interval
+        stats["hub"] = self.hub.stats()
+        return stats
+
+
+_pollers: Dict[bool, QuotePoller] = {}
+_pollers_lock = threading.Lock()
+
+
+def get_poller(use_mock: bool = False) -> QuotePoller:
+    """
+    获取进程级行情轮询器：每个数据源一个轮询器，各自持有后台线程、快照与订阅中心
+
+    真实与模拟行情互不混入，会话切换数据源时改订另一个轮询器的订阅中心。
+    """
+    with _pollers_lock:
+        poller = _pollers.get(use_mock)
+        if poller is None:
+            poller = QuotePoller(QuoteHub(), use_mock=use_mock)
+            _pollers[use_mock] = poller
+        return poller
+
+
+def stop_pollers() -> None:
+    """停止所有数据源的轮询线程"""
+    with _pollers_lock:
+        pollers = list(_pollers.values())
+    for poller in pollers:
+        poller.stop()